@@ -17,7 +17,10 @@ from foolbox.batch_attacks import CarliniWagnerL2Attack, EADAttack, GradientSign
 from prior_networks.util_pytorch import DATASET_DICT, select_gpu
 from prior_networks.models.model_factory import ModelFactory
 from prior_networks.datasets.image import construct_transforms
+from prior_networks.datasets.image.eval_cache import load_eval_dataset
 from prior_networks.adversarial import AdaptiveCarliniWagnerL2Attack, AdaptiveEADAttack
+from prior_networks.assessment.ood_detection import eval_ood_detect, predictions_flipped
+from prior_networks.priornet.dpn import dirichlet_prior_network_uncertainty
 
 parser = argparse.ArgumentParser(description='Train a Dirichlet Prior Network model using a '
                                              'standard Torchvision architecture on a Torchvision '
@@ -42,6 +45,13 @@ parser.add_argument('--overwrite', action='store_true',
                     help='Whether to overwrite a previous run of this script')
 parser.add_argument('--adaptive', action='store_true',
                     help='Whether to use adaptive version of adversarial attack')
+parser.add_argument('--cache_dir', type=str, default=None,
+                    help='Directory of cached eval inputs, built on first use. Inputs are '
+                         'decoded and transformed on every run if not set.')
+parser.add_argument('--natural_path', type=str, default=None,
+                    help='Output directory of eval_ID.py for the same model and data. If set, '
+                         'evaluates detection of the successful attacks using the saved '
+                         'uncertainties of the natural data.')
 
 
 def main():
@@ -85,12 +95,10 @@ def main():
                                              download=True,
                                              split='train')
     else:
-        dataset = DATASET_DICT[args.dataset](root=args.data_path,
-                                             transform=construct_transforms(n_in=ckpt['n_in'],
-                                                                            mode='eval'),
-                                             target_transform=None,
-                                             download=True,
-                                             split='test')
+        # Inputs stay in [0, 1], the model wrapper normalises them
+        dataset = load_eval_dataset(args.dataset, data_path=args.data_path, n_in=ckpt['n_in'],
+                                    mean=(0.0, 0.0, 0.0), std=(1.0, 1.0, 1.0), split='test',
+                                    cache_dir=args.cache_dir)
 
     loader = DataLoader(dataset, batch_size=args.batch_size, num_workers=1)
 
@@ -122,10 +130,10 @@ def main():
     distances = np.stack([adversarial.distance for adversarial in adversarials], axis=0)
     logits = np.stack([adversarial.output for adversarial in adversarials], axis=0)
 
-    np.savetxt(os.path.join(args.output_path, 'labels.txt'), labels, dtype=np.int32)
-    np.savetxt(os.path.join(args.output_path, 'adv_labels.txt'), adv_labels, dtype=np.int32)
-    np.savetxt(os.path.join(args.output_path, 'logits.txt'), logits, dtype=np.float32)
-    np.savetxt(os.path.join(args.output_path, 'distances.txt'), distances, dtype=np.float32)
+    np.savetxt(os.path.join(args.output_path, 'labels.txt'), labels, fmt='%d')
+    np.savetxt(os.path.join(args.output_path, 'adv_labels.txt'), adv_labels, fmt='%d')
+    np.savetxt(os.path.join(args.output_path, 'logits.txt'), logits)
+    np.savetxt(os.path.join(args.output_path, 'distances.txt'), distances)
 
     accuracy = np.mean(np.asarray(labels == adv_labels, dtype=np.float32))
     sr = np.mean(np.asarray(labels != adv_labels, dtype=np.float32))
@@ -133,6 +141,23 @@ def main():
         f.write(f'Classification Error: {np.round(100 * (1.0 - accuracy), 1)} \n')
         f.write(f'Success Rate: {np.round(100 * sr, 1)} \n')
 
+    uncertainties = dirichlet_prior_network_uncertainty(logits)
+    for key in uncertainties.keys():
+        np.savetxt(os.path.join(args.output_path, key + '.txt'), uncertainties[key])
+
+    if args.natural_path is not None:
+        # Only attacks which flipped the predicted class need to be detected
+        natural_probs = np.loadtxt(os.path.join(args.natural_path, 'probs.txt'))
+        natural_uncertainties = {key: np.loadtxt(os.path.join(args.natural_path, key + '.txt'))
+                                 for key in uncertainties.keys()}
+        domain_labels = np.r_[np.zeros(labels.shape[0]), np.ones(labels.shape[0])]
+        eval_ood_detect(domain_labels=domain_labels,
+                        in_uncertainties=natural_uncertainties,
+                        out_uncertainties=uncertainties,
+                        save_path=args.output_path,
+                        classes_flipped=predictions_flipped(natural_probs, logits),
+                        adversarial=True)
+
     print("Saving images to folder...")
     adversarial_images = np.stack([adversarial.perturbed for adversarial in adversarials], axis=0)
     for i, image in enumerate(
@@ -21,6 +21,7 @@ from prior_networks.evaluation import eval_logits_on_dataset
 from prior_networks.datasets.image import construct_transforms
 from prior_networks.assessment.calibration import classification_calibration
 from prior_networks.assessment.rejection import eval_rejection_ratio_class
+from prior_networks.assessment.ood_detection import eval_ood_detect, predictions_flipped
 from prior_networks.priornet.dpn import dirichlet_prior_network_uncertainty
 from prior_networks.util_pytorch import DATASET_DICT, select_gpu
 from prior_networks.models.model_factory import ModelFactory
@@ -48,6 +49,10 @@ parser.add_argument('--train', action='store_true',
                     help='Whether to evaluate on the training data instead of test data')
 parser.add_argument('--overwrite', action='store_true',
                     help='Whether to overwrite a previous run of this script')
+parser.add_argument('--natural_path', type=str, default=None,
+                    help='Output directory of eval_ID.py for the same model and data. If set, '
+                         'evaluates detection of the successful attacks using the saved '
+                         'uncertainties and predictions on the natural data.')
 
 from typing import Optional, Tuple
 
@@ -88,7 +93,7 @@ def construct_adversarial_dataset(model: nn.Module, epsilon, dataset: Dataset, b
 
             logits_list.append(logits)
             labels_list.append(labels)
-            adv_list.append(adv_list)
+            adv_list.append(adv_inputs)
 
     logits = torch.cat(logits_list, dim=0)
     labels = torch.cat(labels_list, dim=0)
@@ -139,7 +144,7 @@ def main():
     else:
         dataset = DATASET_DICT[args.dataset](root=args.data_path,
                                              transform=construct_transforms(n_in=ckpt['n_in'],
-                                                                            mean=,
+                                                                            mean=DATASET_DICT[args.dataset].mean,
                                                                             std=DATASET_DICT[args.dataset].std,
                                                                             mode='eval'),
                                              target_transform=None,
@@ -177,8 +182,18 @@ def main():
     for key in uncertainties.keys():
         np.savetxt(os.path.join(args.output_path, key + '.txt'), uncertainties[key])
 
-    if args.ood:
-        sys.exit()
+    if args.natural_path is not None:
+        # Only attacks which flipped the predicted class need to be detected
+        natural_probs = np.loadtxt(os.path.join(args.natural_path, 'probs.txt'))
+        natural_uncertainties = {key: np.loadtxt(os.path.join(args.natural_path, key + '.txt'))
+                                 for key in uncertainties.keys()}
+        domain_labels = np.r_[np.zeros(labels.shape[0]), np.ones(labels.shape[0])]
+        eval_ood_detect(domain_labels=domain_labels,
+                        in_uncertainties=natural_uncertainties,
+                        out_uncertainties=uncertainties,
+                        save_path=args.output_path,
+                        classes_flipped=predictions_flipped(natural_probs, probs),
+                        adversarial=True)
 
     nll = -np.mean(np.log(probs[np.arange(probs.shape[0]), np.squeeze(labels)] + 1e-10))
 
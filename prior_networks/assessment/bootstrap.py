@@ -0,0 +1,146 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from prior_networks.assessment.ood_detection import sorted_detection_metrics
+from prior_networks.assessment.rejection import sorted_rejection_ratios
+
+""" Bootstrap confidence intervals of assessment metrics. Every replicate resamples examples
+with replacement. Instead of sorting each replicate, the number of times each example is drawn
+is expanded along a single sort of the original data, which gives the replicate already sorted.
+Replicates are evaluated in batches, in parallel threads, with batches sized so that all threads
+together stay within a memory budget. """
+
+# Peak memory of a replicate per example: draws, counts, sorted indices and the gathered
+# labels, scores and cumulative sums of the statistic
+BYTES_PER_DRAW = 88
+
+
+def bootstrap_sorted(order, statistic, n_bootstrap=1000, batch_size=None, n_workers=None, seed=0,
+                     memory_budget=2 ** 30):
+    """
+    :param order: array of example indices with shape [n_examples], sorted as statistic expects
+    :param statistic: function taking an array of sorted example indices of replicates with
+     shape [batch_size, n_examples], returning a dictionary of arrays with shape [batch_size]
+    :param n_bootstrap: number of replicates
+    :param batch_size: number of replicates drawn and evaluated at once. If None, the largest
+     size for which n_workers batches fit in memory_budget.
+    :param n_workers: number of threads evaluating batches
+    :param seed: seed of the resampling, results depend on neither batch_size nor n_workers
+    :param memory_budget: approximate peak memory in bytes of all threads, if batch_size is None
+    :return: dictionary of arrays of statistics with shape [n_bootstrap]
+    """
+    n_examples = order.shape[0]
+    if n_workers is None:
+        n_workers = min(n_bootstrap, os.cpu_count() or 1)
+    if batch_size is None:
+        batch_size = max(1, memory_budget // (n_examples * BYTES_PER_DRAW * n_workers))
+        # Every worker gets a batch if there are fewer replicates than the budget allows
+        batch_size = min(batch_size, -(-n_bootstrap // n_workers))
+    # Replicates have their own seeds, so batching does not change the draws
+    seeds = np.random.SeedSequence(seed).spawn(n_bootstrap)
+    batches = [seeds[start:start + batch_size] for start in range(0, n_bootstrap, batch_size)]
+
+    def run_batch(batch_seeds):
+        size = len(batch_seeds)
+        inds = np.stack([np.random.default_rng(replicate_seed).integers(0, n_examples, n_examples)
+                         for replicate_seed in batch_seeds])
+        offsets = n_examples * np.arange(size)[:, np.newaxis]
+        counts = np.bincount((inds + offsets).ravel(), minlength=size * n_examples)
+        del inds
+        counts = counts.reshape(size, n_examples)[:, order]
+        # Every row has n_examples draws in total, so the expansion keeps the shape
+        sorted_inds = np.repeat(np.tile(order, size), counts.ravel())
+        return statistic(sorted_inds.reshape(size, n_examples))
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        results = list(pool.map(run_batch, batches))
+    return {key: np.concatenate([result[key] for result in results]) for key in results[0]}
+
+
+def confidence_intervals(replicates, alpha=0.05):
+    """Percentile intervals of a dictionary of bootstrap replicates, as (lower, upper)."""
+    return {key: tuple(np.percentile(values, [50.0 * alpha, 100.0 - 50.0 * alpha]))
+            for key, values in replicates.items()}
+
+
+def bootstrap_detection(labels, scores, alpha=0.05, **kwargs):
+    """
+    Confidence intervals of the metrics of ood_detection_metrics.
+
+    :param labels: array of binary labels with shape [n_examples], 1 for the positive class
+    :param scores: array of scores with shape [n_examples], higher for the positive class
+    :return: dictionary mapping metric names to (lower, upper)
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(-scores, kind='stable')
+
+    def statistic(sorted_inds):
+        return sorted_detection_metrics(labels[sorted_inds], scores[sorted_inds])[0]
+
+    return confidence_intervals(bootstrap_sorted(order, statistic, **kwargs), alpha=alpha)
+
+
+def bootstrap_rejection_ratio(labels, preds, measure, rev, alpha=0.05, **kwargs):
+    """
+    Confidence interval of the rejection ratio of rejection_curves.
+
+    :return: (lower, upper)
+    """
+    wrong = np.asarray(labels != preds, dtype=np.float64)
+    order = np.argsort(measure)[::-1] if rev else np.argsort(measure)
+
+    def statistic(sorted_inds):
+        return {'rejection_ratio': sorted_rejection_ratios(wrong[sorted_inds])}
+
+    return confidence_intervals(bootstrap_sorted(order, statistic, **kwargs),
+                                alpha=alpha)['rejection_ratio']
+
+
+def eval_bootstrap_ood_detect(domain_labels, in_uncertainties, out_uncertainties, save_path,
+                              alpha=0.05, **kwargs):
+    with open(os.path.join(save_path, 'results.txt'), 'a') as f:
+        for key in in_uncertainties.keys():
+            scores = np.concatenate((in_uncertainties[key], out_uncertainties[key]), axis=0)
+            if key == 'confidence':
+                scores = -scores
+            intervals = bootstrap_detection(domain_labels, scores, alpha=alpha, **kwargs)
+            # Named as the point estimates written by eval_ood_detect
+            for name, metric in [('AUPR', 'AUPR-Out'), ('AUROC', 'AUROC'), ('AUPR-In', 'AUPR-In'),
+                                 ('FPR@95TPR', 'FPR@95TPR'),
+                                 ('detection_error', 'detection_error')]:
+                _write_interval(f, name, key, intervals[metric], alpha, scale=100.0)
+
+
+def eval_bootstrap_misc_detect(class_labels, class_probs, uncertainties, save_path,
+                               misc_positive=True, alpha=0.05, **kwargs):
+    class_preds = np.argmax(class_probs, axis=1)
+    if misc_positive:
+        rightwrong = np.asarray(class_labels != class_preds, dtype=np.int64)
+    else:
+        rightwrong = np.asarray(class_labels == class_preds, dtype=np.int64)
+
+    with open(os.path.join(save_path, 'results.txt'), 'a') as f:
+        for key in uncertainties.keys():
+            scores = -uncertainties[key] if key == 'confidence' else uncertainties[key]
+            intervals = bootstrap_detection(rightwrong, scores, alpha=alpha, **kwargs)
+            _write_interval(f, 'AUPR', key, intervals['AUPR-Out'], alpha, scale=100.0)
+            _write_interval(f, 'AUROC', key, intervals['AUROC'], alpha, scale=100.0)
+
+
+def eval_bootstrap_rejection_ratio_class(labels, probs, uncertainties, save_path, alpha=0.05,
+                                         **kwargs):
+    preds = np.argmax(probs, axis=1)
+    with open(os.path.join(save_path, 'results.txt'), 'a') as f:
+        for key in uncertainties.keys():
+            interval = bootstrap_rejection_ratio(labels, preds, uncertainties[key],
+                                                 rev=key == 'confidence', alpha=alpha, **kwargs)
+            _write_interval(f, 'Rejection Ratio', key, interval, alpha, scale=1.0)
+
+
+def _write_interval(f, metric, measure_name, interval, alpha, scale):
+    lower, upper = [np.round(value * scale, 1) for value in interval]
+    f.write(f'{metric} {int(round(100 * (1 - alpha)))}% CI using {measure_name}: '
+            f'[{lower}, {upper}]\n')
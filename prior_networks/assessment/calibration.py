@@ -1,61 +1,93 @@
 import os
 
-import matplotlib
-
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
-
-sns.set()
-sns.set(font_scale=1.25)
-
-
-def classification_calibration(labels, probs, save_path, bins=10):
-    preds = np.argmax(probs, axis=1)
-    total = labels.shape[0]
-    probs = np.max(probs, axis=1)
-    lower = 0.0
-    increment = 1.0 / bins
-    upper = increment
-    accs = np.zeros([bins + 1], dtype=np.float32)
-    gaps = np.zeros([bins + 1], dtype=np.float32)
-    confs = np.arange(0.0, 1.01, increment)
-    ECE = 0.0
-    for i in range(bins):
-        ind1 = probs >= lower
-        ind2 = probs < upper
-        ind = np.where(np.logical_and(ind1, ind2))[0]
-        lprobs = probs[ind]
-        lpreds = preds[ind]
-        llabels = labels[ind]
-        acc = np.mean(np.asarray(llabels == lpreds, dtype=np.float32))
-        prob = np.mean(lprobs)
-        if np.isnan(acc):
-            acc = 0.0
-            prob = 0.0
-        ECE += np.abs(acc - prob) * float(lprobs.shape[0])
-        gaps[i] = np.abs(acc - prob)
-        accs[i] = acc
-        upper += increment
-        lower += increment
-    ECE /= np.float(total)
-    MCE = np.max(np.abs(gaps))
-
-    accs[-1] = 1.0
-
-    fig, ax = plt.subplots()
-    plt.plot(confs, accs)
-    plt.plot(confs, confs)
-    plt.ylim(0.0, 1.0)
-    plt.ylabel('Accuracy')
-    plt.xlabel('Confidence')
-    plt.xlim(0.0, 1.0)
-    plt.savefig(os.path.join(save_path, 'Reliability Curve'), bbox_inches='tight')
-    plt.close()
+
+from prior_networks.assessment.plotting import render_now, plot_reliability_curve
+
+
+def _binned_sums(bin_idx, n_bins, *weights):
+    """Counts and weighted sums per bin for bin indices with shape [n_groups, n_examples]"""
+    n_groups = bin_idx.shape[0]
+    flat_idx = (bin_idx + n_bins * np.arange(n_groups)[:, np.newaxis]).ravel()
+    sums = [np.bincount(flat_idx, minlength=n_groups * n_bins).reshape(n_groups, n_bins)]
+    for weight in weights:
+        sums.append(np.bincount(flat_idx, weights=weight.ravel(),
+                                minlength=n_groups * n_bins).reshape(n_groups, n_bins))
+    return sums
+
+
+def calibration_metrics(labels, probs, bins=10):
+    """
+    Computes calibration metrics of one or several models with bincount over all bins at once.
+
+    :param labels: array of class labels with shape [n_examples]
+    :param probs: array of probabilities with shape [n_examples, n_classes] or
+     [n_models, n_examples, n_classes]
+    :param bins: number of bins
+    :return: dictionary with ECE, MCE, adaptive ECE (equal-mass bins) and classwise ECE, each a
+     float or an array with shape [n_models], and the per-bin accuracies, confidences and counts
+     of the equal-width bins used for reliability curves
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    squeeze = probs.ndim == 2
+    probs = probs.reshape((-1,) + probs.shape[-2:])
+    n_models, n_examples, n_classes = probs.shape
+
+    preds = np.argmax(probs, axis=2)
+    confidences = np.max(probs, axis=2)
+    correct = np.asarray(preds == labels, dtype=np.float64)
+    edges = np.linspace(0.0, 1.0, bins + 1)[1:-1]
+
+    # Equal-width bins of the confidence
+    counts, conf_sums, acc_sums = _binned_sums(np.digitize(confidences, edges), bins,
+                                               confidences, correct)
+    nonempty = np.maximum(counts, 1)
+    gaps = np.abs(acc_sums - conf_sums) / nonempty
+    ece = np.sum(np.abs(acc_sums - conf_sums), axis=1) / n_examples
+    mce = np.max(gaps, axis=1)
+
+    # Equal-mass bins: every bin holds the same number of examples, up to rounding
+    ranks = np.empty_like(preds)
+    np.put_along_axis(ranks, np.argsort(confidences, axis=1), np.arange(n_examples), axis=1)
+    _, ada_conf_sums, ada_acc_sums = _binned_sums(ranks * bins // n_examples, bins,
+                                                  confidences, correct)
+    adaptive_ece = np.sum(np.abs(ada_acc_sums - ada_conf_sums), axis=1) / n_examples
+
+    # Classwise: every class probability is binned against the indicator of that class
+    class_probs = np.transpose(probs, [0, 2, 1]).reshape(n_models * n_classes, n_examples)
+    is_class = np.asarray(labels[np.newaxis, :] == np.arange(n_classes)[:, np.newaxis],
+                          dtype=np.float64)
+    is_class = np.tile(is_class, (n_models, 1))
+    _, cw_prob_sums, cw_acc_sums = _binned_sums(np.digitize(class_probs, edges), bins,
+                                                class_probs, is_class)
+    classwise_ece = np.sum(np.abs(cw_acc_sums - cw_prob_sums), axis=1) / n_examples
+    classwise_ece = np.mean(classwise_ece.reshape(n_models, n_classes), axis=1)
+
+    metrics = {'ECE': ece,
+               'MCE': mce,
+               'adaptive_ECE': adaptive_ece,
+               'classwise_ECE': classwise_ece,
+               'accuracies': acc_sums / nonempty,
+               'confidences': conf_sums / nonempty,
+               'counts': counts}
+    if squeeze:
+        metrics = {key: value[0] for key, value in metrics.items()}
+    return metrics
+
+
+def classification_calibration(labels, probs, save_path, bins=10, plotter=render_now):
+    metrics = calibration_metrics(labels, probs, bins=bins)
+
+    accs = np.ones([bins + 1], dtype=np.float32)
+    accs[:-1] = metrics['accuracies']
+    plotter(plot_reliability_curve, np.linspace(0.0, 1.0, bins + 1), accs,
+            path=os.path.join(save_path, 'Reliability Curve'))
     with open(os.path.join(save_path, 'results.txt'), 'a') as f:
-        f.write('ECE: ' + str(np.round(ECE * 100.0, 2)) + '\n')
-        f.write('MCE: ' + str(np.round(MCE * 100.0, 2)) + '\n')
+        f.write('ECE: ' + str(np.round(metrics['ECE'] * 100.0, 2)) + '\n')
+        f.write('MCE: ' + str(np.round(metrics['MCE'] * 100.0, 2)) + '\n')
+        f.write('Adaptive ECE: ' + str(np.round(metrics['adaptive_ECE'] * 100.0, 2)) + '\n')
+        f.write('Classwise ECE: ' + str(np.round(metrics['classwise_ECE'] * 100.0, 2)) + '\n')
+    return metrics
 
 # def regression_calibration_curve(targets, preds, intervals, save_path):
 #     diff = np.squeeze(abs(targets - preds))[:, np.newaxis]
@@ -0,0 +1,170 @@
+import json
+import os
+
+import numpy as np
+
+""" Metrics of every group of examples, e.g. every class or every subset of an OOD dataset, from a
+single sort and segmented reductions with bincount rather than a loop over groups. Groups with
+too few examples for a metric get NaN. """
+
+
+def _group_counts(groups, n_groups, weights=None):
+    return np.bincount(groups, weights=weights, minlength=n_groups)[:n_groups]
+
+
+def grouped_auroc(binary_labels, scores, groups, n_groups=None):
+    """
+    AUROC of the examples of every group, where positives have higher scores. Uses midranks
+    within every group, which equals roc_auc_score on the examples of each group.
+
+    :param binary_labels: array of binary labels with shape [n_examples]
+    :param scores: array of scores with shape [n_examples]
+    :param groups: array of non-negative group indices with shape [n_examples]
+    :param n_groups: number of groups, max(groups) + 1 if not set
+    :return: array of AUROCs with shape [n_groups]
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    binary_labels = np.asarray(binary_labels, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    n_groups = int(np.max(groups)) + 1 if n_groups is None else n_groups
+    n_examples = scores.shape[0]
+
+    order = np.lexsort((scores, groups))
+    sorted_scores, sorted_groups = scores[order], groups[order]
+    positions = np.arange(n_examples)
+
+    # Blocks of tied scores within a group get the mean of their ranks
+    is_start = np.ones(n_examples, dtype=bool)
+    is_start[1:] = np.logical_or(sorted_scores[1:] != sorted_scores[:-1],
+                                 sorted_groups[1:] != sorted_groups[:-1])
+    is_end = np.ones(n_examples, dtype=bool)
+    is_end[:-1] = is_start[1:]
+    start = np.maximum.accumulate(np.where(is_start, positions, 0))
+    end = np.minimum.accumulate(np.where(is_end, positions, n_examples)[::-1])[::-1]
+
+    counts = _group_counts(groups, n_groups)
+    group_starts = np.cumsum(counts) - counts
+    ranks = (start + end) / 2.0 + 1.0 - group_starts[sorted_groups]
+
+    n_pos = _group_counts(groups, n_groups, weights=binary_labels)
+    n_neg = counts - n_pos
+    rank_sums = _group_counts(sorted_groups, n_groups, weights=ranks * binary_labels[order])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aurocs = (rank_sums - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg)
+    return np.where((n_pos > 0) & (n_neg > 0), aurocs, np.nan)
+
+
+def grouped_ood_auroc(domain_labels, scores, groups, n_groups=None):
+    """
+    AUROC of the OOD examples of every group against all in-domain examples, e.g. for every
+    subset of an OOD dataset. OOD examples are expected to have higher scores.
+
+    :param domain_labels: array of binary labels, 1 for OOD, with shape [n_examples]
+    :param scores: array of scores with shape [n_examples]
+    :param groups: array of group indices with shape [n_examples], ignored for in-domain data
+    :return: array of AUROCs with shape [n_groups]
+    """
+    domain_labels = np.asarray(domain_labels, dtype=bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)[domain_labels]
+    n_groups = int(np.max(groups)) + 1 if n_groups is None else n_groups
+
+    in_scores = np.sort(scores[~domain_labels])
+    out_scores = scores[domain_labels]
+    # Fraction of in-domain examples ranked below each OOD example, counting ties as half
+    below = np.searchsorted(in_scores, out_scores, side='left')
+    tied = np.searchsorted(in_scores, out_scores, side='right') - below
+    wins = (below + 0.5 * tied) / in_scores.shape[0]
+
+    counts = _group_counts(groups, n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aurocs = _group_counts(groups, n_groups, weights=wins) / counts
+    return np.where(counts > 0, aurocs, np.nan)
+
+
+def grouped_calibration(labels, probs, groups, n_groups=None, bins=10):
+    """
+    Accuracy, mean confidence and ECE of the examples of every group, with equal-width bins.
+
+    :param labels: array of class labels with shape [n_examples]
+    :param probs: array of probabilities with shape [n_examples, n_classes]
+    :param groups: array of group indices with shape [n_examples]
+    :return: dictionary of arrays with shape [n_groups]
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    n_groups = int(np.max(groups)) + 1 if n_groups is None else n_groups
+    confidences = np.max(probs, axis=1)
+    correct = np.asarray(np.argmax(probs, axis=1) == labels, dtype=np.float64)
+    bin_idx = np.digitize(confidences, np.linspace(0.0, 1.0, bins + 1)[1:-1])
+
+    flat_idx = groups * bins + bin_idx
+    conf_sums = np.bincount(flat_idx, weights=confidences, minlength=n_groups * bins)
+    acc_sums = np.bincount(flat_idx, weights=correct, minlength=n_groups * bins)
+    gaps = np.abs(acc_sums - conf_sums)[:n_groups * bins].reshape(n_groups, bins)
+
+    counts = _group_counts(groups, n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {'accuracy': _group_counts(groups, n_groups, weights=correct) / counts,
+                'confidence': _group_counts(groups, n_groups, weights=confidences) / counts,
+                'ECE': np.sum(gaps, axis=1) / counts}
+
+
+def grouped_classification_metrics(labels, probs, uncertainties, groups=None, n_groups=None,
+                                   bins=10):
+    """
+    Per-group error, calibration and misclassification detection AUROC of every measure.
+
+    :param groups: array of group indices with shape [n_examples]. The class labels if not set.
+    :return: dictionary with the count, error and ECE of every group, and a dictionary of
+     misclassification AUROCs of every measure, all arrays with shape [n_groups]
+    """
+    if groups is None:
+        groups = labels
+        n_groups = probs.shape[1] if n_groups is None else n_groups
+    elif n_groups is None:
+        n_groups = int(np.max(groups)) + 1
+    groups = np.asarray(groups, dtype=np.int64)
+    wrong = np.asarray(np.argmax(probs, axis=1) != labels, dtype=np.float64)
+
+    calibration = grouped_calibration(labels, probs, groups, n_groups=n_groups, bins=bins)
+    misc_aurocs = {}
+    for key, measure in uncertainties.items():
+        # Misclassifications are the positive class, confidence is high for correct predictions
+        scores = -measure if key == 'confidence' else measure
+        misc_aurocs[key] = grouped_auroc(wrong, scores, groups, n_groups=n_groups)
+
+    return {'count': _group_counts(groups, n_groups),
+            'error': 1.0 - calibration['accuracy'],
+            'ECE': calibration['ECE'],
+            'misclassification_AUROC': misc_aurocs}
+
+
+def to_json_list(values):
+    """Converts an array of metrics to a list, with None for NaN as JSON has no NaN."""
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def eval_grouped_ood_detect(domain_labels, in_uncertainties, out_uncertainties, ood_groups,
+                            save_path):
+    """
+    Writes the AUROC of every group of OOD examples, e.g. their classes, against all in-domain
+    examples to results_per_class.json.
+
+    :param ood_groups: array of group labels of the OOD examples with shape [n_ood_examples].
+     Any integers, e.g. -1 for unlabelled data, which are listed in the results in sorted order.
+    """
+    group_values, ood_groups = np.unique(ood_groups, return_inverse=True)
+    ood_groups = ood_groups.reshape(-1)
+    n_in = domain_labels.shape[0] - ood_groups.shape[0]
+    groups = np.concatenate([np.zeros(n_in, dtype=np.int64), ood_groups])
+    results = {'group': [int(value) for value in group_values],
+               'count': [int(count) for count in np.bincount(ood_groups)],
+               'AUROC': {}}
+    for key in in_uncertainties.keys():
+        scores = np.concatenate((in_uncertainties[key], out_uncertainties[key]), axis=0)
+        if key == 'confidence':
+            scores = -scores
+        results['AUROC'][key] = to_json_list(grouped_ood_auroc(domain_labels, scores, groups))
+    with open(os.path.join(save_path, 'results_per_class.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
@@ -1,21 +1,13 @@
 import os
 import context
-import matplotlib
-
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.metrics import roc_auc_score, roc_curve
-from sklearn.metrics import precision_recall_curve
-from sklearn.metrics import auc
-import seaborn as sns
 
-sns.set()
-sns.set(font_scale=1.25)
+from prior_networks.assessment.plotting import render_now, plot_curve
 
 
 # TODO: Maybe find a better name??
-def eval_misc_detect(class_labels, class_probs, uncertainties, save_path, misc_positive=True):
+def eval_misc_detect(class_labels, class_probs, uncertainties, save_path, misc_positive=True,
+                     plotter=render_now):
     for mode in ['PR', 'ROC']:
         for key in uncertainties.keys():
             pos_label = 1
@@ -25,13 +17,15 @@ def eval_misc_detect(class_labels, class_probs, uncertainties, save_path, misc_p
             try:
                 misc_detect(class_labels, class_probs, uncertainties[key], key,
                             save_path=save_path, mode=mode, pos_label=pos_label,
-                            misc_positive=misc_positive)
+                            misc_positive=misc_positive, plotter=plotter)
             except:
                 pass
 
 
 def misc_detect(class_labels, class_probs, measure, measure_name, save_path, mode, pos_label=1,
-                misc_positive=None):
+                misc_positive=None, plotter=render_now):
+    from sklearn.metrics import roc_auc_score, roc_curve, precision_recall_curve, auc
+
     # TODO: Is this necessary???
     measure = np.asarray(measure, dtype=np.float128)[:, np.newaxis]
     min_measure = np.min(measure)
@@ -56,16 +50,8 @@ def misc_detect(class_labels, class_probs, measure, measure_name, save_path, mod
         with open(os.path.join(save_path, 'results.txt'), 'a') as f:
             f.write('AUPR using ' + measure_name + ": " + str(np.round(aupr * 100.0, 1)) + '\n')
 
-        np.savetxt(os.path.join(save_path, measure_name + '_recall.txt'), recall)
-        np.savetxt(os.path.join(save_path, measure_name + '_precision.txt'), precision)
-
-        plt.plot(recall, precision)
-        plt.xlabel('Recall')
-        plt.ylabel('Precision')
-        plt.ylim(0.0, 1.0)
-        plt.xlim(0.0, 1.0)
-        plt.savefig(os.path.join(save_path, 'PR_curve_' + measure_name + '.png'))
-        plt.close()
+        save_misc_curves({'recall': recall, 'precision': precision}, measure_name, save_path,
+                         modes=['PR'], plotter=plotter)
 
     elif mode == 'ROC':
         fpr, tpr, thresholds = roc_curve(rightwrong, measure)
@@ -73,16 +59,22 @@ def misc_detect(class_labels, class_probs, measure, measure_name, save_path, mod
         with open(os.path.join(save_path, 'results.txt'), 'a') as f:
             f.write('AUROC using ' + measure_name + ": " + str(np.round(roc_auc * 100.0, 1)) + '\n')
 
-        np.savetxt(os.path.join(save_path, measure_name + '_tpr.txt'), tpr)
-        np.savetxt(os.path.join(save_path, measure_name + '_fpr.txt'), fpr)
-
-        plt.plot(fpr, tpr)
-        plt.xlabel('False Positive')
-        plt.ylabel('True Positive')
-        plt.ylim(0.0, 1.0)
-        plt.xlim(0.0, 1.0)
-        plt.savefig(os.path.join(save_path, 'ROC_curve_' + measure_name + '.png'))
-        plt.close()
+        save_misc_curves({'fpr': fpr, 'tpr': tpr}, measure_name, save_path, modes=['ROC'],
+                         plotter=plotter)
 
     else:
         print('Inappropriate experiment mode')
+
+
+def save_misc_curves(curve, measure_name, save_path, modes=('PR', 'ROC'), plotter=render_now):
+    if 'PR' in modes:
+        np.savetxt(os.path.join(save_path, measure_name + '_recall.txt'), curve['recall'])
+        np.savetxt(os.path.join(save_path, measure_name + '_precision.txt'), curve['precision'])
+        plotter(plot_curve, curve['recall'], curve['precision'], 'Recall', 'Precision',
+                path=os.path.join(save_path, 'PR_curve_' + measure_name + '.png'))
+
+    if 'ROC' in modes:
+        np.savetxt(os.path.join(save_path, measure_name + '_tpr.txt'), curve['tpr'])
+        np.savetxt(os.path.join(save_path, measure_name + '_fpr.txt'), curve['fpr'])
+        plotter(plot_curve, curve['fpr'], curve['tpr'], 'False Positive', 'True Positive',
+                path=os.path.join(save_path, 'ROC_curve_' + measure_name + '.png'))
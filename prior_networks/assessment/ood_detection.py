@@ -1,170 +1,356 @@
 import os
 
-import matplotlib
-
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.metrics import roc_auc_score, roc_curve
-from sklearn.metrics import precision_recall_curve
-from sklearn.metrics import auc
-import seaborn as sns
 
-sns.set()
-sns.set(font_scale=1.25)
+from prior_networks.assessment.plotting import render_now, plot_curve
 
 
-# TODO DECIDE HOW TO COMBINE THIS WITH ADV STUFF
 def eval_ood_detect(domain_labels, in_uncertainties, out_uncertainties, save_path,
-                    classes_flipped=None, adversarial=False):
-    # if adversarial == True:
-    #     functions = [plot_mod_roc_curve]
-    for mode in ['PR', 'ROC']:
+                    classes_flipped=None, adversarial=False, plotter=render_now):
+    """
+    :param classes_flipped: binary array with shape [n_out_examples], whether each attack
+     flipped the predicted class. Required if adversarial.
+    :param adversarial: if True, the out-of-domain data are adversarial attacks, and only the
+     successful ones are counted, see adversarial_detection_metrics
+    """
+    if adversarial:
         for key in in_uncertainties.keys():
-            pos_label = 1
-            if key == 'confidence':
-                pos_label = 0
-
-                # try:
-                # if adversarial == True:
-                #     function(domain_labels, in_uncertainties[key][0], out_uncertainties[key][0], classes_flipped,
-                #              in_uncertainties[key][1],
-                #              save_path=save_path, pos_label=pos_label, show=show)
-            ood_detect(domain_labels, in_uncertainties[key], out_uncertainties[key], key, mode=mode,
-                       save_path=save_path, pos_label=pos_label)
-            # except:
-            #     pass
-
-
-def ood_detect(domain_labels, in_measure, out_measure, measure_name, save_path, mode, pos_label=1):
+            plot_mod_roc_curve(domain_labels, in_uncertainties[key], out_uncertainties[key],
+                               classes_flipped, key, save_path=save_path,
+                               pos_label=0 if key == 'confidence' else 1, plotter=plotter)
+        return
+
+    keys = list(in_uncertainties.keys())
+    # Confidence is high for in-domain data, so it is negated to make OOD the positive class
+    scores = np.stack([np.concatenate((in_uncertainties[key], out_uncertainties[key]), axis=0)
+                       * (-1.0 if key == 'confidence' else 1.0) for key in keys], axis=0)
+    metrics, curves = ood_detection_metrics(domain_labels, scores, return_curves=True)
+
+    with open(os.path.join(save_path, 'results.txt'), 'a') as f:
+        for i, key in enumerate(keys):
+            f.write('AUPR using ' + key + ": " + str(np.round(metrics['AUPR-Out'][i] * 100.0, 1)) + '\n')
+        for i, key in enumerate(keys):
+            f.write('AUROC using ' + key + ": " + str(np.round(metrics['AUROC'][i] * 100.0, 1)) + '\n')
+        for metric in ['AUPR-In', 'FPR@95TPR', 'detection_error']:
+            for i, key in enumerate(keys):
+                f.write(metric + ' using ' + key + ": " + str(np.round(metrics[metric][i] * 100.0, 1)) + '\n')
+
+    if len(keys) > 1:
+        eval_delong_test(domain_labels, scores, keys, save_path=save_path)
+
+    for key, curve in zip(keys, curves):
+        save_ood_curves(curve, key, save_path=save_path, plotter=plotter)
+
+
+def ood_detect(domain_labels, in_measure, out_measure, measure_name, save_path, mode, pos_label=1,
+               plotter=render_now):
     scores = np.concatenate((in_measure, out_measure), axis=0)
-    scores = np.asarray(scores, dtype=np.float128)
+    scores = np.asarray(scores, dtype=np.float64)
     if pos_label != 1:
         scores *= -1.0
 
+    metrics, curves = ood_detection_metrics(domain_labels, scores, return_curves=True)
     if mode == 'PR':
-        precision, recall, thresholds = precision_recall_curve(domain_labels, scores)
-        aupr = auc(recall, precision)
         with open(os.path.join(save_path, 'results.txt'), 'a') as f:
-            f.write('AUPR using ' + measure_name + ": " + str(np.round(aupr * 100.0, 1)) + '\n')
-        np.savetxt(os.path.join(save_path, measure_name + '_recall.txt'), recall)
-        np.savetxt(os.path.join(save_path, measure_name + '_precision.txt'), precision)
-
-        plt.plot(recall, precision)
-        plt.xlabel('Recall')
-        plt.ylabel('Precision')
-        plt.ylim(0.0, 1.0)
-        plt.xlim(0.0, 1.0)
-        plt.savefig(os.path.join(save_path, 'PR_' + measure_name + '.png'))
-        plt.close()
-
+            f.write('AUPR using ' + measure_name + ": " + str(np.round(metrics['AUPR-Out'] * 100.0, 1)) + '\n')
     elif mode == 'ROC':
-        fpr, tpr, thresholds = roc_curve(domain_labels, scores)
-        roc_auc = roc_auc_score(domain_labels, scores)
         with open(os.path.join(save_path, 'results.txt'), 'a') as f:
-            f.write('AUROC using ' + measure_name + ": " + str(np.round(roc_auc * 100.0, 1)) + '\n')
-        np.savetxt(os.path.join(save_path, measure_name + '_trp.txt'), tpr)
-        np.savetxt(os.path.join(save_path, measure_name + '_frp.txt'), fpr)
+            f.write('AUROC using ' + measure_name + ": " + str(np.round(metrics['AUROC'] * 100.0, 1)) + '\n')
+    save_ood_curves(curves, measure_name, save_path=save_path, modes=[mode], plotter=plotter)
+
+
+def save_ood_curves(curve, measure_name, save_path, modes=('PR', 'ROC'), plotter=render_now):
+    if 'PR' in modes:
+        np.savetxt(os.path.join(save_path, measure_name + '_recall.txt'), curve['recall'])
+        np.savetxt(os.path.join(save_path, measure_name + '_precision.txt'), curve['precision'])
+        plotter(plot_curve, curve['recall'], curve['precision'], 'Recall', 'Precision',
+                path=os.path.join(save_path, 'PR_' + measure_name + '.png'))
+
+    if 'ROC' in modes:
+        np.savetxt(os.path.join(save_path, measure_name + '_trp.txt'), curve['tpr'])
+        np.savetxt(os.path.join(save_path, measure_name + '_frp.txt'), curve['fpr'])
+        plotter(plot_curve, curve['fpr'], curve['tpr'], 'False Positive', 'True Positive',
+                path=os.path.join(save_path, 'ROC_' + measure_name + '.png'))
+
+
+def _tied_counts(sorted_labels, sorted_scores):
+    """
+    Cumulative positive and negative counts along scores sorted in decreasing order. Every
+    position takes the counts at the end of its group of tied scores, so each threshold appears
+    once and repeated points add zero area to the trapezoidal integrals.
+    """
+    n_examples = sorted_scores.shape[1]
+    is_end = np.ones_like(sorted_scores, dtype=bool)
+    is_end[:, :-1] = sorted_scores[:, :-1] != sorted_scores[:, 1:]
+    end_idx = np.where(is_end, np.arange(n_examples), n_examples)
+    end_idx = np.minimum.accumulate(end_idx[:, ::-1], axis=1)[:, ::-1]
+
+    tps = np.take_along_axis(np.cumsum(sorted_labels, axis=1), end_idx, axis=1)
+    fps = (end_idx + 1) - tps
+    return tps, fps, is_end
+
+
+def _trapezoid(x, y):
+    return np.sum(np.diff(x, axis=1) * (y[:, 1:] + y[:, :-1]) / 2.0, axis=1)
+
+
+def sorted_detection_metrics(sorted_labels, sorted_scores):
+    """
+    Detection metrics of rows of labels which are already sorted by decreasing score, so that
+    callers such as the bootstrap can reuse a single sort.
+
+    :param sorted_labels: array of binary labels with shape [n_rows, n_examples]
+    :param sorted_scores: array of scores sorted in decreasing order along each row
+    :return: dictionary of metrics with shape [n_rows] as in ood_detection_metrics, and the
+     cumulative tps, fps and tied group ends
+    """
+    tps, fps, is_end = _tied_counts(sorted_labels, sorted_scores)
+    n_pos, n_neg = tps[:, -1:], fps[:, -1:]
+    zeros = np.zeros([sorted_scores.shape[0], 1])
+    tpr = np.concatenate([zeros, tps / n_pos], axis=1)
+    fpr = np.concatenate([zeros, fps / n_neg], axis=1)
+    precision = np.concatenate([zeros + 1.0, tps / (tps + fps)], axis=1)
+
+    # In-domain data is the positive class when walking the sorted scores in reverse
+    in_tps, in_fps, _ = _tied_counts(1 - sorted_labels[:, ::-1], -sorted_scores[:, ::-1])
+    in_recall = np.concatenate([zeros, in_tps / n_neg], axis=1)
+    in_precision = np.concatenate([zeros + 1.0, in_tps / (in_tps + in_fps)], axis=1)
+
+    metrics = {'AUROC': _trapezoid(fpr, tpr),
+               'AUPR-In': _trapezoid(in_recall, in_precision),
+               'AUPR-Out': _trapezoid(tpr, precision),
+               'FPR@95TPR': np.take_along_axis(fpr, np.argmax(tpr >= 0.95, axis=1)[:, np.newaxis],
+                                               axis=1)[:, 0],
+               'detection_error': np.min(0.5 * (1.0 - tpr) + 0.5 * fpr, axis=1)}
+    return metrics, tps, fps, is_end
+
+
+def detection_curves(tps, fps, is_end):
+    """
+    ROC and PR curves of one row of cumulative counts returned by sorted_detection_metrics.
+
+    :return: dictionary with fpr, tpr, precision and recall as returned by sklearn's roc_curve
+     and precision_recall_curve
+    """
+    tps, fps = tps[is_end], fps[is_end]
+    n_pos, n_neg = tps[-1], fps[-1]
+    # Drop collinear points from the ROC curve, as sklearn does
+    keep = np.where(np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True])[0]
+    return {'fpr': np.r_[0.0, fps[keep] / n_neg],
+            'tpr': np.r_[0.0, tps[keep] / n_pos],
+            'precision': np.r_[(tps / (tps + fps))[::-1], 1.0],
+            'recall': np.r_[(tps / n_pos)[::-1], 0.0]}
+
+
+def ood_detection_metrics(domain_labels, scores, return_curves=False):
+    """
+    Computes OOD detection metrics for one or several measures with a single argsort per measure.
+    OOD examples (domain label 1) are the positive class and are expected to have higher scores.
+    AUROC and AUPR match roc_auc_score and auc(precision_recall_curve) from sklearn.
+
+    :param domain_labels: array of binary labels, 1 for OOD, with shape [n_examples]
+    :param scores: array of scores with shape [n_examples] or [n_measures, n_examples]
+    :param return_curves: if True, also returns the ROC and PR curves of every measure
+    :return: dictionary with AUROC, AUPR-In (in-domain positive), AUPR-Out (OOD positive),
+     FPR@95TPR and detection_error. Each entry is a float, or an array with shape [n_measures]
+     if scores is 2D. If return_curves, also a dict (or list of dicts) with fpr, tpr, precision
+     and recall as returned by sklearn's roc_curve and precision_recall_curve.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    squeeze = scores.ndim == 1
+    scores = np.atleast_2d(scores)
+    domain_labels = np.asarray(domain_labels, dtype=np.int64)
 
-        plt.plot(fpr, tpr)
-        plt.xlabel('False Positive')
-        plt.ylabel('True Positive')
-        plt.ylim(0.0, 1.0)
-        plt.xlim(0.0, 1.0)
-        plt.savefig(os.path.join(save_path, 'ROC_' + measure_name + '.png'))
-        plt.close()
+    order = np.argsort(-scores, axis=1, kind='stable')
+    sorted_scores = np.take_along_axis(scores, order, axis=1)
+    sorted_labels = domain_labels[order]
+
+    metrics, tps, fps, is_end = sorted_detection_metrics(sorted_labels, sorted_scores)
+    if squeeze:
+        metrics = {key: value[0] for key, value in metrics.items()}
+    if not return_curves:
+        return metrics
+
+    curves = [detection_curves(tps[i], fps[i], is_end[i]) for i in range(scores.shape[0])]
+    if squeeze:
+        curves = curves[0]
+    return metrics, curves
+
+
+def _midranks(scores):
+    """1-based ranks along the last axis, where tied scores get the mean of their ranks."""
+    n_examples = scores.shape[1]
+    order = np.argsort(scores, axis=1, kind='stable')
+    sorted_scores = np.take_along_axis(scores, order, axis=1)
+    positions = np.arange(n_examples)
+
+    is_start = np.ones_like(sorted_scores, dtype=bool)
+    is_start[:, 1:] = sorted_scores[:, 1:] != sorted_scores[:, :-1]
+    is_end = np.ones_like(sorted_scores, dtype=bool)
+    is_end[:, :-1] = is_start[:, 1:]
+    start = np.maximum.accumulate(np.where(is_start, positions, 0), axis=1)
+    end = np.minimum.accumulate(np.where(is_end, positions, n_examples)[:, ::-1], axis=1)[:, ::-1]
+
+    ranks = np.empty_like(sorted_scores)
+    np.put_along_axis(ranks, order, (start + end) / 2.0 + 1.0, axis=1)
+    return ranks
+
+
+def delong_test(domain_labels, scores):
+    """
+    Paired DeLong test of the AUROCs of several measures, or models, scored on the same
+    examples, using the O(N log N) midrank formulation of Sun and Xu (2014).
+
+    :param domain_labels: array of binary labels, 1 for OOD, with shape [n_examples]
+    :param scores: array of scores with shape [n_measures, n_examples], higher for OOD
+    :return: AUROCs with shape [n_measures], their covariance with shape
+     [n_measures, n_measures], and two-sided p-values of every pairwise difference with shape
+     [n_measures, n_measures]
+    """
+    from scipy.stats import norm
+
+    scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+    domain_labels = np.asarray(domain_labels, dtype=bool)
+    pos_scores, neg_scores = scores[:, domain_labels], scores[:, ~domain_labels]
+    n_pos, n_neg = pos_scores.shape[1], neg_scores.shape[1]
+
+    pos_ranks, neg_ranks = _midranks(pos_scores), _midranks(neg_scores)
+    all_ranks = _midranks(np.concatenate([pos_scores, neg_scores], axis=1))
+    aurocs = (np.sum(all_ranks[:, :n_pos], axis=1) - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg)
+
+    # Structural components: the AUROC of each positive against all negatives, and vice versa
+    pos_components = (all_ranks[:, :n_pos] - pos_ranks) / n_neg
+    neg_components = 1.0 - (all_ranks[:, n_pos:] - neg_ranks) / n_pos
+    covariance = (np.atleast_2d(np.cov(pos_components)) / n_pos
+                  + np.atleast_2d(np.cov(neg_components)) / n_neg)
+
+    variances = np.diag(covariance)
+    diff_variances = variances[:, np.newaxis] + variances[np.newaxis, :] - 2.0 * covariance
+    differences = aurocs[:, np.newaxis] - aurocs[np.newaxis, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(differences) / np.sqrt(diff_variances)
+    p_values = np.where(diff_variances > 0.0, 2.0 * norm.sf(z), 1.0)
+    return aurocs, covariance, p_values
+
+
+def eval_delong_test(domain_labels, scores, names, save_path):
+    """
+    Writes the pairwise AUROC differences of named scores and their DeLong p-values to
+    delong.txt, e.g. to compare uncertainty measures or models on the same ID/OOD data.
+    """
+    aurocs, covariance, p_values = delong_test(domain_labels, scores)
+    variances = np.diag(covariance)
+    diff_stds = np.sqrt(np.maximum(variances[:, np.newaxis] + variances[np.newaxis, :]
+                                   - 2.0 * covariance, 0.0))
+    with open(os.path.join(save_path, 'delong.txt'), 'a') as f:
+        for i in range(len(names)):
+            for j in range(i + 1, len(names)):
+                f.write(f'AUROC difference {names[i]} - {names[j]}: '
+                        f'{np.round((aurocs[i] - aurocs[j]) * 100.0, 1)} '
+                        f'(std {np.round(diff_stds[i, j] * 100.0, 1)}, '
+                        f'p-value {p_values[i, j]:.3g})\n')
+
+
+def adversarial_detection_metrics(domain_labels, scores, class_flipped, return_curves=False):
+    """
+    Detection of adversarial attacks, where only successful attacks, which flipped the predicted
+    class, need to be detected. Failed attacks are harmless, so they count as detected at every
+    threshold: the ROC curve starts at a TPR of the fraction of failed attacks. Uses one argsort
+    per measure, as ood_detection_metrics.
+
+    :param domain_labels: array of binary labels, 1 for adversarial, with shape [n_examples]
+    :param scores: array of scores with shape [n_examples] or [n_measures, n_examples], higher
+     for adversarial inputs
+    :param class_flipped: binary array with shape [n_examples], 1 if the attack changed the
+     predicted class. Ignored for natural inputs.
+    :param return_curves: if True, also returns the ROC curve of every measure
+    :return: dictionary with AUROC and FPR@95TPR, each a float or an array with shape
+     [n_measures], and the success rate of the attacks. If return_curves, also a dict (or list of
+     dicts) with fpr and tpr.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    squeeze = scores.ndim == 1
+    scores = np.atleast_2d(scores)
+    domain_labels = np.asarray(domain_labels, dtype=np.int64)
+    successful = np.logical_and(domain_labels == 1, np.asarray(class_flipped, dtype=bool))
+    n_adv, n_nat = np.sum(domain_labels), np.sum(1 - domain_labels)
+    n_failed = n_adv - np.sum(successful)
+
+    # Failed attacks never become false negatives, so they are left out of the sort
+    keep = np.logical_or(domain_labels == 0, successful)
+    scores, domain_labels = scores[:, keep], domain_labels[keep]
+    order = np.argsort(-scores, axis=1, kind='stable')
+    tps, fps, is_end = _tied_counts(domain_labels[order], np.take_along_axis(scores, order, axis=1))
+
+    zeros = np.zeros([scores.shape[0], 1])
+    tpr = np.concatenate([zeros, tps], axis=1) / n_adv + n_failed / n_adv
+    fpr = np.concatenate([zeros, fps], axis=1) / n_nat
+    metrics = {'AUROC': _trapezoid(fpr, tpr),
+               'FPR@95TPR': np.take_along_axis(fpr, np.argmax(tpr >= 0.95, axis=1)[:, np.newaxis],
+                                               axis=1)[:, 0]}
+    if squeeze:
+        metrics = {key: value[0] for key, value in metrics.items()}
+    metrics['success_rate'] = 1.0 - n_failed / n_adv
+    if not return_curves:
+        return metrics
+
+    curves = [{'fpr': np.r_[fpr[i, 0], fpr[i, 1:][is_end[i]]],
+               'tpr': np.r_[tpr[i, 0], tpr[i, 1:][is_end[i]]]} for i in range(scores.shape[0])]
+    if squeeze:
+        curves = curves[0]
+    return metrics, curves
+
+
+def predictions_flipped(natural_outputs, adversarial_outputs):
+    """
+    Whether each attack changed the predicted class. Predictions are compared with those on the
+    natural inputs, not with the labels, so an attack on a misclassified input which leaves the
+    prediction unchanged has failed.
+
+    :param natural_outputs: probabilities or logits of the natural inputs with shape
+     [n_examples, n_classes]
+    :param adversarial_outputs: probabilities or logits of the attacks on the same inputs, in the
+     same order
+    :return: boolean array with shape [n_examples], the class_flipped of
+     adversarial_detection_metrics
+    """
+    return np.argmax(natural_outputs, axis=1) != np.argmax(adversarial_outputs, axis=1)
 
 
-# TODO: Fix adversarial detection stuff later...
 def mod_roc_curve(y_true, y_score, class_flipped, pos_label=1):
-    """Calculate true and false positives per binary classification threshold.
-    Parameters
-    ----------
-    y_true : array, shape = [n_samples]
-        True targets of binary classification
-    y_score : array, shape = [n_samples]
-        Estimated probabilities or decision function
-        class_flipped : array, shape = [n_samples]
-        whether the predicted class was flipped or not
-    pos_label : int or str, default=None
-        The label of the positive class
-    Returns
-    -------
-    fps : array, shape = [n_thresholds]
-        A count of false positives, at index i being the number of negative
-        samples assigned a score >= thresholds[i]. The total number of
-        negative samples is equal to fps[-1] (thus true negatives are given by
-        fps[-1] - fps).
-    tps : array, shape = [n_thresholds <= len(np.unique(y_score))]
-        An increasing count of true positives, at index i being the number
-        of positive samples assigned a score >= thresholds[i]. The total
-        number of positive samples is equal to tps[-1] (thus false negatives
-        are given by tps[-1] - tps).
-    thresholds : array, shape = [n_thresholds]
-        Decreasing score values.
-    """
-
-    # y_true = column_or_1d(y_true)
-    # y_score = column_or_1d(y_score)
-
-    # make y_true a boolean vector
-    # y_true = (y_true == pos_label)
-    # print y_true
-
-    # sort scores and corresponding truth values
-    desc_score_indices = np.argsort(y_score, kind="mergesort")
-    y_score = y_score[desc_score_indices]
-    y_true = y_true[desc_score_indices]
-    class_flipped = class_flipped[desc_score_indices]
-
-    # y_score typically has many tied values. Here we extract
-    # the indices associated with the distinct values. We also
-    # concatenate a value for the end of the curve.
-    distinct_value_indices = np.where(np.diff(y_score))[0]
-    threshold_idxs = np.r_[distinct_value_indices, y_true.size - 1]
-
-    # accumulate the true positives with decreasing threshold
-    tps = np.cumsum(y_true)[threshold_idxs]
-    tpr = tps / np.float(tps[-1])
-
-    y_true = 1 - y_true
-    total_neg = np.float(np.sum(y_true))
-    y_true = y_true * class_flipped
-    # print total_neg, np.sum(y_true)
-    fps = np.cumsum(y_true)[threshold_idxs]
-    fpr = fps / total_neg
-
-    fpr = np.r_[fpr, 1.0]
-    tpr = np.r_[tpr, 1.0]
-
-    auc_score = auc(fpr, tpr, reorder=True)
-
-    return auc_score, fpr, tpr, y_score[threshold_idxs]
+    """
+    ROC curve of adversarial detection, counting only successful attacks.
+
+    :param y_true: array of binary labels, 1 for adversarial, with shape [n_samples]
+    :param y_score: array of scores with shape [n_samples]
+    :param class_flipped: binary array with shape [n_samples], whether the predicted class was
+     flipped by the attack
+    :param pos_label: 1 if scores are higher for adversarial inputs, otherwise they are negated
+    :return: AUROC, and the false and true positive rates
+    """
+    y_score = np.asarray(y_score, dtype=np.float64)
+    if pos_label != 1:
+        y_score = -y_score
+    metrics, curve = adversarial_detection_metrics(y_true, y_score, class_flipped,
+                                                   return_curves=True)
+    return metrics['AUROC'], curve['fpr'], curve['tpr']
 
 
 def plot_mod_roc_curve(domain_labels, in_measure, out_measure, class_flipped, measure_name,
-                       save_path, pos_label=1, show=True):
+                       save_path, pos_label=1, show=True, plotter=render_now):
     scores = np.concatenate((in_measure, out_measure), axis=0)
-    scores = np.asarray(scores, dtype=np.float128)
-    not_flipped = np.asarray(np.zeros_like(in_measure), dtype=np.int32)
+    not_flipped = np.zeros_like(in_measure, dtype=np.int32)
     class_flipped = np.r_[not_flipped, class_flipped]
-    if pos_label != 1:
-        scores = -1.0 * scores
 
-    roc_auc, fpr, tpr, thresholds = mod_roc_curve(domain_labels, scores,
-                                                  class_flipped=class_flipped)
+    roc_auc, fpr, tpr = mod_roc_curve(domain_labels, scores, class_flipped=class_flipped,
+                                      pos_label=pos_label)
     with open(os.path.join(save_path, 'results.txt'), 'a') as f:
         f.write(
             'MOD ROC AUC using ' + measure_name + ": " + str(np.round(roc_auc * 100.0, 1)) + '\n')
     np.savetxt(os.path.join(save_path, measure_name + '_trp.txt'), tpr)
     np.savetxt(os.path.join(save_path, measure_name + '_frp.txt'), fpr)
 
-    plt.plot(fpr, tpr)
-    plt.xlabel('False Positive')
-    plt.ylabel('True Positive')
-    plt.ylim(0.0, 1.0)
-    plt.xlim(0.0, 1.0)
     if show:
-        save_path = os.path.join(save_path, 'ROC_' + measure_name + '.png')
-        plt.savefig(save_path)
-    plt.close()
+        plotter(plot_curve, fpr, tpr, 'False Positive', 'True Positive',
+                path=os.path.join(save_path, 'ROC_' + measure_name + '.png'))
+    return roc_auc
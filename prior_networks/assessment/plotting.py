@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+""" Plotting of assessment curves. Assessment functions take a plotter, which is called as
+plotter(plot_function, *args, **kwargs), so that figures can be drawn immediately, deferred to a
+process pool once all metrics are written, or skipped. """
+
+
+@lru_cache(maxsize=None)
+def get_pyplot():
+    """Imports pyplot with the agg backend and the seaborn style on first use."""
+    import matplotlib
+
+    matplotlib.use('agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    sns.set()
+    sns.set(font_scale=1.25)
+    return plt
+
+
+def render_now(function, *args, **kwargs):
+    function(*args, **kwargs)
+
+
+def skip_plot(function, *args, **kwargs):
+    pass
+
+
+class DeferredPlotter(object):
+    """Collects plotting jobs and renders them in parallel once render() is called."""
+
+    def __init__(self, n_workers=None):
+        """
+        :param n_workers: number of worker processes. Renders in the calling process if 0.
+        """
+        self.n_workers = n_workers
+        self.jobs = []
+
+    def __call__(self, function, *args, **kwargs):
+        self.jobs.append((function, args, kwargs))
+
+    def render(self):
+        jobs, self.jobs = self.jobs, []
+        if self.n_workers == 0:
+            for function, args, kwargs in jobs:
+                function(*args, **kwargs)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.n_workers) as pool:
+            futures = [pool.submit(function, *args, **kwargs) for function, args, kwargs in jobs]
+            # Raise any exception from the workers
+            for future in futures:
+                future.result()
+
+
+def plot_curve(x, y, xlabel, ylabel, path):
+    plt = get_pyplot()
+    plt.plot(x, y)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.ylim(0.0, 1.0)
+    plt.xlim(0.0, 1.0)
+    plt.savefig(path)
+    plt.close()
+
+
+def plot_reliability_curve(confs, accs, path):
+    plt = get_pyplot()
+    fig, ax = plt.subplots()
+    plt.plot(confs, accs)
+    plt.plot(confs, confs)
+    plt.ylim(0.0, 1.0)
+    plt.ylabel('Accuracy')
+    plt.xlabel('Confidence')
+    plt.xlim(0.0, 1.0)
+    plt.savefig(path, bbox_inches='tight')
+    plt.close()
+
+
+def plot_rejection_curves(percentages, errors, random_rejection, orc, oracle_path, uncertainty_path):
+    plt = get_pyplot()
+    for path, oracle_alpha, uncertainty_alpha in [(oracle_path, 0.5, 0.0),
+                                                  (uncertainty_path, 0.0, 0.5)]:
+        plt.plot(percentages, orc, lw=2)
+        plt.fill_between(percentages, orc, random_rejection, alpha=oracle_alpha)
+        plt.plot(percentages, errors, lw=2)
+        plt.fill_between(percentages, errors, random_rejection, alpha=uncertainty_alpha)
+        plt.plot(percentages, random_rejection, 'k--', lw=2)
+        plt.legend(['Oracle', 'Uncertainty', 'Random'])
+        plt.xlabel('Percentage of predictions rejected to oracle')
+        plt.ylabel('Classification Error (%)')
+        plt.savefig(path, bbox_inches='tight', dpi=300)
+        plt.close()
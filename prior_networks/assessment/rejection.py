@@ -1,96 +1,131 @@
 import os
 
-import matplotlib
-
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.stats import pearsonr
-from sklearn.metrics import auc
-import seaborn as sns
 
-sns.set()
-sns.set(font_scale=1.25)
+from prior_networks.assessment.plotting import render_now, plot_rejection_curves
 
 
 # TODO: Maybe find a better name??
-def eval_rejection_ratio_class(labels, probs, uncertainties, save_path):
+def eval_rejection_ratio_class(labels, probs, uncertainties, save_path, n_plot_points=None,
+                               plotter=render_now):
     for key in uncertainties.keys():
         rev = False
         if key == 'confidence':
             rev = True
 
         try:
-            reject_class(labels, probs, uncertainties[key], key, save_path=save_path, rev=rev)
+            reject_class(labels, probs, uncertainties[key], key, save_path=save_path, rev=rev,
+                         n_plot_points=n_plot_points, plotter=plotter)
         except:
             pass
 
 
-def reject_class(labels, probs, measure, measure_name: str, save_path: str, rev: bool, show=True):
-    # Get predictions
-    preds = np.argmax(probs, axis=1)
+def rejection_curves(labels, preds, measure, rev: bool):
+    """
+    Computes the rejection curves of a measure with one sort and a cumulative sum.
 
+    :param labels: array of class labels with shape [n_examples]
+    :param preds: array of predicted classes with shape [n_examples]
+    :param measure: array of uncertainties with shape [n_examples]
+    :param rev: if True, high values of the measure indicate certainty (e.g. confidence)
+    :return: rejection_ratio, percentages, and the uncertainty, random and oracle error curves (%)
+    """
     if rev:
         inds = np.argsort(measure)[::-1]
     else:
         inds = np.argsort(measure)
+    return sorted_rejection_curves(np.asarray(labels[inds] != preds[inds], dtype=np.float64))
 
-    total_data = np.float(preds.shape[0])
-    errors, percentages = [], []
 
-    for i in range(preds.shape[0]):
-        errors.append(np.sum(
-            np.asarray(labels[inds[:i]] != preds[inds[:i]], dtype=np.float32)) * 100.0 / total_data)
-        percentages.append(float(i + 1) / total_data * 100.0)
-    errors, percentages = np.asarray(errors)[:, np.newaxis], np.asarray(percentages)
+def sorted_rejection_curves(sorted_wrong):
+    """
+    Rejection curves of errors which are already sorted from the most to the least certain
+    prediction, as returned by rejection_curves.
 
-    base_error = errors[-1]
-    n_items = errors.shape[0]
-    auc_uns = 1.0 - auc(percentages / 100.0, errors[::-1] / 100.0)
+    :param sorted_wrong: binary array with shape [n_examples], 1 for misclassifications
+    """
+    rejection_ratios, percentages, errors, random_rejection, orc = \
+        _sorted_rejection_rows(np.asarray(sorted_wrong)[np.newaxis])
+    return rejection_ratios[0], percentages, errors[0], random_rejection[0], orc[0]
 
-    random_rejection = np.asarray(
-        [base_error * (1.0 - float(i) / float(n_items)) for i in range(n_items)],
-        dtype=np.float32)
-    auc_rnd = 1.0 - auc(percentages / 100.0, random_rejection / 100.0)
-    orc_rejection = np.asarray(
-        [base_error * (1.0 - float(i) / float(base_error / 100.0 * n_items)) for i in
-         range(int(base_error / 100.0 * n_items))], dtype=np.float32)
-    orc = np.zeros_like(errors)
-    orc[0:orc_rejection.shape[0]] = orc_rejection
-    auc_orc = 1.0 - auc(percentages / 100.0, orc / 100.0)
 
-    random_rejection = np.squeeze(random_rejection)
-    orc = np.squeeze(orc)
-    errors = np.squeeze(errors)
-    if show:
-        plt.plot(percentages, orc, lw=2)
-        plt.fill_between(percentages, orc, random_rejection, alpha=0.5)
-        plt.plot(percentages, errors[::-1], lw=2)
-        plt.fill_between(percentages, errors[::-1], random_rejection, alpha=0.0)
-        plt.plot(percentages, random_rejection, 'k--', lw=2)
-        plt.legend(['Oracle', 'Uncertainty', 'Random'])
-        plt.xlabel('Percentage of predictions rejected to oracle')
-        plt.ylabel('Classification Error (%)')
-        plt.savefig('Rejection-Curve-oracle.png', bbox_inches='tight', dpi=300)
-        # plt.show()
-        plt.close()
+def sorted_rejection_ratios(sorted_wrong):
+    """
+    Rejection ratios of rows of errors which are already sorted from the most to the least
+    certain prediction, computed as in rejection_curves for all rows at once.
+
+    :param sorted_wrong: binary array with shape [n_rows, n_examples], 1 for misclassifications
+    :return: array of rejection ratios (%) with shape [n_rows]
+    """
+    return _sorted_rejection_rows(sorted_wrong)[0]
+
+
+def _sorted_rejection_rows(sorted_wrong):
+    """
+    :param sorted_wrong: binary array with shape [n_rows, n_examples]
+    :return: rejection ratios with shape [n_rows], percentages with shape [n_examples], and the
+     uncertainty, random and oracle error curves (%) with shape [n_rows, n_examples]. Rejection
+     ratios are NaN where the oracle is no better than random, e.g. for rows without errors.
+    """
+    n_rows, n_items = sorted_wrong.shape
+    percentages = np.arange(1, n_items + 1) / float(n_items) * 100.0
+
+    def auc(y):
+        # Trapezoidal area under a curve of percentages, as sklearn.metrics.auc
+        return np.sum(np.diff(percentages / 100.0) * (y[:, 1:] + y[:, :-1]) / 2.0, axis=1)
+
+    # errors[:, i] is the error among the i most certain predictions
+    errors = np.zeros([n_rows, n_items])
+    errors[:, 1:] = np.cumsum(sorted_wrong, axis=1)[:, :-1]
+    errors = errors * 100.0 / float(n_items)
+    base_error = errors[:, -1:]
+    auc_uns = 1.0 - auc(errors[:, ::-1] / 100.0)
 
-        plt.plot(percentages, orc, lw=2)
-        plt.fill_between(percentages, orc, random_rejection, alpha=0.0)
-        plt.plot(percentages, errors[::-1], lw=2)
-        plt.fill_between(percentages, errors[::-1], random_rejection, alpha=0.5)
-        plt.plot(percentages, random_rejection, 'k--', lw=2)
-        plt.legend(['Oracle', 'Uncertainty', 'Random'])
-        plt.xlabel('Percentage of predictions rejected to oracle')
-        plt.ylabel('Classification Error (%)')
-        plt.savefig('Rejection-Curve-uncertainty.png', bbox_inches='tight', dpi=300)
-        # plt.show()
-        plt.close()
+    steps = np.arange(n_items)
+    random_rejection = np.asarray(base_error * (1.0 - steps / float(n_items)), dtype=np.float32)
+    auc_rnd = 1.0 - auc(random_rejection / 100.0)
+    # The oracle rejects the n_orc errors first, so its error falls to 0 after n_orc steps
+    n_orc = (base_error / 100.0 * n_items).astype(np.int64)
+    orc = np.where(steps < n_orc,
+                   np.asarray(base_error - 100.0 * steps / float(n_items), dtype=np.float32),
+                   0.0).astype(np.float64)
+    auc_orc = 1.0 - auc(orc / 100.0)
 
-    rejection_ratio = (auc_uns - auc_rnd) / (auc_orc - auc_rnd) * 100.0
+    defined = auc_orc != auc_rnd
+    rejection_ratios = np.full(n_rows, np.nan)
+    rejection_ratios[defined] = (auc_uns - auc_rnd)[defined] / (auc_orc - auc_rnd)[defined] * 100.0
+    return rejection_ratios, percentages, errors, random_rejection, orc
+
+
+def reject_class(labels, probs, measure, measure_name: str, save_path: str, rev: bool, show=True,
+                 n_plot_points=None, plotter=render_now):
+    # Get predictions
+    preds = np.argmax(probs, axis=1)
+
+    rejection_ratio, percentages, errors, random_rejection, orc = rejection_curves(labels, preds,
+                                                                                   measure, rev)
+    if show:
+        save_rejection_curves(percentages, errors, random_rejection, orc, measure_name, save_path,
+                              n_plot_points=n_plot_points, plotter=plotter)
 
     with open(os.path.join(save_path, 'results.txt'), 'a') as f:
         f.write(f'Rejection Ratio using {measure_name}: {np.round(rejection_ratio, 1)}\n')
+    return rejection_ratio
+
+
+def save_rejection_curves(percentages, errors, random_rejection, orc, measure_name, save_path,
+                          n_plot_points=None, plotter=render_now):
+    errors = errors[::-1]
+    if n_plot_points is not None and n_plot_points < percentages.shape[0]:
+        # Decimate the curves, the rejection ratio is computed on the full curves
+        inds = np.round(np.linspace(0, percentages.shape[0] - 1, n_plot_points)).astype(np.int64)
+        percentages, errors, random_rejection, orc = [curve[inds] for curve in
+                                                      [percentages, errors, random_rejection, orc]]
+
+    plotter(plot_rejection_curves, percentages, errors, random_rejection, orc,
+            oracle_path=os.path.join(save_path, f'Rejection-Curve-oracle-{measure_name}.png'),
+            uncertainty_path=os.path.join(save_path,
+                                          f'Rejection-Curve-uncertainty-{measure_name}.png'))
 
 #
 # def reject_MSE(targets, preds, measure, measure_name, save_path, pos_label=1, show=True):
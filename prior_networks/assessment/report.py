@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+
+from prior_networks.assessment.calibration import calibration_metrics
+from prior_networks.assessment.grouped import grouped_classification_metrics, to_json_list
+from prior_networks.assessment.misc_detection import save_misc_curves
+from prior_networks.assessment.ood_detection import sorted_detection_metrics, detection_curves
+from prior_networks.assessment.plotting import render_now, plot_reliability_curve
+from prior_networks.assessment.rejection import sorted_rejection_curves, save_rejection_curves
+
+""" In-domain evaluation in a single pass. Predictions and correctness are computed once, and every
+measure is sorted once for both misclassification detection and rejection. Results are written
+to results.json, and to results.txt in the format of the separate eval_* functions. """
+
+
+def eval_in_domain(labels, probs, uncertainties, save_path, bins=10, n_plot_points=None,
+                   plotter=render_now):
+    """
+    :param labels: array of class labels with shape [n_examples]
+    :param probs: array of probabilities with shape [n_examples, n_classes]
+    :param uncertainties: dictionary of measures with shape [n_examples]. Confidence is high for
+     correct predictions, every other measure is high for misclassifications.
+    :param bins: number of calibration bins
+    :return: the report saved to results.json, with global metrics and per_class lists of the
+     metrics of every class. AUROC, AUPR and calibration errors are fractions, rejection ratios
+     are percentages as in rejection_curves. Undefined metrics, e.g. the misclassification
+     AUROC of a class without errors, are None.
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    preds = np.argmax(probs, axis=1)
+    wrong = np.asarray(labels != preds, dtype=np.int64)
+    n_examples = labels.shape[0]
+    nll = -np.mean(np.log(probs[np.arange(n_examples), np.squeeze(labels)] + 1e-10))
+
+    measures = {}
+    for key, measure in uncertainties.items():
+        # Sorted from the most to the least certain prediction, as in rejection_curves
+        rev = key == 'confidence'
+        order = np.argsort(measure)[::-1] if rev else np.argsort(measure)
+        sorted_wrong = wrong[order]
+
+        # Misclassifications are the positive class, walking from the least certain prediction
+        scores = -measure[order[::-1]] if rev else measure[order[::-1]]
+        metrics, tps, fps, is_end = sorted_detection_metrics(sorted_wrong[np.newaxis, ::-1],
+                                                             scores[np.newaxis].astype(np.float64))
+        save_misc_curves(detection_curves(tps[0], fps[0], is_end[0]), key, save_path,
+                         plotter=plotter)
+
+        rejection_ratio, percentages, errors, random_rejection, orc = \
+            sorted_rejection_curves(np.asarray(sorted_wrong, dtype=np.float64))
+        save_rejection_curves(percentages, errors, random_rejection, orc, key, save_path,
+                              n_plot_points=n_plot_points, plotter=plotter)
+
+        measures[key] = {'misclassification_AUROC': float(metrics['AUROC'][0]),
+                         'misclassification_AUPR': float(metrics['AUPR-Out'][0]),
+                         'rejection_ratio': float(rejection_ratio)}
+
+    calibration = calibration_metrics(labels, probs, bins=bins)
+    accs = np.ones([bins + 1], dtype=np.float32)
+    accs[:-1] = calibration['accuracies']
+    plotter(plot_reliability_curve, np.linspace(0.0, 1.0, bins + 1), accs,
+            path=os.path.join(save_path, 'Reliability Curve'))
+
+    per_class = grouped_classification_metrics(labels, probs, uncertainties, bins=bins)
+    report = {'n_examples': int(n_examples),
+              'classification_error': float(np.mean(wrong)),
+              'NLL': float(nll),
+              'calibration': {key: float(calibration[key])
+                              for key in ['ECE', 'MCE', 'adaptive_ECE', 'classwise_ECE']},
+              'measures': measures,
+              'per_class': {'count': [int(count) for count in per_class['count']],
+                            'error': to_json_list(per_class['error']),
+                            'ECE': to_json_list(per_class['ECE']),
+                            'misclassification_AUROC': {
+                                key: to_json_list(values)
+                                for key, values in per_class['misclassification_AUROC'].items()}}}
+    with open(os.path.join(save_path, 'results.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    # The same lines, in the same order, as eval_ID.py wrote with the separate eval_* functions
+    with open(os.path.join(save_path, 'results.txt'), 'a') as f:
+        f.write(f'Classification Error: {np.round(100 * report["classification_error"], 1)} \n')
+        f.write(f'NLL: {np.round(nll, 3)} \n')
+        for metric, name in [('misclassification_AUPR', 'AUPR'),
+                             ('misclassification_AUROC', 'AUROC')]:
+            for key in measures.keys():
+                f.write(f'{name} using {key}: {np.round(measures[key][metric] * 100.0, 1)}\n')
+        for metric, name in [('ECE', 'ECE'), ('MCE', 'MCE'), ('adaptive_ECE', 'Adaptive ECE'),
+                             ('classwise_ECE', 'Classwise ECE')]:
+            f.write(f'{name}: {np.round(calibration[metric] * 100.0, 2)}\n')
+        for key in measures.keys():
+            f.write(f'Rejection Ratio using {key}: '
+                    f'{np.round(measures[key]["rejection_ratio"], 1)}\n')
+    return report
@@ -0,0 +1,202 @@
+import torch
+
+""" Streaming estimates of detection metrics with constant memory, updated batch by batch """
+
+
+class StreamingAUROC(object):
+    """
+    Estimates AUROC from fixed-bin histograms of the scores of each class. Scores outside of
+    [min_score, max_score] are clipped into the edge bins. Pairs of examples which fall into the
+    same bin are counted as ties, so the estimate differs from the exact AUROC by at most half
+    the fraction of such pairs, which is returned as the error bound. Estimators with the same
+    bins can be merged, e.g. across processes.
+    """
+
+    def __init__(self, n_bins=10000, min_score=0.0, max_score=1.0, device=None):
+        """
+        :param n_bins: number of equal-width bins
+        :param min_score: lower edge of the first bin
+        :param max_score: upper edge of the last bin
+        :param device: device on which the counts are accumulated
+        """
+        assert max_score > min_score
+        self.n_bins = n_bins
+        self.min_score = min_score
+        self.max_score = max_score
+        # Row 0 counts negatives (in-domain), row 1 positives (OOD)
+        self.counts = torch.zeros([2, n_bins], dtype=torch.int64, device=device)
+
+    def update(self, scores, domain_labels):
+        """
+        :param scores: tensor of scores with shape [batch_size], higher for OOD
+        :param domain_labels: tensor of binary labels with shape [batch_size], 1 for OOD
+        """
+        scale = self.n_bins / (self.max_score - self.min_score)
+        bins = torch.floor((scores.to(torch.float64) - self.min_score) * scale).to(torch.int64)
+        bins = torch.clamp(bins, 0, self.n_bins - 1)
+        index = bins + self.n_bins * domain_labels.to(device=bins.device, dtype=torch.int64)
+        self.counts += torch.bincount(index, minlength=2 * self.n_bins).view(2, self.n_bins)
+
+    def merge(self, other):
+        assert (self.n_bins, self.min_score, self.max_score) == \
+               (other.n_bins, other.min_score, other.max_score)
+        self.counts += other.counts.to(self.counts.device)
+        return self
+
+    def compute(self):
+        """
+        :return: AUROC estimate and an upper bound on its absolute error
+        """
+        counts = self.counts.cpu().to(torch.float64)
+        auroc, error = _histogram_auroc(counts[0], counts[1])
+        return auroc.item(), error.item()
+
+
+def _histogram_auroc(neg_counts, pos_counts):
+    """
+    :param neg_counts: tensor of counts of negatives with shape [..., n_bins], in bins of
+     increasing score
+    :param pos_counts: tensor of counts of positives with the same shape and bins
+    :return: tensors of AUROC estimates and upper bounds on their absolute errors, with shape
+     [...]. Pairs in the same bin are counted as ties.
+    """
+    n_pairs = torch.sum(neg_counts, dim=-1) * torch.sum(pos_counts, dim=-1)
+    neg_below = torch.cumsum(neg_counts, dim=-1) - neg_counts
+    ties = torch.sum(pos_counts * neg_counts, dim=-1) / n_pairs
+    return torch.sum(pos_counts * neg_below, dim=-1) / n_pairs + 0.5 * ties, 0.5 * ties
+
+
+class ScoreSketch(object):
+    """
+    Fixed log-spaced histograms of several uncertainty measures, for in-domain and OOD data
+    separately, from which AUROC, FPR@95TPR and histograms are estimated without keeping the
+    scores. Bins are equally spaced in sign(x) * log(1 + |x| / resolution), so each bin spans a
+    relative width of about exp(width) - 1 of its scores, where width is the spacing in the
+    transformed domain, and about resolution * width around zero. Scores outside of
+    [min_score, max_score] are clipped into the edge bins.
+
+    Errors only come from ID and OOD examples sharing a bin: AUROC is within half the fraction of
+    such pairs, and FPR@95TPR within half the fraction of ID examples in the bin where the TPR
+    crosses 0.95. Both bounds are returned. Sketches of shards of the data are combined with
+    merge(), or by summing counts, e.g. with torch.distributed.all_reduce, and taking the
+    minimum and maximum of min_seen and max_seen.
+    """
+
+    def __init__(self, measures, n_bins=10000, min_score=-1e3, max_score=1e3, resolution=1e-6,
+                 device=None):
+        """
+        :param measures: names of the uncertainty measures. As in eval_ood_detect, confidence
+         is higher for in-domain data and every other measure is higher for OOD data.
+        :param n_bins: number of bins
+        :param min_score: lower edge of the first bin
+        :param max_score: upper edge of the last bin
+        :param resolution: scale below which bins are linear rather than logarithmic
+        :param device: device on which the counts are accumulated
+        """
+        assert max_score > min_score and resolution > 0.0
+        self.measures = list(measures)
+        self.n_bins = n_bins
+        self.min_score = min_score
+        self.max_score = max_score
+        self.resolution = resolution
+        # Counts of in-domain (index 0) and OOD (index 1) scores of every measure
+        self.counts = torch.zeros([len(self.measures), 2, n_bins], dtype=torch.int64,
+                                  device=device)
+        self.min_seen = torch.full([len(self.measures)], float('inf'), dtype=torch.float64,
+                                   device=device)
+        self.max_seen = torch.full([len(self.measures)], -float('inf'), dtype=torch.float64,
+                                   device=device)
+
+    def _transform(self, scores):
+        return torch.sign(scores) * torch.log1p(torch.abs(scores) / self.resolution)
+
+    def _inverse_transform(self, values):
+        return torch.sign(values) * torch.expm1(torch.abs(values)) * self.resolution
+
+    def bin_edges(self):
+        """:return: tensor of bin edges with shape [n_bins + 1]"""
+        low, high = self._transform(torch.tensor([self.min_score, self.max_score],
+                                                 dtype=torch.float64))
+        return self._inverse_transform(torch.linspace(low, high, self.n_bins + 1,
+                                                      dtype=torch.float64))
+
+    def update(self, uncertainties, domain_labels):
+        """
+        :param uncertainties: dictionary mapping every measure to a tensor or array of scores
+         with shape [batch_size]
+        :param domain_labels: tensor or array of binary labels with shape [batch_size], 1 for OOD
+        """
+        device = self.counts.device
+        domain_labels = torch.as_tensor(domain_labels, device=device).to(torch.int64)
+        low, high = self._transform(torch.tensor([self.min_score, self.max_score],
+                                                 dtype=torch.float64))
+        scale = self.n_bins / (high - low).item()
+        for i, key in enumerate(self.measures):
+            scores = torch.as_tensor(uncertainties[key], device=device).to(torch.float64)
+            bins = torch.floor((self._transform(scores) - low.item()) * scale).to(torch.int64)
+            bins = torch.clamp(bins, 0, self.n_bins - 1)
+            self.counts[i] += torch.bincount(bins + self.n_bins * domain_labels,
+                                             minlength=2 * self.n_bins).view(2, self.n_bins)
+            if scores.numel() > 0:
+                self.min_seen[i] = torch.min(self.min_seen[i], torch.min(scores))
+                self.max_seen[i] = torch.max(self.max_seen[i], torch.max(scores))
+
+    def merge(self, other):
+        assert (self.measures, self.n_bins, self.min_score, self.max_score, self.resolution) == \
+               (other.measures, other.n_bins, other.min_score, other.max_score, other.resolution)
+        self.counts += other.counts.to(self.counts.device)
+        self.min_seen = torch.min(self.min_seen, other.min_seen.to(self.min_seen.device))
+        self.max_seen = torch.max(self.max_seen, other.max_seen.to(self.max_seen.device))
+        return self
+
+    def _oriented_counts(self):
+        """In-domain and OOD counts of every measure, ordered by decreasing evidence of OOD."""
+        counts = self.counts.cpu().to(torch.float64)
+        flip = torch.tensor([key != 'confidence' for key in self.measures])
+        counts = torch.where(flip[:, None, None], torch.flip(counts, dims=[2]), counts)
+        return counts[:, 0], counts[:, 1]
+
+    def auroc(self):
+        """
+        :return: dictionary mapping measures to AUROC estimates and their maximum absolute error
+        """
+        neg_counts, pos_counts = self._oriented_counts()
+        # Bins are ordered from most to least OOD, the reverse of the order of _histogram_auroc
+        aurocs, errors = _histogram_auroc(torch.flip(neg_counts, dims=[1]),
+                                          torch.flip(pos_counts, dims=[1]))
+        return {key: (aurocs[i].item(), errors[i].item()) for i, key in enumerate(self.measures)}
+
+    def fpr_at_95_tpr(self):
+        """
+        :return: dictionary mapping measures to FPR@95TPR estimates and their maximum absolute
+         error
+        """
+        neg_counts, pos_counts = self._oriented_counts()
+        tpr = torch.cumsum(pos_counts, dim=1) / torch.sum(pos_counts, dim=1, keepdim=True)
+        fpr = torch.cumsum(neg_counts, dim=1) / torch.sum(neg_counts, dim=1, keepdim=True)
+        # The exact threshold lies within the first bin at which the TPR reaches 0.95
+        crossing = torch.argmax((tpr >= 0.95).to(torch.int64), dim=1, keepdim=True)
+        upper = torch.gather(fpr, 1, crossing)[:, 0]
+        lower = upper - torch.gather(neg_counts, 1, crossing)[:, 0] \
+            / torch.sum(neg_counts, dim=1)
+        return {key: (0.5 * (upper[i] + lower[i]).item(), 0.5 * (upper[i] - lower[i]).item())
+                for i, key in enumerate(self.measures)}
+
+    def histogram(self, measure, bins=50):
+        """
+        Re-bins the counts of a measure into equal-width bins between the smallest and largest
+        scores seen, as plot_histogram does. Counts are assigned by the centre of their sketch
+        bin, so each can be off by the examples in the one sketch bin straddling an edge.
+
+        :return: array of bin edges with shape [bins + 1], and arrays of in-domain and OOD
+         counts with shape [bins]
+        """
+        i = self.measures.index(measure)
+        min_seen, max_seen = self.min_seen[i].item(), self.max_seen[i].item()
+        sketch_edges = self.bin_edges()
+        centres = torch.clamp(0.5 * (sketch_edges[1:] + sketch_edges[:-1]), min_seen, max_seen)
+        edges = torch.linspace(min_seen, max_seen, bins + 1, dtype=torch.float64)
+        inds = torch.clamp(torch.bucketize(centres, edges, right=True) - 1, 0, bins - 1)
+        counts = torch.zeros([2, bins], dtype=torch.int64)
+        counts.index_add_(1, inds, self.counts[i].cpu())
+        return edges.numpy(), counts[0].numpy(), counts[1].numpy()
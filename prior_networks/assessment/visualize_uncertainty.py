@@ -1,19 +1,14 @@
 import os
 
-import matplotlib
-
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
 
-sns.set()
-sns.set(font_scale=1.25)
+from prior_networks.assessment.plotting import get_pyplot
 
 
 def plot_histogram(uncertainty_measure, measure_name, ood_uncertainty_measure, save_path=None,
                    log=False, show=True,
                    bins=50, misc=False):
+    plt = get_pyplot()
     uncertainty_measure = np.asarray(uncertainty_measure, dtype=np.float128)
     ood_uncertainty_measure = np.asarray(ood_uncertainty_measure, dtype=np.float128)
     # print measure_name
@@ -22,7 +17,19 @@ def plot_histogram(uncertainty_measure, measure_name, ood_uncertainty_measure, s
     max_score = np.max(scores)
     plt.hist(uncertainty_measure, bins=bins / 2, range=(min_score, max_score), alpha=0.4)
     plt.hist(ood_uncertainty_measure, bins=bins / 2, range=(min_score, max_score), alpha=0.4)
+    _save_histogram(plt, measure_name, save_path, log=log, misc=misc)
+
+
+def plot_sketch_histogram(sketch, measure_name, save_path=None, log=False, bins=50, misc=False):
+    """Plots the same histogram as plot_histogram from a ScoreSketch, without the scores."""
+    plt = get_pyplot()
+    edges, counts, ood_counts = sketch.histogram(measure_name, bins=bins // 2)
+    plt.hist(edges[:-1], bins=edges, weights=counts, alpha=0.4)
+    plt.hist(edges[:-1], bins=edges, weights=ood_counts, alpha=0.4)
+    _save_histogram(plt, measure_name, save_path, log=log, misc=misc)
+
 
+def _save_histogram(plt, measure_name, save_path, log, misc):
     if misc == True:
         plt.legend(['Correct', 'Misclassified'])
     else:
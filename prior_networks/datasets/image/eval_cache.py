@@ -0,0 +1,137 @@
+"""
+On-disk cache of evaluation inputs. The eval transforms of construct_transforms are
+deterministic, so the resized and cropped images of a split are stored once as a memory-mapped
+uint8 array and normalised when read, which gives the same tensors as the transforms without
+decoding any image again.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from prior_networks.datasets.image.manifest import temporary_path, watched_fingerprint
+
+# Increment when the eval transforms change, so that stale caches are not used
+CACHE_VERSION = 1
+
+
+def data_fingerprint(dataset):
+    """
+    :return: relative paths and mtimes of the files and directories watched by dataset, which
+     change when its images are added, removed or replaced. Datasets without watched paths are
+     fingerprinted by their root directory only.
+    """
+    watched = getattr(dataset, 'watched', [dataset.root])
+    paths, mtimes = watched_fingerprint(dataset.root, watched)
+    return {'paths': paths.tolist(), 'mtimes': mtimes.tolist()}
+
+
+def eval_cache_paths(cache_dir, dataset, data_path, split, n_in, fingerprint=None):
+    """
+    :param fingerprint: data_fingerprint of the dataset, so that caches of modified data are
+     not used
+    :return: paths of the images and targets cached for the eval transforms of a dataset in
+     data_path. Normalisation is applied when reading, so a cache serves every mean and std.
+    """
+    key = json.dumps({'dataset': dataset, 'data_path': os.path.abspath(data_path),
+                      'split': split, 'n_in': n_in, 'fingerprint': fingerprint,
+                      'version': CACHE_VERSION}, sort_keys=True)
+    name = f'{dataset}-{split}-{n_in}-{hashlib.sha1(key.encode()).hexdigest()[:12]}'
+    return (os.path.join(cache_dir, name + '.images.npy'),
+            os.path.join(cache_dir, name + '.targets.npy'))
+
+
+def build_eval_cache(dataset, images_path, targets_path, batch_size=256, num_workers=4):
+    """
+    Applies the eval transforms, without normalisation, to every item of dataset and saves the
+    uint8 images and the targets. Files are renamed once complete.
+
+    :param dataset: dataset constructed with construct_transforms(n_in, mode='eval'), i.e. with
+     a mean of 0 and a std of 1
+    """
+    from torch.utils.data import DataLoader
+
+    if len(dataset) == 0:
+        raise ValueError(f'Cannot cache the eval inputs of an empty dataset in {images_path}')
+    os.makedirs(os.path.dirname(images_path), exist_ok=True)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    images, targets, start = None, np.zeros(len(dataset), dtype=np.int64), 0
+    tmp_images_path, tmp_targets_path = temporary_path(images_path), temporary_path(targets_path)
+    for inputs, labels in loader:
+        if images is None:
+            images = np.lib.format.open_memmap(tmp_images_path, mode='w+', dtype=np.uint8,
+                                               shape=(len(dataset),) + tuple(inputs.shape[1:]))
+        # ToTensor divides by 255 exactly, so rounding recovers the uint8 pixels
+        images[start:start + inputs.shape[0]] = torch.round(inputs * 255.0).to(torch.uint8).numpy()
+        targets[start:start + inputs.shape[0]] = labels.numpy()
+        start += inputs.shape[0]
+    images.flush()
+    del images
+
+    with open(tmp_targets_path, 'wb') as f:
+        np.save(f, targets)
+    os.replace(tmp_images_path, images_path)
+    os.replace(tmp_targets_path, targets_path)
+
+
+class CachedEvalDataset(Dataset):
+    """Normalised inputs and targets read from an eval cache, mapped lazily in every worker."""
+
+    def __init__(self, images_path, targets_path, mean, std):
+        self.images_path = images_path
+        self.targets = torch.from_numpy(np.load(targets_path))
+        self.mean = torch.tensor(mean, dtype=torch.float32).view(-1, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32).view(-1, 1, 1)
+        self._images = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def __getitem__(self, index):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode='r')
+        # The same operations as ToTensor and Normalize
+        image = torch.from_numpy(np.array(self._images[index])).to(torch.float32).div(255)
+        return (image - self.mean) / self.std, self.targets[index]
+
+    def __len__(self):
+        return self.targets.shape[0]
+
+
+def load_eval_dataset(dataset, data_path, n_in, mean, std, split='test', cache_dir=None,
+                      num_workers=4):
+    """
+    Constructs a dataset with the eval transforms. If cache_dir is set, reads the inputs from
+    the cache in cache_dir, which is built on first use and rebuilt when the data changes.
+
+    :param dataset: name of the dataset in DATASET_DICT
+    :return: dataset of normalised inputs and targets
+    """
+    from prior_networks.datasets.image import construct_transforms
+    from prior_networks.util_pytorch import DATASET_DICT
+
+    if cache_dir is None:
+        return DATASET_DICT[dataset](root=data_path,
+                                     transform=construct_transforms(n_in=n_in, mean=mean,
+                                                                    std=std, mode='eval'),
+                                     target_transform=None,
+                                     download=True,
+                                     split=split)
+
+    # Constructed before the lookup, as the paths it watches key the cache
+    data = DATASET_DICT[dataset](root=data_path,
+                                 transform=construct_transforms(n_in=n_in, mode='eval'),
+                                 target_transform=None,
+                                 download=True,
+                                 split=split)
+    images_path, targets_path = eval_cache_paths(cache_dir, dataset, data_path, split, n_in,
+                                                 fingerprint=data_fingerprint(data))
+    if not (os.path.isfile(images_path) and os.path.isfile(targets_path)):
+        print(f'Caching eval inputs of {dataset} in {images_path}...')
+        build_eval_cache(data, images_path, targets_path, num_workers=num_workers)
+    return CachedEvalDataset(images_path, targets_path, mean=mean, std=std)
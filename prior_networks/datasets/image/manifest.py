@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+"""
+Manifests of the samples of directory-based datasets. Listing and sorting every class directory
+is slow on network filesystems, so the (path, target) samples of a split are saved once in the
+dataset root and read back by every later construction, as long as the modification times of
+the watched directories, which change when files are added or removed, are unchanged. Packed
+stores and eval caches are validated by the same fingerprint of watched directories.
+"""
+
+
+def manifest_path(root, split, class_to_idx, extensions):
+    """:return: path of the manifest of a split with the given classes and file extensions"""
+    key = json.dumps({'class_to_idx': class_to_idx, 'extensions': list(extensions)},
+                     sort_keys=True)
+    return os.path.join(root, 'manifests',
+                        f'{split}-{hashlib.sha1(key.encode()).hexdigest()[:12]}.npz')
+
+
+def temporary_path(path):
+    """
+    :return: path of a new empty file in the directory of path, unique to the calling process,
+     to be renamed to path once written
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path))
+    os.close(fd)
+    return tmp_path
+
+
+def watched_fingerprint(root, watched):
+    """
+    :param watched: paths of directories and files, such as those listed by make_dataset
+    :return: array of the watched paths relative to root, and array of their modification times
+     in ns, -1 for missing paths
+    """
+    return (np.array([os.path.relpath(path, root) for path in watched]),
+            np.array([os.stat(path).st_mtime_ns if os.path.exists(path) else -1
+                      for path in watched], dtype=np.int64))
+
+
+def fingerprint_matches(saved, current):
+    """
+    :param saved: (relative paths, modification times) of a saved watched_fingerprint
+    :param current: watched_fingerprint of the paths to check, which may be a subset of the
+     saved paths
+    :return: whether every current path is saved, with an unchanged modification time
+    """
+    mtime_of = dict(zip(saved[0].tolist(), saved[1].tolist()))
+    return all(path in mtime_of and mtime_of[path] == mtime
+               for path, mtime in zip(current[0].tolist(), current[1].tolist()))
+
+
+def load_samples(root, split, make_dataset, dir, class_to_idx, extensions, watched):
+    """
+    Reads the samples of a split from its manifest, or makes them with make_dataset and saves
+    the manifest if it is missing or out of date. If the root is read-only, samples are made
+    on every call.
+
+    :param make_dataset: function making samples, such as make_dataset_TIM
+    :param dir: directory of the split, passed to make_dataset
+    :param watched: paths of the directories and files whose contents make_dataset lists
+    :return: list of (path, target) samples, identical to make_dataset(dir, class_to_idx,
+     extensions)
+    """
+    path = manifest_path(root, split, class_to_idx, extensions)
+    relative_watched, mtimes = watched_fingerprint(root, watched)
+    if os.path.isfile(path):
+        with np.load(path) as manifest:
+            if fingerprint_matches((manifest['watched'], manifest['mtimes']),
+                                   (relative_watched, mtimes)):
+                return [(os.path.join(root, p), t) for p, t in
+                        zip(manifest['paths'].tolist(), manifest['targets'].tolist())]
+
+    samples = make_dataset(dir, class_to_idx, extensions)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = temporary_path(path)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     paths=np.array([os.path.relpath(p, root) for p, _ in samples]),
+                     targets=np.array([t for _, t in samples], dtype=np.int64),
+                     watched=relative_watched,
+                     mtimes=mtimes)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f'Could not save manifest {path}: {e}')
+    return samples
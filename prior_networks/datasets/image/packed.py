@@ -0,0 +1,145 @@
+"""
+Packed image stores for folder-based datasets. A one-time packer decodes every image of a split
+into a contiguous uint8 array, saved as a .npy file which is memory mapped when reading, and an
+index of the relative paths of the images. Datasets which find a store covering all their
+samples read slices of it instead of opening and decoding a file per item, and DataLoader
+workers share the mapped pages. The index also records the modification times of the watched
+directories of the dataset, as its manifest does, so a store is not used once images are added,
+removed or replaced by renaming, without a stat of every image.
+"""
+import argparse
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+from prior_networks.datasets.image.manifest import temporary_path, watched_fingerprint, \
+    fingerprint_matches
+
+
+def packed_paths(root, split):
+    """:return: paths of the image array and index of a split of the dataset in root"""
+    return (os.path.join(root, 'packed', f'{split}.images.npy'),
+            os.path.join(root, 'packed', f'{split}.index.npz'))
+
+
+def _decode(path):
+    with open(path, 'rb') as f:
+        return np.asarray(Image.open(f).convert('RGB'), dtype=np.uint8)
+
+
+def pack_images(root, split, samples, watched, n_workers=4, chunksize=64):
+    """
+    Decodes the images of samples into a packed store of the split. Files are written under
+    temporary names and renamed once complete, so an interrupted run leaves no store behind.
+
+    :param root: root directory of the dataset, which contains the paths of the samples
+    :param split: name of the split
+    :param samples: list of (path, target) pairs, as the samples of the datasets
+    :param watched: paths of the directories listing the samples, as the watched of the dataset
+    :param n_workers: number of processes decoding images
+    """
+    images_path, index_path = packed_paths(root, split)
+    os.makedirs(os.path.dirname(images_path), exist_ok=True)
+    paths = [path for path, _ in samples]
+    shape = _decode(paths[0]).shape
+    # Taken before decoding, so that images added or removed meanwhile invalidate the store
+    relative_watched, mtimes = watched_fingerprint(root, watched)
+
+    tmp_images_path = temporary_path(images_path)
+    images = np.lib.format.open_memmap(tmp_images_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(paths),) + shape)
+    with Pool(n_workers) as pool:
+        for i, image in enumerate(pool.imap(_decode, paths, chunksize=chunksize)):
+            if image.shape != shape:
+                raise ValueError(f'Cannot pack {paths[i]} with shape {image.shape}, '
+                                 f'other images have shape {shape}')
+            images[i] = image
+    images.flush()
+    del images
+
+    relative_paths = np.array([os.path.relpath(path, root) for path in paths])
+    tmp_index_path = temporary_path(index_path)
+    with open(tmp_index_path, 'wb') as f:
+        np.savez(f, paths=relative_paths, watched=relative_watched, mtimes=mtimes)
+    os.replace(tmp_images_path, images_path)
+    os.replace(tmp_index_path, index_path)
+
+
+class PackedImages(object):
+    """
+    Images of a list of samples in a packed store. The array is mapped on first access, so that
+    every DataLoader worker maps the file instead of receiving a pickled copy.
+    """
+
+    def __init__(self, images_path, rows):
+        self.images_path = images_path
+        self.rows = rows
+        self._images = None
+
+    @classmethod
+    def load(cls, root, split, samples, watched):
+        """
+        :param watched: paths of the directories listing the samples, as the watched of the
+         dataset
+        :return: PackedImages of the samples, or None if there is no store of the split which
+         contains all of them, packed since the watched directories last changed
+        """
+        images_path, index_path = packed_paths(root, split)
+        if not (os.path.isfile(images_path) and os.path.isfile(index_path)):
+            return None
+        with np.load(index_path) as index:
+            if 'watched' not in index or not fingerprint_matches(
+                    (index['watched'], index['mtimes']), watched_fingerprint(root, watched)):
+                return None
+            row_of = {path: row for row, path in enumerate(index['paths'].tolist())}
+        try:
+            rows = np.array([row_of[os.path.relpath(path, root)] for path, _ in samples],
+                            dtype=np.int64)
+        except KeyError:
+            return None
+        return cls(images_path, rows)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def __getitem__(self, index):
+        """:return: PIL image of the sample at index"""
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode='r')
+        return Image.fromarray(self._images[self.rows[index]])
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+
+parser = argparse.ArgumentParser(description='Packs the images of a folder-based dataset into a '
+                                             'memory-mapped store, used automatically when the '
+                                             'dataset is loaded.')
+parser.add_argument('data_path', type=str,
+                    help='Path where data is saved')
+parser.add_argument('dataset', choices=['TIM', 'TIM-OOD'],
+                    help='Specify name of dataset to pack.')
+parser.add_argument('--split', choices=['train', 'val'], action='append',
+                    help='Splits to pack. Packs all if not set.')
+parser.add_argument('--n_workers', type=int, default=4,
+                    help='Number of processes decoding images.')
+
+
+def main():
+    from prior_networks.util_pytorch import DATASET_DICT
+
+    args = parser.parse_args()
+    for split in args.split or ['train', 'val']:
+        dataset = DATASET_DICT[args.dataset](root=args.data_path, transform=None,
+                                             target_transform=None, split=split)
+        print(f'Packing {len(dataset.samples)} images of the {split} split...')
+        pack_images(dataset.root, split, dataset.samples, dataset.watched,
+                    n_workers=args.n_workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ A number of classes that transform the torch vision datasets into a standard for
 usable for uncertainty (e.g. out-of-domain vs. in-domain) experimentation.
 """
 #import context
+import torch
 import torchvision
 import sys
 from torchvision.datasets import DatasetFolder
@@ -12,6 +13,10 @@ from PIL import Image
 from torchvision.datasets.folder import *
 import torchvision.datasets as datasets
 
+from .manifest import load_samples
+from .packed import PackedImages
+from .tensor_transforms import TensorImagesMixin
+
 split_options = ['train', 'val', 'test']
 
 
@@ -77,7 +82,13 @@ def construct_transforms(n_in: int,
     return transforms.Compose(transf_list)
 
 
-class MNIST(torchvision.datasets.MNIST):
+def watched_files(dir):
+    """:return: dir and the files in it, whose mtimes change when the data is replaced"""
+    return [dir] + [os.path.join(dir, name) for name in sorted(os.listdir(dir))
+                    if os.path.isfile(os.path.join(dir, name))]
+
+
+class MNIST(TensorImagesMixin, torchvision.datasets.MNIST):
     def __init__(self, root, transform, target_transform, download, split):
         assert split in split_options
         train = False
@@ -89,9 +100,11 @@ class MNIST(torchvision.datasets.MNIST):
                          transform=transform,
                          target_transform=target_transform,
                          train=train)
+        self.watched = watched_files(self.raw_folder)
+        self._setup_tensor_images(lambda: self.data.unsqueeze(1), self.targets)
 
 
-class FashionMNIST(torchvision.datasets.FashionMNIST):
+class FashionMNIST(TensorImagesMixin, torchvision.datasets.FashionMNIST):
     def __init__(self, root, transform, target_transform, download, split):
         assert split in split_options
         train = False
@@ -103,9 +116,11 @@ class FashionMNIST(torchvision.datasets.FashionMNIST):
                          transform=transform,
                          target_transform=target_transform,
                          train=train)
+        self.watched = watched_files(self.raw_folder)
+        self._setup_tensor_images(lambda: self.data.unsqueeze(1), self.targets)
 
 
-class KMNIST(torchvision.datasets.KMNIST):
+class KMNIST(TensorImagesMixin, torchvision.datasets.KMNIST):
     def __init__(self, root, transform, target_transform, download, split):
         assert split in split_options
         train = False
@@ -117,6 +132,8 @@ class KMNIST(torchvision.datasets.KMNIST):
                          transform=transform,
                          target_transform=target_transform,
                          train=train)
+        self.watched = watched_files(self.raw_folder)
+        self._setup_tensor_images(lambda: self.data.unsqueeze(1), self.targets)
 
 
 class EMNIST(torchvision.datasets.EMNIST):
@@ -160,7 +177,7 @@ class Omniglot(torchvision.datasets.Omniglot):
                          background=train)
 
 
-class CIFAR10(torchvision.datasets.CIFAR10):
+class CIFAR10(TensorImagesMixin, torchvision.datasets.CIFAR10):
     mean = (0.4914, 0.4823, 0.4465)
     std = (0.247, 0.243, 0.261)
 
@@ -177,9 +194,12 @@ class CIFAR10(torchvision.datasets.CIFAR10):
                          transform=transform,
                          target_transform=target_transform,
                          train=train)
+        self.watched = watched_files(os.path.join(self.root, self.base_folder))
+        self._setup_tensor_images(
+            lambda: torch.from_numpy(self.data).permute(0, 3, 1, 2).contiguous(), self.targets)
 
 
-class CIFAR100(torchvision.datasets.CIFAR100):
+class CIFAR100(TensorImagesMixin, torchvision.datasets.CIFAR100):
     # mean = (0.5071, 0.4865, 0.4409)
     # std = (0.267, 0.256, 0.276)
     mean = (0.4914, 0.4823, 0.4465)
@@ -196,9 +216,12 @@ class CIFAR100(torchvision.datasets.CIFAR100):
                          transform=transform,
                          target_transform=target_transform,
                          train=train)
+        self.watched = watched_files(os.path.join(self.root, self.base_folder))
+        self._setup_tensor_images(
+            lambda: torch.from_numpy(self.data).permute(0, 3, 1, 2).contiguous(), self.targets)
 
 
-class SVHN(torchvision.datasets.SVHN):
+class SVHN(TensorImagesMixin, torchvision.datasets.SVHN):
     def __init__(self, root, transform, target_transform, download, split):
         assert split in split_options
         if split == 'val':
@@ -209,6 +232,8 @@ class SVHN(torchvision.datasets.SVHN):
                          download=download,
                          transform=transform,
                          target_transform=target_transform)
+        self.watched = [os.path.join(self.root, self.filename)]
+        self._setup_tensor_images(lambda: torch.from_numpy(self.data), self.labels)
 
 
 class ImageNet(torchvision.datasets.ImageNet):
@@ -267,13 +292,19 @@ class TinyImageNet(datasets.VisionDataset):
         self.target_transform = target_transform
         classes, class_to_idx = self._find_classes(self.root)
         if split == 'train':
-            samples = make_dataset_TIM(os.path.join(self.root, 'train'),
-                                       class_to_idx,
-                                       extensions)
+            self.watched = watched_TIM(os.path.join(self.root, 'train'), class_to_idx)
+            samples = load_samples(self.root, split, make_dataset_TIM,
+                                   os.path.join(self.root, 'train'),
+                                   class_to_idx,
+                                   extensions,
+                                   watched=self.watched)
         else:
-            samples = make_dataset_TIM_val(os.path.join(self.root, 'val'),
-                                           class_to_idx,
-                                           extensions)
+            self.watched = watched_TIM_val(os.path.join(self.root, 'val'))
+            samples = load_samples(self.root, split, make_dataset_TIM_val,
+                                   os.path.join(self.root, 'val'),
+                                   class_to_idx,
+                                   extensions,
+                                   watched=self.watched)
         if len(samples) == 0:
             raise (RuntimeError("Found 0 files in subfolders of: " + self.root + "\n"
                                                                                  "Supported extensions are: " + ",".join(
@@ -286,6 +317,9 @@ class TinyImageNet(datasets.VisionDataset):
         self.class_to_idx = class_to_idx
         self.samples = samples
         self.targets = [s[1] for s in samples]
+        # Decoded images packed by datasets/image/packed.py, if any
+        self.packed = PackedImages.load(self.root, split, samples, self.watched) \
+            if loader is default_loader else None
 
     def _find_classes(self, dir):
         """
@@ -317,7 +351,10 @@ class TinyImageNet(datasets.VisionDataset):
             tuple: (sample, target) where target is class_index of the target class.
         """
         path, target = self.samples[index]
-        sample = self.loader(path)
+        if self.packed is not None:
+            sample = self.packed[index]
+        else:
+            sample = self.loader(path)
         if self.transform is not None:
             sample = self.transform(sample)
         if self.target_transform is not None:
@@ -357,6 +394,16 @@ def make_dataset_TIM_val(dir, class_to_idx, extensions=None, is_valid_file=None)
     return images
 
 
+def watched_TIM_val(dir):
+    """:return: paths listed by make_dataset_TIM_val, which validate its manifest"""
+    return [os.path.join(dir, 'val_annotations.txt'), os.path.join(dir, 'images')]
+
+
+def watched_TIM(dir, class_to_idx):
+    """:return: paths listed by make_dataset_TIM, which validate its manifest"""
+    return [os.path.join(dir, target + '/images') for target in sorted(class_to_idx.keys())]
+
+
 def make_dataset_TIM(dir, class_to_idx, extensions=None, is_valid_file=None):
     images = []
     dir = os.path.expanduser(dir)
@@ -400,14 +447,12 @@ class TinyImageNetConverse(datasets.VisionDataset):
         self.transform = transform
         self.target_transform = target_transform
         classes, class_to_idx = self._find_classes(self.root, subset)
-        if split == 'train':
-            samples = make_dataset_TIM(os.path.join(self.root, 'train'),
-                                       class_to_idx,
-                                       extensions)
-        else:
-            samples = make_dataset_TIM(os.path.join(self.root, 'val'),
-                                           class_to_idx,
-                                           extensions)
+        self.watched = watched_TIM(os.path.join(self.root, split), class_to_idx)
+        samples = load_samples(self.root, split, make_dataset_TIM,
+                               os.path.join(self.root, split),
+                               class_to_idx,
+                               extensions,
+                               watched=self.watched)
         if len(samples) == 0:
             raise (RuntimeError("Found 0 files in subfolders of: " + self.root + "\n"
                                                                                  "Supported extensions are: " + ",".join(
@@ -420,6 +465,9 @@ class TinyImageNetConverse(datasets.VisionDataset):
         self.class_to_idx = class_to_idx
         self.samples = samples
         self.targets = [s[1] for s in samples]
+        # Decoded images packed by datasets/image/packed.py, if any
+        self.packed = PackedImages.load(self.root, split, samples, self.watched) \
+            if loader is default_loader else None
 
     def _find_classes(self, dir, subset):
         """
@@ -454,7 +502,10 @@ class TinyImageNetConverse(datasets.VisionDataset):
             tuple: (sample, target) where target is class_index of the target class.
         """
         path, target = self.samples[index]
-        sample = self.loader(path)
+        if self.packed is not None:
+            sample = self.packed[index]
+        else:
+            sample = self.loader(path)
         if self.transform is not None:
             sample = self.transform(sample)
         if self.target_transform is not None:
@@ -0,0 +1,273 @@
+import math
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data.dataloader import default_collate
+from torchvision import transforms
+from torchvision.transforms import InterpolationMode
+import torchvision.transforms.functional as TF
+
+"""
+The transforms of construct_transforms as tensor ops on uint8 images. Datasets which hold their
+images in memory (MNIST, FashionMNIST, KMNIST, CIFAR10, CIFAR100 and SVHN) apply the
+deterministic resize, and centre crop in eval mode, to all their images once when constructed,
+and only the random augmentation and normalisation per item, without converting to PIL images.
+With batched transforms, items are prepared uint8 images and BatchAugmentation applies the
+random augmentation and normalisation to whole batches in the collate function.
+"""
+
+
+class TensorTransforms(object):
+    """
+    Transforms equivalent to construct_transforms with the same arguments. Images are uint8
+    tensors with shape [C, H, W], or [N, C, H, W] in prepare. PIL images are converted to tensors,
+    so any dataset may use these transforms. If batched, items are left as uint8 images and
+    collate must be the collate_fn of the DataLoader.
+    """
+
+    def __init__(self, n_in, mode, mean=(0.0, 0.0, 0.0), std=(1.0, 1.0, 1.0), augment=False,
+                 rotation=False, jitter=0.0, batched=False):
+        assert mode in ['train', 'eval', 'ood']
+        assert not jitter < 0.0
+        deterministic = [transforms.Resize(n_in, InterpolationMode.BICUBIC, antialias=True)]
+        random = []
+        if augment and mode != 'eval':
+            random.append(transforms.Pad(4, padding_mode='reflect'))
+            if rotation:
+                # Rotation of tensors only supports nearest and bilinear interpolation
+                random.append(transforms.RandomRotation(degrees=15,
+                                                        interpolation=InterpolationMode.BILINEAR))
+            random.extend([transforms.ColorJitter(jitter, jitter, jitter, jitter),
+                           transforms.RandomHorizontalFlip()])
+            if mode == 'ood':
+                random.append(transforms.RandomVerticalFlip())
+            random.append(transforms.RandomCrop(n_in))
+            if batched:
+                # Images are stacked before the batched crop, so non-square images are cropped
+                # to n_in first, and the random crop only shifts them by up to the padding
+                deterministic.append(transforms.CenterCrop(n_in))
+        else:
+            deterministic.append(transforms.CenterCrop(n_in))
+
+        self.n_in = n_in
+        self.deterministic = transforms.Compose(deterministic)
+        self.random = transforms.Compose(random)
+        self.mean = torch.tensor(mean, dtype=torch.float32).view(-1, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32).view(-1, 1, 1)
+        self.batched = batched
+        self.collate = BatchAugmentation(n_in, mode, mean=mean, std=std, augment=augment,
+                                         rotation=rotation, jitter=jitter) if batched else None
+
+    def prepare(self, images, chunk_size=1024):
+        """
+        :param images: uint8 tensor of images with shape [N, C, H, W]
+        :return: uint8 tensor of the images after the deterministic transforms
+        """
+        return torch.cat([self.deterministic(images[start:start + chunk_size])
+                          for start in range(0, images.shape[0], chunk_size)], dim=0)
+
+    def finish(self, image):
+        """
+        :return: normalised float image after the random transforms of a prepared image, or the
+         prepared image if batched
+        """
+        if self.batched:
+            return image
+        image = self.random(image).to(torch.float32).div(255)
+        return (image - self.mean) / self.std
+
+    def __call__(self, image):
+        if isinstance(image, Image.Image):
+            image = TF.pil_to_tensor(image)
+        return self.finish(self.deterministic(image))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.deterministic}, {self.random})'
+
+
+def construct_tensor_transforms(n_in: int,
+                                mode: str,
+                                mean: tuple = (0.0, 0.0, 0.0),
+                                std: tuple = (1.0, 1.0, 1.0),
+                                augment: bool = False,
+                                rotation: bool = False,
+                                jitter: float = 0.0,
+                                batched: bool = False):
+    """
+    Tensor version of construct_transforms, with the same arguments.
+
+    :param batched: whether to augment whole batches in the collate function
+    :return: TensorTransforms
+    """
+    return TensorTransforms(n_in=n_in, mode=mode, mean=mean, std=std, augment=augment,
+                            rotation=rotation, jitter=jitter, batched=batched)
+
+
+def _grayscale(images):
+    if images.shape[1] == 1:
+        return images
+    r, g, b = images.unbind(dim=1)
+    return (0.2989 * r + 0.587 * g + 0.114 * b).unsqueeze(1)
+
+
+def _rgb_to_hsv(images):
+    max_c, min_c = images.max(dim=1).values, images.min(dim=1).values
+    r, g, b = images.unbind(dim=1)
+    delta = max_c - min_c
+    # Hue and saturation are 0 for greys, which have max_c == min_c
+    safe_delta = torch.where(delta > 0, delta, torch.ones_like(delta))
+    saturation = delta / torch.where(max_c > 0, max_c, torch.ones_like(max_c))
+    hue = torch.where(max_c == r, (g - b) / safe_delta,
+                      torch.where(max_c == g, 2.0 + (b - r) / safe_delta,
+                                  4.0 + (r - g) / safe_delta))
+    hue = torch.where(delta > 0, torch.remainder(hue / 6.0, 1.0), torch.zeros_like(hue))
+    return hue, saturation, max_c
+
+
+def _hsv_to_rgb(hue, saturation, value):
+    # Standard formula: channel n is v - v * s * clamp(min(k, 4 - k), 0, 1),
+    # with k = (n + 6 * h) mod 6 for n = 5, 3 and 1
+    n = torch.tensor([5.0, 3.0, 1.0], device=hue.device).view(1, 3, 1, 1)
+    k = torch.remainder(n + 6.0 * hue.unsqueeze(1), 6.0)
+    weight = torch.clamp(torch.min(k, 4.0 - k), 0.0, 1.0)
+    return value.unsqueeze(1) * (1.0 - saturation.unsqueeze(1) * weight)
+
+
+def _uniform(n, low, high):
+    return torch.empty(n).uniform_(low, high).view(n, 1, 1, 1)
+
+
+class BatchAugmentation(object):
+    """
+    Collate function applying the random transforms of construct_transforms, and normalisation,
+    to a whole batch of uint8 images with random parameters per image. Reflection padding,
+    cropping and flips are a single gather of the pixels of every image. Rotation is a batched
+    affine resampling and colour jitter is computed on the whole batch, with a fixed order of
+    brightness, contrast, saturation and hue instead of a random order per image.
+    """
+
+    def __init__(self, n_in, mode, mean=(0.0, 0.0, 0.0), std=(1.0, 1.0, 1.0), augment=False,
+                 rotation=False, jitter=0.0, padding=4):
+        assert mode in ['train', 'eval', 'ood']
+        assert not jitter < 0.0
+        self.n_in = n_in
+        self.augment = augment and mode != 'eval'
+        self.vertical_flip = mode == 'ood'
+        self.rotation = rotation
+        self.jitter = jitter
+        self.padding = padding
+        self.mean = torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+
+    def __call__(self, batch):
+        """
+        :param batch: list of (image, target) items, where images are uint8 tensors with shape
+         [C, n_in, n_in]
+        :return: normalised float images with shape [N, C, n_in, n_in] and collated targets
+        """
+        shapes = set(tuple(image.shape) for image, _ in batch)
+        assert len(shapes) == 1, f'Images of a batch must have the same shape, got {shapes}. ' \
+                                 f'Prepare them with a batched TensorTransforms.'
+        images = torch.stack([image for image, _ in batch], dim=0)
+        targets = default_collate([target for _, target in batch])
+        if self.augment:
+            images = self._pad_rotate_crop_flip(images)
+            images = images.to(torch.float32).div_(255)
+            if self.jitter > 0.0:
+                images = self._colour_jitter(images)
+        else:
+            images = images.to(torch.float32).div_(255)
+        return (images - self.mean) / self.std, targets
+
+    def _pad_rotate_crop_flip(self, images):
+        n, _, height, width = images.shape
+        # Rows and columns of the crops, and flips, in coordinates of the padded images
+        top = torch.randint(0, height + 2 * self.padding - self.n_in + 1, (n, 1))
+        left = torch.randint(0, width + 2 * self.padding - self.n_in + 1, (n, 1))
+        rows = top + torch.arange(self.n_in).view(1, -1)
+        cols = left + torch.arange(self.n_in).view(1, -1)
+        cols = torch.where(torch.rand(n, 1) < 0.5, cols.flip(1), cols)
+        if self.vertical_flip:
+            rows = torch.where(torch.rand(n, 1) < 0.5, rows.flip(1), rows)
+
+        if self.rotation:
+            # Padded images are only materialised to be rotated
+            padded_rows = self._reflect(torch.arange(height + 2 * self.padding) - self.padding,
+                                        height)
+            padded_cols = self._reflect(torch.arange(width + 2 * self.padding) - self.padding,
+                                        width)
+            images = self._rotate(images[:, :, padded_rows][:, :, :, padded_cols].to(torch.float32))
+        else:
+            # Reflection padding is a gather of the rows and columns of the original images
+            rows = self._reflect(rows - self.padding, height)
+            cols = self._reflect(cols - self.padding, width)
+
+        # Advanced indexing gives shape [N, n_in, n_in, C]
+        crops = images[torch.arange(n).view(n, 1, 1), :, rows.view(n, -1, 1), cols.view(n, 1, -1)]
+        return crops.permute(0, 3, 1, 2)
+
+    @staticmethod
+    def _reflect(index, size):
+        """:return: index into an axis of length size with reflection, as padding_mode='reflect'"""
+        period = 2 * (size - 1)
+        index = torch.remainder(index, period)
+        return torch.where(index < size, index, period - index)
+
+    def _rotate(self, images, degrees=15.0):
+        n = images.shape[0]
+        angle = torch.empty(n).uniform_(-degrees, degrees) * math.pi / 180.0
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        zero = torch.zeros_like(angle)
+        theta = torch.stack([torch.stack([cos, -sin, zero], dim=1),
+                             torch.stack([sin, cos, zero], dim=1)], dim=1)
+        grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+        # Areas rotated in from outside of the image are black, as in RandomRotation
+        return F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros',
+                             align_corners=False)
+
+    def _colour_jitter(self, images):
+        n = images.shape[0]
+        low = max(0.0, 1.0 - self.jitter)
+        images = torch.clamp(images * _uniform(n, low, 1.0 + self.jitter), 0.0, 1.0)
+
+        contrast = _uniform(n, low, 1.0 + self.jitter)
+        mean = _grayscale(images).mean(dim=(1, 2, 3), keepdim=True)
+        images = torch.clamp(contrast * images + (1.0 - contrast) * mean, 0.0, 1.0)
+        if images.shape[1] == 1:
+            return images
+
+        saturation = _uniform(n, low, 1.0 + self.jitter)
+        images = torch.clamp(saturation * images + (1.0 - saturation) * _grayscale(images),
+                             0.0, 1.0)
+
+        hue, saturation, value = _rgb_to_hsv(images)
+        hue = torch.remainder(hue + _uniform(n, -min(self.jitter, 0.5),
+                                             min(self.jitter, 0.5)).view(n, 1, 1), 1.0)
+        return _hsv_to_rgb(hue, saturation, value)
+
+
+class TensorImagesMixin(object):
+    """
+    Fast path of in-memory torchvision datasets. If the transform is a TensorTransforms, items
+    are read from a uint8 tensor of the prepared images instead of PIL images.
+    """
+
+    def _setup_tensor_images(self, images, targets):
+        """
+        :param images: function returning a uint8 tensor of all images with shape [N, C, H, W]
+        :param targets: array of the class labels of the images
+        """
+        self.tensor_images, self.tensor_targets = None, None
+        if isinstance(self.transform, TensorTransforms):
+            self.tensor_images = self.transform.prepare(images())
+            self.tensor_targets = torch.as_tensor(targets, dtype=torch.int64)
+
+    def __getitem__(self, index):
+        if self.tensor_images is None:
+            return super().__getitem__(index)
+        image = self.transform.finish(self.tensor_images[index])
+        target = int(self.tensor_targets[index])
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return image, target
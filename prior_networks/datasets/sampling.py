@@ -0,0 +1,139 @@
+import numpy as np
+from torch.utils.data import Dataset, Sampler
+from torch.utils.data.dataloader import default_collate
+
+"""
+Sampling of paired in-domain and out-of-domain training data of different sizes. Indices of
+each dataset are read from an infinite stream of independent shuffles, so neither dataset is
+replicated or truncated, and epochs have a fixed length whatever the ratio of dataset sizes.
+Paired items are read by a single DataLoader, so that one pool of workers loads both datasets.
+"""
+
+
+class ShuffleStream(object):
+    """
+    Infinite stream of indices of a dataset, made of independent random permutations. Any
+    window of the stream is computed from its position, so epochs are reproducible on resume.
+    """
+
+    def __init__(self, n_items, seed=0):
+        self.n_items = n_items
+        self.seed = seed
+
+    def _permutation(self, k):
+        return np.random.default_rng([self.seed, k]).permutation(self.n_items)
+
+    def window(self, start, length):
+        """:return: the indices at positions [start, start + length) of the stream"""
+        first, last = start // self.n_items, (start + length - 1) // self.n_items
+        indices = np.concatenate([self._permutation(k) for k in range(first, last + 1)])
+        offset = start - first * self.n_items
+        return indices[offset:offset + length]
+
+
+class BalancedPairSampler(object):
+    """
+    Pairs of in-domain and out-of-domain indices. Every epoch pairs epoch_length in-domain
+    indices with ood_ratio out-of-domain indices each, continuing the independent shuffles of
+    either dataset where the previous epoch stopped.
+    """
+
+    def __init__(self, n_id, n_ood, epoch_length=None, ood_ratio=1, seed=0):
+        """
+        :param n_id: size of the in-domain dataset
+        :param n_ood: size of the out-of-domain dataset
+        :param epoch_length: number of in-domain samples per epoch, n_id by default
+        :param ood_ratio: number of out-of-domain samples per in-domain sample
+        :param seed: seed of the shuffles of both datasets
+        """
+        assert isinstance(ood_ratio, int) and ood_ratio >= 1
+        self.epoch_length = n_id if epoch_length is None else epoch_length
+        self.ood_ratio = ood_ratio
+        self.id_stream = ShuffleStream(n_id)
+        self.ood_stream = ShuffleStream(n_ood)
+        self.set_seed(seed)
+        self.epoch = 0
+
+    def set_seed(self, seed):
+        self.seed = seed
+        # Streams are seeded differently, so the shuffles of datasets of equal size differ
+        self.id_stream.seed = 2 * seed
+        self.ood_stream.seed = 2 * seed + 1
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def indices(self, epoch):
+        """
+        :return: in-domain indices with shape [epoch_length] and out-of-domain indices with shape
+         [epoch_length * ood_ratio] of an epoch
+        """
+        n_ood = self.epoch_length * self.ood_ratio
+        return (self.id_stream.window(epoch * self.epoch_length, self.epoch_length),
+                self.ood_stream.window(epoch * n_ood, n_ood))
+
+    def batch_sampler(self, batch_size):
+        """
+        :return: Sampler of batches of (in-domain index, out-of-domain indices) pairs of the
+         current epoch, for a PairedDataset
+        """
+        return _PairBatches(self, batch_size)
+
+
+class _PairBatches(Sampler):
+    def __init__(self, pair_sampler, batch_size):
+        self.pair_sampler = pair_sampler
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        id_indices, ood_indices = self.pair_sampler.indices(self.pair_sampler.epoch)
+        ood_indices = ood_indices.reshape(-1, self.pair_sampler.ood_ratio)
+        pairs = list(zip(id_indices.tolist(), map(tuple, ood_indices.tolist())))
+        for start in range(0, len(pairs), self.batch_size):
+            yield pairs[start:start + self.batch_size]
+
+    def __len__(self):
+        return (self.pair_sampler.epoch_length + self.batch_size - 1) // self.batch_size
+
+
+class PairedDataset(Dataset):
+    """
+    Items of an in-domain and an out-of-domain dataset read together. Indices are pairs of an
+    in-domain index and a tuple of out-of-domain indices, or an integer index of both datasets.
+    """
+
+    def __init__(self, id_dataset, ood_dataset):
+        self.id_dataset = id_dataset
+        self.ood_dataset = ood_dataset
+
+    def __getitem__(self, index):
+        """:return: the in-domain item and a list of out-of-domain items"""
+        if isinstance(index, tuple):
+            id_index, ood_indices = index
+        else:
+            id_index, ood_indices = index, (index,)
+        return self.id_dataset[id_index], [self.ood_dataset[i] for i in ood_indices]
+
+    def __len__(self):
+        return len(self.id_dataset)
+
+
+class PairCollate(object):
+    """
+    Collate function of a PairedDataset, returning in-domain inputs, labels and the inputs of
+    all out-of-domain items, in the order of the in-domain items they are paired with.
+    """
+
+    def __init__(self, collate_fn=None, ood_collate_fn=None):
+        """
+        :param collate_fn: collate function of in-domain items, default_collate if None
+        :param ood_collate_fn: collate function of out-of-domain items, default_collate if None
+        """
+        self.collate_fn = default_collate if collate_fn is None else collate_fn
+        self.ood_collate_fn = default_collate if ood_collate_fn is None else ood_collate_fn
+
+    def __call__(self, batch):
+        inputs, labels = self.collate_fn([item for item, _ in batch])
+        ood_inputs, _ = self.ood_collate_fn([ood_item for _, ood_items in batch
+                                             for ood_item in ood_items])
+        return inputs, labels, ood_inputs
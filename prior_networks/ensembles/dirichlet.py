@@ -0,0 +1,66 @@
+import numpy as np
+from scipy.special import digamma, polygamma
+
+from prior_networks.priornet.dpn import dirichlet_prior_network_uncertainty
+
+""" Dirichlet fitting of ensemble predictions """
+
+
+def fit_dirichlet(probs, n_iter=10, epsilon=1e-10, min_precision=1e-2, max_precision=1e6):
+    """
+    Fits a Dirichlet to the ensemble predictions of every example by maximum likelihood.
+    The concentration is initialised by moment matching and then refined with a few Newton
+    steps (Minka, 2000) which are vectorised over all examples. The Hessian is a diagonal plus
+    a rank one term, so each step is O(K) per example.
+
+    :param probs: array of ensemble probabilities with shape [n_examples, n_models, n_classes]
+    :param n_iter: number of Newton iterations
+    :param epsilon: smoothing added to probabilities before taking logs
+    :param min_precision: lower clip on the moment matching estimate of alpha0
+    :param max_precision: upper bound on alpha0, reached when all members agree
+    :return: array of concentration parameters with shape [n_examples, n_classes]
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    mean_log_probs = np.mean(np.log(probs + epsilon), axis=1)
+
+    # Moment matching: Var[p_k] = m_k (1 - m_k) / (alpha0 + 1), pooled over classes
+    mean_probs = np.mean(probs, axis=1)
+    total_var = np.sum(np.var(probs, axis=1), axis=1, keepdims=True)
+    total_bernoulli_var = np.sum(mean_probs * (1.0 - mean_probs), axis=1, keepdims=True)
+    precision = total_bernoulli_var / np.maximum(total_var, total_bernoulli_var / max_precision) - 1.0
+    precision = np.clip(precision, min_precision, max_precision)
+
+    alphas = np.maximum(mean_probs, epsilon) * precision
+
+    for i in range(n_iter):
+        alpha0 = np.sum(alphas, axis=1, keepdims=True)
+        grad = digamma(alpha0) - digamma(alphas) + mean_log_probs
+
+        # Hessian is diag(q) + z * 11^T
+        q = -polygamma(1, alphas)
+        z = polygamma(1, alpha0)
+        b = np.sum(grad / q, axis=1, keepdims=True) / (1.0 / z + np.sum(1.0 / q, axis=1, keepdims=True))
+        step = (grad - b) / q
+
+        # Shorten the step for any example where it would leave the positive orthant
+        ratio = np.where(step > 0.0, alphas / np.where(step > 0.0, step, 1.0), np.inf)
+        scale = np.minimum(1.0, 0.5 * np.min(ratio, axis=1, keepdims=True))
+        alphas = alphas - scale * step
+
+        # The likelihood has no maximum when all members agree, so cap the precision
+        alpha0 = np.sum(alphas, axis=1, keepdims=True)
+        alphas = alphas * np.minimum(1.0, max_precision / alpha0)
+
+    return alphas
+
+
+def ensemble_dirichlet_uncertainty(probs, n_iter=10, epsilon=1e-10):
+    """
+    Computes Prior Network uncertainty measures for an ensemble by first fitting a Dirichlet to
+    its predictions, so that ensembles and DPNs are assessed with identical code.
+
+    :param probs: array of ensemble probabilities with shape [n_examples, n_models, n_classes]
+    :return: dictionary of uncertainty measures as returned by dirichlet_prior_network_uncertainty
+    """
+    alphas = fit_dirichlet(probs, n_iter=n_iter, epsilon=epsilon)
+    return dirichlet_prior_network_uncertainty(np.log(alphas), epsilon=epsilon)
@@ -0,0 +1,60 @@
+import math
+
+import torch
+from torch import nn
+
+from prior_networks.ensembles.uncertainties import ensemble_uncertainties_torch
+
+
+class MCDropoutSampler(object):
+    """Turns a model with dropout into an implicit ensemble. The batch is tiled n_samples times
+    so all stochastic passes run as one large forward, with dropout active and every other
+    layer (in particular BatchNorm) in eval mode. Only dropout implemented with nn.Dropout
+    modules is sampled."""
+
+    def __init__(self, model, n_samples=10, max_batch_size=None):
+        """
+        :param model: torch.nn.Module that outputs model logits
+        :param n_samples: number of stochastic forward passes T
+        :param max_batch_size: if given, the tiled batch is split into forwards of at most this size
+        """
+        assert isinstance(model, nn.Module)
+        assert n_samples > 0
+        self.model = model
+        self.n_samples = n_samples
+        self.max_batch_size = max_batch_size
+
+    def __call__(self, x):
+        return self.forward(x)
+
+    def forward(self, x):
+        """
+        :param x: batch of inputs with shape [batch_size, ...]
+        :return: logits of every stochastic pass with shape [batch_size, n_samples, n_classes]
+        """
+        batch_size = x.size()[0]
+        tiled_x = x.repeat((self.n_samples,) + (1,) * (x.dim() - 1))
+
+        modes = {module: module.training for module in self.model.modules()}
+        self.model.eval()
+        for module in self.model.modules():
+            if isinstance(module, nn.modules.dropout._DropoutNd):
+                module.train()
+        try:
+            if self.max_batch_size is None:
+                logits = self.model(tiled_x)
+            else:
+                n_chunks = math.ceil(tiled_x.size()[0] / self.max_batch_size)
+                logits = torch.cat([self.model(chunk) for chunk in torch.chunk(tiled_x, n_chunks)],
+                                   dim=0)
+        finally:
+            for module, training in modes.items():
+                module.training = training
+
+        return logits.view(self.n_samples, batch_size, -1).transpose(0, 1)
+
+    def uncertainties(self, x):
+        """Mean probabilities and ensemble uncertainty measures of the stochastic passes."""
+        logits = self.forward(x)
+        probs = torch.mean(torch.softmax(logits, dim=2), dim=1)
+        return probs, ensemble_uncertainties_torch(logits)
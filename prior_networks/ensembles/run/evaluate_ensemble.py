@@ -4,12 +4,18 @@ import os
 import sys
 
 import numpy as np
+import torch
 
 from prior_networks.assessment.calibration import classification_calibration
 from prior_networks.assessment.misc_detection import eval_misc_detect
 from prior_networks.assessment.rejection import eval_rejection_ratio_class
+from prior_networks.ensembles.dirichlet import fit_dirichlet
 from prior_networks.ensembles.ensembles import get_ensemble_predictions
 from prior_networks.ensembles.uncertainties import ensemble_uncertainties
+from prior_networks.evaluation import eval_ensemble_on_dataset
+from prior_networks.datasets.image.eval_cache import load_eval_dataset
+from prior_networks.models.model_factory import ModelFactory
+from prior_networks.util_pytorch import DATASET_DICT, select_gpu
 
 commandLineParser = argparse.ArgumentParser(description='Compute features from labels.')
 commandLineParser.add_argument('models_parent_dir', type=str,
@@ -17,7 +23,8 @@ commandLineParser.add_argument('models_parent_dir', type=str,
 commandLineParser.add_argument('model_name', type=str,
                                help='which orignal data is saved should be loaded')
 commandLineParser.add_argument('source_path', type=str,
-                               help='which orignal data is saved should be loaded')
+                               help='Path of the saved predictions within each model directory, '
+                                    'or with --dataset, the path where data is saved.')
 commandLineParser.add_argument('output_path', type=str,
                                help='which orignal data is saved should be loaded')
 commandLineParser.add_argument('--n_models', type=int, default=10,
@@ -28,10 +35,28 @@ commandLineParser.add_argument('--overwrite', type=bool, default=False,
                                help='which orignal data is saved should be loaded')
 commandLineParser.add_argument('--ood', action='store_true',
                     help='Whether to evaluate on OOD data with mismatched classes - only saves outputs.')
+commandLineParser.add_argument('--fit_dirichlet', action='store_true',
+                    help='Whether to also fit a Dirichlet to the ensemble predictions and save its '
+                         'log-concentrations as logits, in the same format as a DPN.')
+commandLineParser.add_argument('--dataset', choices=DATASET_DICT.keys(), default=None,
+                               help='Run the models saved in each model directory on the test '
+                                    'data of this dataset, instead of loading their saved '
+                                    'predictions. Only the ensemble predictions are kept.')
+commandLineParser.add_argument('--batch_size', type=int, default=256,
+                               help='Batch size for processing with --dataset')
+commandLineParser.add_argument('--gpu', type=int, action='append',
+                               help='Specify which GPUs to to run on with --dataset.')
+commandLineParser.add_argument('--cache_dir', type=str, default=None,
+                               help='Directory of cached eval inputs for --dataset, built on first '
+                                    'use. Inputs are decoded and transformed on every run if not '
+                                    'set.')
 
 
 def main(argv=None):
     args = commandLineParser.parse_args()
+    if args.dataset is not None and args.fit_dirichlet:
+        commandLineParser.error('--fit_dirichlet needs the predictions of every model, '
+                                'which are not kept with --dataset')
     if not os.path.isdir('CMDs'):
         os.mkdir('CMDs')
     with open('CMDs/evaluate_ensemble.txt', 'a') as f:
@@ -47,15 +72,34 @@ def main(argv=None):
 
     model_dirs = [os.path.join(args.models_parent_dir,
                                args.model_name + "{}".format(int(i))) for i in range(0, args.n_models)]
-    labels, probs = get_ensemble_predictions(model_dirs, args.source_path, args.n_models)
-
-    mean_probs = np.mean(probs, axis=1)
+    if args.dataset is None:
+        labels, probs = get_ensemble_predictions(model_dirs, args.source_path, args.n_models)
+        mean_probs = np.mean(probs, axis=1)
+        # Get dictionary of uncertainties.
+        uncertainties = ensemble_uncertainties(probs, epsilon=1e-10)
+    else:
+        # Members are reduced batch by batch, so their predictions are never held in memory
+        device = select_gpu(args.gpu)
+        models = []
+        for model_dir in model_dirs:
+            ckpt = torch.load(os.path.join(model_dir, 'model/model.tar'), map_location=device)
+            model = ModelFactory.model_from_checkpoint(ckpt)
+            model.to(device)
+            models.append(model)
+        dataset = load_eval_dataset(args.dataset, data_path=args.source_path, n_in=ckpt['n_in'],
+                                    mean=DATASET_DICT[args.dataset].mean,
+                                    std=DATASET_DICT[args.dataset].std,
+                                    split='test', cache_dir=args.cache_dir)
+        mean_probs, labels, uncertainties = eval_ensemble_on_dataset(models, dataset,
+                                                                     batch_size=args.batch_size,
+                                                                     device=device)
+        labels, mean_probs = labels.numpy(), mean_probs.numpy()
+        uncertainties = {key: value.numpy() for key, value in uncertainties.items()}
 
     np.savetxt(os.path.join(args.output_path, 'labels.txt'), labels)
     np.savetxt(os.path.join(args.output_path, 'probs.txt'), mean_probs)
-
-    # Get dictionary of uncertainties.
-    uncertainties = ensemble_uncertainties(probs, epsilon=1e-10)
+    if args.fit_dirichlet:
+        np.savetxt(os.path.join(args.output_path, 'logits.txt'), np.log(fit_dirichlet(probs)))
 
     # Save uncertainties
     for key in uncertainties.keys():
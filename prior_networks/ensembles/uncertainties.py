@@ -1,4 +1,8 @@
+import math
+
 import numpy as np
+import torch
+import torch.nn.functional as F
 
 """ Numpy Implementation of Uncertainty Measures """
 
@@ -51,4 +55,66 @@ def ensemble_uncertainties(probs, epsilon=1e-10):
     return uncertainty
 
 """ Pytorch Implementation of Uncertainty Measures """
-#TODO Pytorch Implementation of Uncertainty Measures
\ No newline at end of file
+
+
+def entropy_of_expected_torch(log_probs):
+    """
+    :param log_probs: tensor of member log-probabilities with shape [batch_size, n_models, n_classes]
+    :return: entropy of the ensemble's mean prediction, shape [batch_size]
+    """
+    log_mean_probs = torch.logsumexp(log_probs, dim=1) - math.log(log_probs.size()[1])
+    return -torch.sum(torch.exp(log_mean_probs) * log_mean_probs, dim=1)
+
+
+def expected_entropy_torch(log_probs):
+    """
+    :param log_probs: tensor of member log-probabilities with shape [batch_size, n_models, n_classes]
+    :return: mean entropy of the individual members, shape [batch_size]
+    """
+    return torch.mean(-torch.sum(torch.exp(log_probs) * log_probs, dim=2), dim=1)
+
+
+def mutual_information_torch(log_probs):
+    return entropy_of_expected_torch(log_probs) - expected_entropy_torch(log_probs)
+
+
+def expected_pairwise_kl_divergence_torch(log_probs):
+    """
+    Sum of KL(p_i || p_j) over all ordered pairs of members, as in the numpy implementation.
+    Uses sum_ij KL(p_i || p_j) = M * sum_i sum_k p_ik * (log p_ik - mean_j log p_jk), which is
+    O(M * K) per example instead of O(M^2 * K).
+
+    :param log_probs: tensor of member log-probabilities with shape [batch_size, n_models, n_classes]
+    :return: shape [batch_size]
+    """
+    n_models = log_probs.size()[1]
+    mean_log_probs = torch.mean(log_probs, dim=1, keepdim=True)
+    return n_models * torch.sum(torch.exp(log_probs) * (log_probs - mean_log_probs), dim=(1, 2))
+
+
+def ensemble_uncertainties_torch(logits):
+    """
+    Torch counterpart of ensemble_uncertainties which works directly on member logits. It is
+    meant to be called on every batch inside an ensemble inference loop, on whatever device the
+    models run on, so member probabilities never have to be held for a whole dataset.
+
+    :param logits: tensor of member logits with shape [batch_size, n_models, n_classes]
+    :return: dictionary of uncertainty measures, each a tensor of shape [batch_size]
+    """
+    log_probs = F.log_softmax(logits, dim=2)
+    mean_probs = torch.mean(torch.exp(log_probs), dim=1)
+    conf = torch.max(mean_probs, dim=1)[0]
+
+    eoe = entropy_of_expected_torch(log_probs)
+    exe = expected_entropy_torch(log_probs)
+    mutual_info = eoe - exe
+
+    epkl = expected_pairwise_kl_divergence_torch(log_probs)
+
+    uncertainty = {'confidence': conf,
+                   'entropy_of_expected': eoe,
+                   'expected_entropy': exe,
+                   'mutual_information': mutual_info,
+                   'EPKL': epkl}
+
+    return uncertainty
@@ -2,11 +2,14 @@ import context
 import torch
 import numpy as np
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.utils.data
 from torch.utils.data import Dataset, DataLoader
 
 from typing import Optional, Tuple
 
+from prior_networks.ensembles.uncertainties import ensemble_uncertainties_torch
+
 
 def eval_logits_on_dataset(model: nn.Module, dataset: Dataset, batch_size: int = 128,
                            device: Optional[torch.device] = None,
@@ -43,3 +46,46 @@ def eval_logits_on_dataset(model: nn.Module, dataset: Dataset, batch_size: int =
     logits = torch.cat(logits_list, dim=0)
     labels = torch.cat(labels_list, dim=0)
     return logits.cpu(), labels.cpu()
+
+
+def eval_ensemble_on_dataset(models, dataset: Dataset, batch_size: int = 128,
+                             device: Optional[torch.device] = None,
+                             num_workers: int = 4) -> Tuple[torch.tensor, torch.tensor, dict]:
+    """
+    Runs every member of an ensemble on each batch of the dataset and immediately reduces the
+    member logits to the ensemble mean prediction and uncertainty measures. Only per-example
+    quantities are kept, so member probabilities are never held for the whole dataset.
+    :param models: list of torch.nn.Module that output model logits
+    :param dataset: pytorch dataset with inputs and labels
+    :param batch_size: int
+    :param device: device to use for evaluation
+    :param num_workers: int, num. workers for the data loader
+    :return: mean probabilities of the ensemble, the labels and a dictionary of
+    uncertainty measures, all as torch tensors on the cpu
+    """
+    for model in models:
+        model.eval()
+
+    testloader = DataLoader(dataset, batch_size=batch_size,
+                            shuffle=False, num_workers=num_workers)
+    probs_list = []
+    labels_list = []
+    uncertainties_list = []
+    with torch.no_grad():
+        for i, data in enumerate(testloader, 0):
+            # Get inputs
+            inputs, labels = data
+            if device is not None:
+                inputs = inputs.to(device)
+            logits = torch.stack([model(inputs) for model in models], dim=1)
+            uncertainties = ensemble_uncertainties_torch(logits)
+
+            probs_list.append(torch.mean(F.softmax(logits, dim=2), dim=1).cpu())
+            labels_list.append(labels)
+            uncertainties_list.append({key: value.cpu() for key, value in uncertainties.items()})
+
+    probs = torch.cat(probs_list, dim=0)
+    labels = torch.cat(labels_list, dim=0)
+    uncertainties = {key: torch.cat([batch[key] for batch in uncertainties_list], dim=0)
+                     for key in uncertainties_list[0].keys()}
+    return probs, labels, uncertainties
@@ -1,5 +1,29 @@
-from .resnet import *
-from .densenet import *
-from .wideresnet import *
-from .vgg import *
-from .my_vgg import *
\ No newline at end of file
+import importlib
+
+# Architectures are imported from their submodule on first access, as the submodules pull in
+# torchvision. Later submodules take precedence, as with the star imports this replaces.
+_SUBMODULES = ['resnet', 'densenet', 'wideresnet', 'vgg', 'my_vgg']
+_ATTRIBUTE_DICT = {'ResNet': 'resnet', 'resnet18': 'resnet', 'resnet34': 'resnet',
+                   'resnet50': 'resnet', 'resnet101': 'resnet', 'resnet152': 'resnet',
+                   'resnext50_32x4d': 'resnet', 'resnext101_32x8d': 'resnet',
+                   'wide_resnet50_2': 'resnet', 'wide_resnet101_2': 'resnet',
+                   'DenseNet': 'densenet', 'densenet121': 'densenet', 'densenet161': 'densenet',
+                   'densenet169': 'densenet', 'densenet201': 'densenet',
+                   'wide_resnet28_10': 'wideresnet', 'wide_resnet28_12': 'wideresnet',
+                   'wide_leaky_resnet28_10': 'wideresnet',
+                   'vgg11': 'vgg', 'vgg11_bn': 'vgg', 'vgg13': 'vgg', 'vgg13_bn': 'vgg',
+                   'vgg16': 'vgg', 'vgg16_bn': 'vgg', 'vgg19': 'vgg', 'vgg19_bn': 'vgg',
+                   'MyVGG': 'my_vgg', 'myvgg16': 'my_vgg', 'myvgg16_bn': 'my_vgg',
+                   'myvgg19': 'my_vgg', 'myvgg19_bn': 'my_vgg'}
+
+
+def __getattr__(name):
+    if name in _ATTRIBUTE_DICT:
+        return getattr(importlib.import_module('.' + _ATTRIBUTE_DICT[name], __name__), name)
+    # Anything else star-exported by a submodule, e.g. torchvision's VGG
+    for submodule in reversed(_SUBMODULES):
+        module = importlib.import_module('.' + submodule, __name__)
+        exported = getattr(module, '__all__', [n for n in dir(module) if not n.startswith('_')])
+        if name in exported:
+            return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,37 +1,39 @@
-import prior_networks
 import torch
 import torch.nn as nn
 
+from prior_networks.util_pytorch import LazyDict
+
 
 class ModelFactory(object):
-    MODEL_DICT = {'vgg11': prior_networks.models.vgg11,
-                  'vgg11_bn': prior_networks.models.vgg11_bn,
-                  'vgg13': prior_networks.models.vgg13,
-                  'vgg13_bn': prior_networks.models.vgg13_bn,
-                  'vgg16': prior_networks.models.vgg16,
-                  'vgg16_bn': prior_networks.models.vgg16_bn,
-                  'vgg19': prior_networks.models.vgg19,
-                  'vgg19_bn': prior_networks.models.vgg19_bn,
-                  'myvgg16': prior_networks.models.myvgg16,
-                  'myvgg16_bn': prior_networks.models.myvgg16_bn,
-                  'myvgg19': prior_networks.models.myvgg19,
-                  'myvgg19_bn': prior_networks.models.myvgg19_bn,
-                  'resnet18': prior_networks.models.resnet18,
-                  'resnet34': prior_networks.models.resnet34,
-                  'resnet50': prior_networks.models.resnet50,
-                  'resnet101': prior_networks.models.resnet101,
-                  'resnet152': prior_networks.models.resnet152,
-                  'resnext50_32x4d': prior_networks.models.resnext50_32x4d,
-                  'resnext101_32x8d': prior_networks.models.resnext101_32x8d,
-                  'wide_resnet50_2': prior_networks.models.wide_resnet50_2,
-                  'wide_resnet101_2': prior_networks.models.wide_resnet101_2,
-                  'wide_resnet28_10': prior_networks.models.wide_resnet28_10,
-                  'wide_leaky_resnet28_10': prior_networks.models.wide_leaky_resnet28_10,
-                  'wide_resnet28_12': prior_networks.models.wide_resnet28_12,
-                  'densenet121': prior_networks.models.densenet121,
-                  'densenet161': prior_networks.models.densenet161,
-                  'densenet169': prior_networks.models.densenet169,
-                  'densenet201': prior_networks.models.densenet201}
+    MODEL_DICT = LazyDict('prior_networks.models',
+                          {'vgg11': 'vgg11',
+                           'vgg11_bn': 'vgg11_bn',
+                           'vgg13': 'vgg13',
+                           'vgg13_bn': 'vgg13_bn',
+                           'vgg16': 'vgg16',
+                           'vgg16_bn': 'vgg16_bn',
+                           'vgg19': 'vgg19',
+                           'vgg19_bn': 'vgg19_bn',
+                           'myvgg16': 'myvgg16',
+                           'myvgg16_bn': 'myvgg16_bn',
+                           'myvgg19': 'myvgg19',
+                           'myvgg19_bn': 'myvgg19_bn',
+                           'resnet18': 'resnet18',
+                           'resnet34': 'resnet34',
+                           'resnet50': 'resnet50',
+                           'resnet101': 'resnet101',
+                           'resnet152': 'resnet152',
+                           'resnext50_32x4d': 'resnext50_32x4d',
+                           'resnext101_32x8d': 'resnext101_32x8d',
+                           'wide_resnet50_2': 'wide_resnet50_2',
+                           'wide_resnet101_2': 'wide_resnet101_2',
+                           'wide_resnet28_10': 'wide_resnet28_10',
+                           'wide_leaky_resnet28_10': 'wide_leaky_resnet28_10',
+                           'wide_resnet28_12': 'wide_resnet28_12',
+                           'densenet121': 'densenet121',
+                           'densenet161': 'densenet161',
+                           'densenet169': 'densenet169',
+                           'densenet201': 'densenet201'})
     ARCHITECTURE_FIELD = 'arch'
     STATE_DICT_FIELD = 'model_state_dict'
     MODEL_ARGS_FIELDS = ['num_classes', 'small_inputs', 'dropout_rate']
@@ -68,9 +68,22 @@ class PriorNet(nn.Module):
         return expected_entropy
 
     @staticmethod
-    def uncertainty_metrics(logits):
+    def mutual_information_from_logits(logits):
+        """Mutual information of a batch of logits, computed in float64 as the entropies cancel
+        for large concentrations."""
+        alphas = torch.exp(logits.to(torch.float64))
+        alpha0 = torch.sum(alphas, dim=1, keepdim=True)
+        probs = alphas / alpha0
+        return categorical_entropy_torch(probs) - PriorNet.expected_entropy_from_alphas(alphas, alpha0)
+
+    @staticmethod
+    def uncertainty_metrics(logits, top_k=None):
         """Calculates mutual info, entropy of expected, and expected entropy, EPKL and Differential Entropy uncertainty metrics for
-        the data x."""
+        the data x. If top_k is given, the measures are approximated from the top_k largest
+        concentrations, see topk_uncertainty_metrics."""
+        if top_k is not None and top_k < logits.size()[1]:
+            return PriorNet.topk_uncertainty_metrics(logits, top_k)[0]
+
         alphas = torch.exp(logits)
         alpha0 = torch.sum(alphas, dim=1, keepdim=True)
         probs = alphas / alpha0
@@ -99,39 +112,228 @@ class PriorNet(nn.Module):
 
         return uncertainties
 
+    @staticmethod
+    def topk_uncertainty_metrics(logits, top_k):
+        """Approximates the uncertainty metrics by keeping the top_k concentrations exactly and
+        folding the remaining classes into a uniform tail with the same total concentration.
+        Returns the metrics and upper bounds on their absolute errors, see
+        topk_dirichlet_prior_network_uncertainty."""
+        dtype = logits.dtype
+        n_classes = logits.size()[1]
+        n_tail = n_classes - top_k
+        # Computed in float64 as the tail is small relative to alpha0 for confident outputs
+        alphas = torch.exp(logits.to(torch.float64))
+        alpha0 = torch.sum(alphas, dim=1, keepdim=True)
+        top_alphas, top_indices = torch.topk(alphas, top_k, dim=1)
+        kth_alpha = top_alphas[:, -1:]
+        min_alpha = torch.min(alphas, dim=1, keepdim=True)[0]
+        # The tail is summed directly, alpha0 - sum(top_alphas) loses all precision when the top
+        # concentrations dominate. A zero tail is floored so that its log terms stay finite.
+        tail_alpha = torch.sum(alphas.scatter(1, top_indices, 0.0), dim=1, keepdim=True)
+        mean_tail_alpha = torch.clamp(tail_alpha / n_tail, min=torch.finfo(torch.float64).tiny)
+
+        top_probs = top_alphas / alpha0
+        tail_prob = tail_alpha / alpha0
+
+        conf = top_probs[:, 0]
+
+        entropy_of_exp = categorical_entropy_torch(top_probs) \
+                         - torch.squeeze(tail_prob * torch.log(mean_tail_alpha / alpha0), dim=1)
+        eoe_bound = tail_prob * (torch.log(kth_alpha) - torch.log(mean_tail_alpha))
+
+        expected_entropy = torch.digamma(alpha0 + 1) \
+                           - torch.sum(top_probs * torch.digamma(top_alphas + 1), dim=1, keepdim=True) \
+                           - tail_prob * torch.digamma(mean_tail_alpha + 1)
+        exe_bound = tail_prob * (torch.digamma(kth_alpha + 1) - torch.digamma(min_alpha + 1))
+        expected_entropy = torch.squeeze(expected_entropy, dim=1)
+
+        mutual_info = entropy_of_exp - expected_entropy
+
+        epkl = torch.squeeze((n_classes - 1.0) / alpha0, dim=1)
+
+        def dentropy_term(a):
+            return torch.lgamma(a) - (a - 1) * torch.digamma(a)
+
+        dentropy = torch.sum(dentropy_term(top_alphas), dim=1, keepdim=True) \
+                   + n_tail * dentropy_term(mean_tail_alpha) \
+                   + (alpha0 - n_classes) * torch.digamma(alpha0) - torch.lgamma(alpha0)
+        g_min, g_kth = dentropy_term(min_alpha), dentropy_term(kth_alpha)
+        g_upper = torch.where((min_alpha <= 1.0) & (kth_alpha >= 1.0), torch.zeros_like(g_min),
+                              torch.max(g_min, g_kth))
+        dentropy_bound = n_tail * (g_upper - torch.min(g_min, g_kth))
+
+        uncertainties = {'confidence': conf.to(dtype),
+                         'entropy_of_expected': entropy_of_exp.to(dtype),
+                         'expected_entropy': expected_entropy.to(dtype),
+                         'mutual_information': mutual_info.to(dtype),
+                         'EPKL': epkl.to(dtype),
+                         'differential_entropy': torch.squeeze(dentropy, dim=1).to(dtype),
+                         }
+        error_bounds = {'confidence': torch.zeros_like(conf, dtype=dtype),
+                        'entropy_of_expected': torch.squeeze(eoe_bound, dim=1).to(dtype),
+                        'expected_entropy': torch.squeeze(exe_bound, dim=1).to(dtype),
+                        'mutual_information': torch.squeeze(eoe_bound + exe_bound, dim=1).to(dtype),
+                        'EPKL': torch.zeros_like(epkl, dtype=dtype),
+                        'differential_entropy': torch.squeeze(dentropy_bound, dim=1).to(dtype),
+                        }
+
+        return uncertainties, error_bounds
+
+
+class DirichletIntermediates(object):
+    """Evaluates each intermediate quantity of INTERMEDIATE_DICT at most once for a set of logits,
+    so that it can be shared between all the requested uncertainty measures."""
+
+    def __init__(self, logits, epsilon=1e-10):
+        self.logits = np.asarray(logits, dtype=np.float64)
+        self.epsilon = epsilon
+        self._cache = {}
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            self._cache[name] = INTERMEDIATE_DICT[name](self)
+        return self._cache[name]
 
-def dirichlet_prior_network_uncertainty(logits, epsilon=1e-10):
+
+def _entropy_of_expected(i):
+    return -np.sum(i['probs'] * i['log_probs'], axis=1)
+
+
+def _expected_entropy(i):
+    return -np.sum(i['probs'] * (i['digamma_alphas_plus_1'] - i['digamma_alpha0_plus_1']), axis=1)
+
+
+def _differential_entropy(i):
+    dentropy = np.sum(i['lgamma_alphas'] - (i['alphas'] - 1.0) * (i['digamma_alphas'] - i['digamma_alpha0']),
+                      axis=1, keepdims=True) \
+               - i['lgamma_alpha0']
+    return np.squeeze(dentropy)
+
+
+# Measures which are terms of other measures are intermediates too, so they are computed once
+INTERMEDIATE_DICT = {'alphas': lambda i: np.exp(i.logits),
+                     'alpha0': lambda i: np.sum(i['alphas'], axis=1, keepdims=True),
+                     'probs': lambda i: i['alphas'] / i['alpha0'],
+                     'log_probs': lambda i: np.log(i['probs'] + i.epsilon),
+                     'digamma_alphas': lambda i: digamma(i['alphas']),
+                     'digamma_alpha0': lambda i: digamma(i['alpha0']),
+                     'digamma_alphas_plus_1': lambda i: digamma(i['alphas'] + 1),
+                     'digamma_alpha0_plus_1': lambda i: digamma(i['alpha0'] + 1.0),
+                     'lgamma_alphas': lambda i: gammaln(i['alphas']),
+                     'lgamma_alpha0': lambda i: gammaln(i['alpha0']),
+                     'entropy_of_expected': _entropy_of_expected,
+                     'expected_entropy': _expected_entropy}
+
+# Each measure is a function of DirichletIntermediates
+MEASURE_DICT = {'confidence': lambda i: np.max(i['probs'], axis=1),
+                'entropy_of_expected': lambda i: i['entropy_of_expected'],
+                'expected_entropy': lambda i: i['expected_entropy'],
+                'mutual_information': lambda i: i['entropy_of_expected'] - i['expected_entropy'],
+                'EPKL': lambda i: np.squeeze((i.logits.shape[1] - 1.0) / i['alpha0']),
+                'differential_entropy': _differential_entropy}
+
+
+def dirichlet_prior_network_uncertainty(logits, epsilon=1e-10, top_k=None, measures=None):
     """
 
     :param logits:
     :param epsilon:
+    :param top_k: if given, approximate the measures from the top_k largest concentrations,
+     see topk_dirichlet_prior_network_uncertainty. None computes them exactly.
+    :param measures: list of keys of MEASURE_DICT to compute. None computes all of them.
     :return:
     """
+    if measures is None:
+        measures = list(MEASURE_DICT.keys())
+    assert all(measure in MEASURE_DICT for measure in measures)
+
+    if top_k is not None and top_k < np.shape(logits)[1]:
+        uncertainty = topk_dirichlet_prior_network_uncertainty(logits, top_k, epsilon=epsilon)[0]
+        return {measure: uncertainty[measure] for measure in measures}
+
+    intermediates = DirichletIntermediates(logits, epsilon=epsilon)
+    uncertainty = {}
+    for measure in measures:
+        uncertainty[measure] = MEASURE_DICT[measure](intermediates)
+
+    return uncertainty
+
+
+def topk_dirichlet_prior_network_uncertainty(logits, top_k, epsilon=1e-10):
+    """
+    Approximate Dirichlet uncertainty measures for large numbers of classes. The top_k largest
+    concentrations are kept exactly and the remaining classes are replaced by a uniform tail
+    with the same total concentration, so digamma and gammaln are evaluated on top_k + 1 values
+    per example instead of all of them.
 
+    :param logits: array of log-concentrations with shape [n_examples, n_classes]
+    :param top_k: number of concentrations to keep exactly
+    :param epsilon:
+    :return: dictionary of uncertainty measures and dictionary of upper bounds on the absolute
+     error of each measure. Confidence and EPKL are exact.
+    """
     logits = np.asarray(logits, dtype=np.float64)
+    n_classes = logits.shape[1]
+    n_tail = n_classes - top_k
     alphas = np.exp(logits)
     alpha0 = np.sum(alphas, axis=1, keepdims=True)
-    probs = alphas / alpha0
+    top_indices = np.argpartition(-alphas, top_k - 1, axis=1)[:, :top_k]
+    top_alphas = -np.sort(-np.take_along_axis(alphas, top_indices, axis=1), axis=1)
+    kth_alpha = top_alphas[:, -1:]
+    min_alpha = np.min(alphas, axis=1, keepdims=True)
+    # The tail is summed directly, alpha0 - sum(top_alphas) loses all precision when the top
+    # concentrations dominate. A zero tail is floored so that its log terms stay finite.
+    tail_alphas = alphas.copy()
+    np.put_along_axis(tail_alphas, top_indices, 0.0, axis=1)
+    tail_alpha = np.sum(tail_alphas, axis=1, keepdims=True)
+    mean_tail_alpha = np.maximum(tail_alpha / n_tail, np.finfo(np.float64).tiny)
+
+    top_probs = top_alphas / alpha0
+    tail_prob = tail_alpha / alpha0
+
+    conf = top_probs[:, 0]
+
+    # The tail entropy is at most that of a uniform tail and at least -P_tail * log(p_k)
+    entropy_of_exp = -np.sum(top_probs * np.log(top_probs + epsilon), axis=1, keepdims=True) \
+                     - tail_prob * np.log(mean_tail_alpha / alpha0 + epsilon)
+    eoe_bound = tail_prob * (np.log(kth_alpha) - np.log(mean_tail_alpha))
+
+    # Tail concentrations lie in [min_alpha, kth_alpha] and digamma is increasing
+    expected_entropy = digamma(alpha0 + 1.0) \
+                       - np.sum(top_probs * digamma(top_alphas + 1.0), axis=1, keepdims=True) \
+                       - tail_prob * digamma(mean_tail_alpha + 1.0)
+    exe_bound = tail_prob * (digamma(kth_alpha + 1.0) - digamma(min_alpha + 1.0))
 
-    conf = np.max(probs, axis=1)
-
-    entropy_of_exp = -np.sum(probs * np.log(probs + epsilon), axis=1)
-    expected_entropy = -np.sum((alphas / alpha0) * (digamma(alphas + 1) - digamma(alpha0 + 1.0)),
-                               axis=1)
     mutual_info = entropy_of_exp - expected_entropy
 
-    epkl = np.squeeze((alphas.shape[1] - 1.0) / alpha0)
+    epkl = np.squeeze((n_classes - 1.0) / alpha0)
 
-    dentropy = np.sum(gammaln(alphas) - (alphas - 1.0) * (digamma(alphas) - digamma(alpha0)),
-                      axis=1, keepdims=True) \
-               - gammaln(alpha0)
+    # g(a) = gammaln(a) - (a - 1) * digamma(a) increases up to a = 1, where it is 0, then decreases
+    dentropy = np.sum(_dentropy_term(top_alphas), axis=1, keepdims=True) \
+               + n_tail * _dentropy_term(mean_tail_alpha) \
+               + (alpha0 - n_classes) * digamma(alpha0) - gammaln(alpha0)
+    g_min, g_kth = _dentropy_term(min_alpha), _dentropy_term(kth_alpha)
+    g_upper = np.where(np.logical_and(min_alpha <= 1.0, kth_alpha >= 1.0), 0.0,
+                       np.maximum(g_min, g_kth))
+    dentropy_bound = n_tail * (g_upper - np.minimum(g_min, g_kth))
 
     uncertainty = {'confidence': conf,
-                   'entropy_of_expected': entropy_of_exp,
-                   'expected_entropy': expected_entropy,
-                   'mutual_information': mutual_info,
+                   'entropy_of_expected': np.squeeze(entropy_of_exp, axis=1),
+                   'expected_entropy': np.squeeze(expected_entropy, axis=1),
+                   'mutual_information': np.squeeze(mutual_info, axis=1),
                    'EPKL': epkl,
-                   'differential_entropy': np.squeeze(dentropy),
+                   'differential_entropy': np.squeeze(dentropy, axis=1),
                    }
+    error_bounds = {'confidence': np.zeros_like(conf),
+                    'entropy_of_expected': np.squeeze(eoe_bound, axis=1),
+                    'expected_entropy': np.squeeze(exe_bound, axis=1),
+                    'mutual_information': np.squeeze(eoe_bound + exe_bound, axis=1),
+                    'EPKL': np.zeros_like(conf),
+                    'differential_entropy': np.squeeze(dentropy_bound, axis=1),
+                    }
 
-    return uncertainty
+    return uncertainty, error_bounds
+
+
+def _dentropy_term(alphas):
+    return gammaln(alphas) - (alphas - 1.0) * digamma(alphas)
@@ -108,8 +108,10 @@ class DirichletKLLoss:
         # Create array of target (desired) concentration parameters
         target_alphas = torch.ones_like(alphas) * self.concentration
         if labels is not None:
+            # scatter_ takes the value as a tensor of the index shape or as a number, not as a
+            # 0-dim tensor
             target_alphas += torch.zeros_like(alphas).scatter_(1, labels[:, None],
-                                                               self.target_concentration)
+                                                               self.target_concentration.item())
 
         if self.reverse:
             loss = dirichlet_reverse_kl_divergence(alphas=alphas, target_alphas=target_alphas)
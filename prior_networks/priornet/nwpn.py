@@ -70,20 +70,27 @@ class NormalInverseWishartPriorNet(nn.Module):
 
         return pmean, log_pscatter, pmean_belief, pscatter_belief
 
+    def _prior_params(self, x):
+        pmean, log_pscatter, pmean_belief, pscatter_belief = self.forward(x)
+        return pmean, torch.exp(log_pscatter), pmean_belief, pscatter_belief
+
     def mutual_information(self, x):
-        pass
+        return mutual_information_torch(*self._prior_params(x))
 
     def entropy_of_expected(self, x):
-        pass
+        return entropy_of_expected_torch(*self._prior_params(x))
 
     def expected_entropy(self, x):
-        pass
+        return expected_entropy_torch(*self._prior_params(x))
 
     def diffenrential_entropy(self, x):
-        pass
+        return differential_entropy_torch(*self._prior_params(x))
 
     def epkl(self, x):
-        pass
+        return expected_pairwise_KL_torch(*self._prior_params(x))
+
+    def uncertainty_metrics(self, x):
+        return niwpn_uncertainty_torch(*self._prior_params(x))
 
 
 def entropy_of_expected(pmean, pscatter, pmean_belief, pscatter_belief, epsilon=1e-10):
@@ -128,7 +135,7 @@ def differential_entropy(pmean, pscatter, pmean_belief, pscatter_belief, epsilon
 def niwpn_uncertainty(pmean, pscatter, pmean_belief, pscatter_belief, epsilon=1e-10):
     eoe = entropy_of_expected(pmean, pscatter, pmean_belief, pscatter_belief)
     exe = expected_entropy(pmean, pscatter, pmean_belief, pscatter_belief)
-mi = eoe-exe
+    mi = eoe-exe
     epkl = expected_pairwise_KL(pmean, pscatter, pmean_belief, pscatter_belief)
     de = differential_entropy(pmean, pscatter, pmean_belief, pscatter_belief)
 
@@ -139,3 +146,106 @@ mi = eoe-exe
                    'differential_entropy': de}
 
     return uncertainty
+
+
+""" Pytorch Implementation of Uncertainty Measures """
+
+
+def _sum_digamma_torch(pscatter_belief, K):
+    """Sum over i=1..K of digamma((pscatter_belief - K + i) / 2), shape [batch_size, 1]."""
+    offsets = torch.arange(1.0, K + 1, dtype=pscatter_belief.dtype, device=pscatter_belief.device)
+    return torch.sum(torch.digamma((pscatter_belief - K + offsets) / 2.0), dim=1, keepdim=True)
+
+
+def _log_det_torch(pscatter):
+    """Log-determinant of the diagonal prior scatter matrix, shape [batch_size, 1]."""
+    return torch.sum(torch.log(pscatter), dim=1, keepdim=True)
+
+
+# The measures below take the log-determinant and digamma sum of the scatter as optional
+# arguments, so that niwpn_uncertainty_torch computes them once for all measures
+
+
+def entropy_of_expected_torch(pmean, pscatter, pmean_belief, pscatter_belief, log_det=None):
+    K = pscatter.size()[1]
+    if log_det is None:
+        log_det = _log_det_torch(pscatter)
+
+    eoe = torch.lgamma((pscatter_belief - K + 1) / 2.0) - torch.lgamma((pscatter_belief + 1) / 2.0) - \
+          K / 2.0 * torch.log((pscatter_belief - K + 1) * np.pi) - \
+          (pscatter_belief + 1) / 2.0 * (torch.digamma((pscatter_belief + 1) / 2.0) -
+                                         torch.digamma((pscatter_belief - K + 1) / 2.0)) + \
+          0.5 * log_det \
+          + K / 2.0 * (torch.log(pmean_belief + 1) - torch.log(pmean_belief * (pscatter_belief - K + 1)))
+
+    return torch.squeeze(eoe, dim=1)
+
+
+def expected_entropy_torch(pmean, pscatter, pmean_belief, pscatter_belief, log_det=None,
+                           sum_digamma=None):
+    K = pscatter.size()[1]
+    if log_det is None:
+        log_det = _log_det_torch(pscatter)
+    if sum_digamma is None:
+        sum_digamma = _sum_digamma_torch(pscatter_belief, K)
+    const = K + K * np.log(np.pi)
+    exe = const + log_det - sum_digamma
+
+    return torch.squeeze(0.5 * exe, dim=1)
+
+
+def mutual_information_torch(pmean, pscatter, pmean_belief, pscatter_belief):
+    log_det = _log_det_torch(pscatter)
+    eoe = entropy_of_expected_torch(pmean, pscatter, pmean_belief, pscatter_belief, log_det=log_det)
+    exe = expected_entropy_torch(pmean, pscatter, pmean_belief, pscatter_belief, log_det=log_det)
+    return eoe - exe
+
+
+def expected_pairwise_KL_torch(pmean, pscatter, pmean_belief, pscatter_belief):
+    K = pscatter.size()[1]
+    epkl = (pscatter_belief * K) / (pscatter_belief - K - 1) - K + \
+           ((pscatter_belief * K) / (pscatter_belief - K - 1) + K) / pmean_belief
+    return torch.squeeze(0.5 * epkl, dim=1)
+
+
+def differential_entropy_torch(pmean, pscatter, pmean_belief, pscatter_belief, log_det=None,
+                               sum_digamma=None):
+    K = pscatter.size()[1]
+    if log_det is None:
+        log_det = _log_det_torch(pscatter)
+    if sum_digamma is None:
+        sum_digamma = _sum_digamma_torch(pscatter_belief, K)
+    de = torch.mvlgamma(pscatter_belief / 2.0, K) + \
+         (pscatter_belief + 1) * K / 2.0 * (log_det - K * np.log(2.0)) \
+         - (pscatter_belief + K + 2) / 2.0 * sum_digamma \
+         + K * torch.log(np.pi / pmean_belief)
+
+    return torch.squeeze(de, dim=1)
+
+
+def niwpn_uncertainty_torch(pmean, pscatter, pmean_belief, pscatter_belief):
+    """
+    Batched torch counterpart of niwpn_uncertainty. Shares the log-determinant and digamma sums
+    between measures and returns tensors of shape [batch_size] on the device of the inputs.
+
+    :param pmean: prior mean, shape [batch_size, n_out]
+    :param pscatter: diagonal of the prior scatter matrix, shape [batch_size, n_out]
+    :param pmean_belief: belief in the prior mean, shape [batch_size, 1]
+    :param pscatter_belief: belief in the prior scatter, shape [batch_size, 1]
+    :return: dictionary of uncertainty measures
+    """
+    params = (pmean, pscatter, pmean_belief, pscatter_belief)
+    log_det = _log_det_torch(pscatter)
+    sum_digamma = _sum_digamma_torch(pscatter_belief, pscatter.size()[1])
+
+    eoe = entropy_of_expected_torch(*params, log_det=log_det)
+    exe = expected_entropy_torch(*params, log_det=log_det, sum_digamma=sum_digamma)
+
+    uncertainty = {'entropy_of_expected': eoe,
+                   'expected_entropy': exe,
+                   'mutual_information': eoe - exe,
+                   'EPKL': expected_pairwise_KL_torch(*params),
+                   'differential_entropy': differential_entropy_torch(*params, log_det=log_det,
+                                                                      sum_digamma=sum_digamma)}
+
+    return uncertainty
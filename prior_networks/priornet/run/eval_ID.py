@@ -10,11 +10,13 @@ import torch
 import torch.nn.functional as F
 from pathlib import Path
 
-from prior_networks.assessment.misc_detection import eval_misc_detect
 from prior_networks.evaluation import eval_logits_on_dataset
 from prior_networks.datasets.image import construct_transforms
-from prior_networks.assessment.calibration import classification_calibration
-from prior_networks.assessment.rejection import eval_rejection_ratio_class
+from prior_networks.datasets.image.eval_cache import load_eval_dataset
+from prior_networks.assessment.report import eval_in_domain
+from prior_networks.assessment.plotting import DeferredPlotter, skip_plot
+from prior_networks.assessment.bootstrap import eval_bootstrap_misc_detect, \
+    eval_bootstrap_rejection_ratio_class
 from prior_networks.priornet.dpn import dirichlet_prior_network_uncertainty
 from prior_networks.util_pytorch import DATASET_DICT, select_gpu
 from prior_networks.models.model_factory import ModelFactory
@@ -41,6 +43,20 @@ parser.add_argument('--ood', action='store_true',
                     help='Whether to evaluate on OOD data with mismatched classes - only saves outputs.')
 parser.add_argument('--overwrite', action='store_true',
                     help='Whether to overwrite a previous run of this script')
+parser.add_argument('--top_k', type=int, default=None,
+                    help='Approximate uncertainties using only the top-k concentrations. '
+                         'Computed exactly if not set.')
+parser.add_argument('--no-plots', action='store_true',
+                    help='Only compute and save metrics, without rendering any figures.')
+parser.add_argument('--n_plot_workers', type=int, default=None,
+                    help='Number of processes rendering figures once all metrics are saved. '
+                         'Uses all CPUs if not set.')
+parser.add_argument('--cache_dir', type=str, default=None,
+                    help='Directory of cached eval inputs, built on first use. Inputs are '
+                         'decoded and transformed on every run if not set.')
+parser.add_argument('--n_bootstrap', type=int, default=0,
+                    help='Number of bootstrap replicates used for 95% confidence intervals of the '
+                         'misclassification detection and rejection metrics. None if 0.')
 
 
 def main():
@@ -79,14 +95,10 @@ def main():
                                              download=True,
                                              split='train')
     else:
-        dataset = DATASET_DICT[args.dataset](root=args.data_path,
-                                             transform=construct_transforms(n_in=ckpt['n_in'],
-                                                                            mean=DATASET_DICT[args.dataset].mean,
-                                                                            std=DATASET_DICT[args.dataset].std,
-                                                                            mode='eval'),
-                                             target_transform=None,
-                                             download=True,
-                                             split='test')
+        dataset = load_eval_dataset(args.dataset, data_path=args.data_path, n_in=ckpt['n_in'],
+                                    mean=DATASET_DICT[args.dataset].mean,
+                                    std=DATASET_DICT[args.dataset].std,
+                                    split='test', cache_dir=args.cache_dir)
 
     # Evaluate the model
     logits, labels = eval_logits_on_dataset(model=model,
@@ -101,7 +113,7 @@ def main():
     np.savetxt(os.path.join(args.output_path, 'logits.txt'), logits)
 
     # Get dictionary of uncertainties.
-    uncertainties = dirichlet_prior_network_uncertainty(logits)
+    uncertainties = dirichlet_prior_network_uncertainty(logits, top_k=args.top_k)
     # Save uncertainties
     for key in uncertainties.keys():
         np.savetxt(os.path.join(args.output_path, key + '.txt'), uncertainties[key])
@@ -109,23 +121,22 @@ def main():
     if args.ood:
         sys.exit()
 
-    nll = -np.mean(np.log(probs[np.arange(probs.shape[0]), np.squeeze(labels)] + 1e-10))
-
-    accuracy = np.mean(np.asarray(labels == np.argmax(probs, axis=1), dtype=np.float32))
-    with open(os.path.join(args.output_path, 'results.txt'), 'a') as f:
-        f.write(f'Classification Error: {np.round(100 * (1.0 - accuracy), 1)} \n')
-        f.write(f'NLL: {np.round(nll, 3)} \n')
+    # Figures are rendered once all metrics have been written
+    plotter = skip_plot if args.no_plots else DeferredPlotter(n_workers=args.n_plot_workers)
 
-    # TODO: Have different results files? Or maybedifferent folders
-    # Assess Misclassification Detection
-    eval_misc_detect(labels, probs, uncertainties, save_path=args.output_path, misc_positive=True)
+    # Assess misclassification detection, calibration and rejection in a single pass
+    eval_in_domain(labels, probs, uncertainties, save_path=args.output_path, plotter=plotter)
 
-    # Assess Calibration
-    classification_calibration(labels=labels, probs=probs, save_path=args.output_path)
+    if args.n_bootstrap > 0:
+        eval_bootstrap_misc_detect(labels, probs, uncertainties, save_path=args.output_path,
+                                   misc_positive=True, n_bootstrap=args.n_bootstrap)
+        eval_bootstrap_rejection_ratio_class(labels=labels, probs=probs,
+                                             uncertainties=uncertainties,
+                                             save_path=args.output_path,
+                                             n_bootstrap=args.n_bootstrap)
 
-    # Assess Rejection Performance
-    eval_rejection_ratio_class(labels=labels, probs=probs, uncertainties=uncertainties,
-                               save_path=args.output_path)
+    if not args.no_plots:
+        plotter.render()
 
 
 if __name__ == '__main__':
@@ -12,9 +12,12 @@ import torch
 import torch.nn.functional as F
 
 from prior_networks.assessment.ood_detection import eval_ood_detect
+from prior_networks.assessment.plotting import DeferredPlotter, skip_plot
+from prior_networks.assessment.bootstrap import eval_bootstrap_ood_detect
+from prior_networks.assessment.grouped import eval_grouped_ood_detect
 from prior_networks.evaluation import eval_logits_on_dataset
-from prior_networks.datasets.image import construct_transforms
-from prior_networks.priornet.dpn import dirichlet_prior_network_uncertainty
+from prior_networks.datasets.image.eval_cache import load_eval_dataset
+from prior_networks.priornet.dpn import dirichlet_prior_network_uncertainty, MEASURE_DICT
 from prior_networks.util_pytorch import DATASET_DICT, select_gpu
 from prior_networks.models.model_factory import ModelFactory
 
@@ -39,6 +42,24 @@ parser.add_argument('--gpu', type=int, action='append',
                     help='Specify which GPUs to to run on.')
 parser.add_argument('--overwrite', action='store_true',
                     help='Whether to overwrite a previous run of this script')
+parser.add_argument('--top_k', type=int, default=None,
+                    help='Approximate uncertainties using only the top-k concentrations. '
+                         'Computed exactly if not set.')
+parser.add_argument('--measures', choices=MEASURE_DICT.keys(), action='append',
+                    help='Uncertainty measures to use for OOD detection. Uses all if not set.')
+parser.add_argument('--no-plots', action='store_true',
+                    help='Only compute and save metrics, without rendering any figures.')
+parser.add_argument('--n_plot_workers', type=int, default=None,
+                    help='Number of processes rendering figures once all metrics are saved. '
+                         'Uses all CPUs if not set.')
+parser.add_argument('--cache_dir', type=str, default=None,
+                    help='Directory of cached eval inputs, built on first use. Inputs are '
+                         'decoded and transformed on every run if not set.')
+parser.add_argument('--n_bootstrap', type=int, default=0,
+                    help='Number of bootstrap replicates used for 95% confidence intervals of the '
+                         'OOD detection metrics. None if 0.')
+parser.add_argument('--per_class', action='store_true',
+                    help='Whether to also save the AUROC of every class of the OOD data.')
 
 
 def main():
@@ -68,23 +89,16 @@ def main():
     model.eval()
 
     # Load the in-domain evaluation data
-    id_dataset = DATASET_DICT[args.id_dataset](root=args.data_path,
-                                               transform=construct_transforms(n_in=ckpt['n_in'],
-                                                                              mean=DATASET_DICT[args.id_dataset].mean,
-                                                                              std=DATASET_DICT[args.id_dataset].std,
-                                                                              mode='eval'),
-                                               target_transform=None,
-                                               download=True,
-                                               split='test')
-
-    ood_dataset = DATASET_DICT[args.ood_dataset](root=args.data_path,
-                                                 transform=construct_transforms(n_in=ckpt['n_in'],
-                                                                                mean=DATASET_DICT[args.id_dataset].mean,
-                                                                                std=DATASET_DICT[args.id_dataset].std,
-                                                                                mode='eval'),
-                                                 target_transform=None,
-                                                 download=True,
-                                                 split='test')
+    id_dataset = load_eval_dataset(args.id_dataset, data_path=args.data_path, n_in=ckpt['n_in'],
+                                   mean=DATASET_DICT[args.id_dataset].mean,
+                                   std=DATASET_DICT[args.id_dataset].std,
+                                   split='test', cache_dir=args.cache_dir)
+
+    ood_dataset = load_eval_dataset(args.ood_dataset, data_path=args.data_path,
+                                    n_in=ckpt['n_in'],
+                                    mean=DATASET_DICT[args.id_dataset].mean,
+                                    std=DATASET_DICT[args.id_dataset].std,
+                                    split='test', cache_dir=args.cache_dir)
     print(f"ID dataset length: {len(id_dataset)}, OOD dataset length: {len(ood_dataset)}")
 
 
@@ -114,8 +128,10 @@ def main():
     np.savetxt(os.path.join(args.output_path, 'ood_logits.txt'), ood_logits)
 
     # Get dictionary of uncertainties.
-    id_uncertainties = dirichlet_prior_network_uncertainty(id_logits)
-    ood_uncertainties = dirichlet_prior_network_uncertainty(ood_logits)
+    id_uncertainties = dirichlet_prior_network_uncertainty(id_logits, top_k=args.top_k,
+                                                           measures=args.measures)
+    ood_uncertainties = dirichlet_prior_network_uncertainty(ood_logits, top_k=args.top_k,
+                                                            measures=args.measures)
     # Save uncertainties
     for key in id_uncertainties.keys():
         np.savetxt(os.path.join(args.output_path, key + '_id.txt'), id_uncertainties[key])
@@ -126,10 +142,27 @@ def main():
     out_domain = np.ones_like(ood_labels)
     domain_labels = np.concatenate((in_domain, out_domain), axis=0)
 
+    # Figures are rendered once all metrics have been written
+    plotter = skip_plot if args.no_plots else DeferredPlotter(n_workers=args.n_plot_workers)
     eval_ood_detect(domain_labels=domain_labels,
                     in_uncertainties=id_uncertainties,
                     out_uncertainties=ood_uncertainties,
-                    save_path=args.output_path)
+                    save_path=args.output_path,
+                    plotter=plotter)
+    if args.n_bootstrap > 0:
+        eval_bootstrap_ood_detect(domain_labels=domain_labels,
+                                  in_uncertainties=id_uncertainties,
+                                  out_uncertainties=ood_uncertainties,
+                                  save_path=args.output_path,
+                                  n_bootstrap=args.n_bootstrap)
+    if args.per_class:
+        eval_grouped_ood_detect(domain_labels=domain_labels,
+                                in_uncertainties=id_uncertainties,
+                                out_uncertainties=ood_uncertainties,
+                                ood_groups=ood_labels,
+                                save_path=args.output_path)
+    if not args.no_plots:
+        plotter.render()
 
 
 if __name__ == '__main__':
@@ -2,6 +2,7 @@ import context
 import argparse
 import os
 import sys
+from functools import partial
 import pathlib
 from pathlib import Path
 
@@ -11,6 +12,7 @@ from prior_networks.util_pytorch import DATASET_DICT, select_gpu, choose_optimiz
 from prior_networks.training import Trainer
 from torch import optim
 from prior_networks.datasets.image.standardised_datasets import construct_transforms
+from prior_networks.datasets.image.tensor_transforms import construct_tensor_transforms
 from prior_networks.models.model_factory import ModelFactory
 
 parser = argparse.ArgumentParser(description='Train a Dirichlet Prior Network model using a '
@@ -52,6 +54,14 @@ parser.add_argument('--normalize',
 parser.add_argument('--jitter', type=float, default=0.0,
                     help='Specify how much random color, '
                          'hue, saturation and contrast jitter to apply')
+parser.add_argument('--tensor_transforms',
+                    action='store_true',
+                    help='Whether to transform uint8 tensors instead of PIL images. Faster for '
+                         'datasets held in memory, e.g. CIFAR10.')
+parser.add_argument('--batch_augment',
+                    action='store_true',
+                    help='Whether to augment whole uint8 batches in the collate function of the '
+                         'training data. Implies --tensor_transforms.')
 parser.add_argument('--resume',
                     action='store_true',
                     help='Whether to resume training from checkpoint.')
@@ -93,24 +103,34 @@ def main():
         mean = (0.5, 0.5, 0.5)
         std = (0.5, 0.5, 0.5)
 
+    if args.tensor_transforms or args.batch_augment:
+        transforms_fn = construct_tensor_transforms
+    else:
+        transforms_fn = construct_transforms
+    if args.batch_augment:
+        train_transforms_fn = partial(construct_tensor_transforms, batched=True)
+    else:
+        train_transforms_fn = transforms_fn
+
     # Load the in-domain training and validation data
     train_dataset = DATASET_DICT[args.dataset](root=args.data_path,
-                                               transform=construct_transforms(n_in=ckpt['n_in'],
-                                                                              mode='train',
-                                                                              mean=mean,
-                                                                              std=std,
-                                                                              augment=args.augment,
-                                                                              rotation=args.rotate,
-                                                                              jitter=args.jitter),
+                                               transform=train_transforms_fn(n_in=ckpt['n_in'],
+                                                                             mode='train',
+                                                                             mean=mean,
+                                                                             std=std,
+                                                                             augment=args.augment,
+                                                                             rotation=args.rotate,
+                                                                             jitter=args.jitter),
                                                target_transform=None,
                                                download=True,
                                                split='train')
+    collate_fn = train_dataset.transform.collate if args.batch_augment else None
 
     val_dataset = DATASET_DICT[args.dataset](root=args.data_path,
-                                             transform=construct_transforms(n_in=ckpt['n_in'],
-                                                                            mean=mean,
-                                                                            std=std,
-                                                                            mode='eval'),
+                                             transform=transforms_fn(n_in=ckpt['n_in'],
+                                                                     mean=mean,
+                                                                     std=std,
+                                                                     mode='eval'),
                                              target_transform=None,
                                              download=True,
                                              split='val')
@@ -138,7 +158,8 @@ def main():
                       optimizer_params=optimizer_params,
                       scheduler_params={'milestones': args.lrc, 'gamma': args.lr_decay},
                       batch_size=args.batch_size,
-                      clip_norm=args.clip_norm)
+                      clip_norm=args.clip_norm,
+                      collate_fn=collate_fn)
     if args.resume:
         try:
             trainer.load_checkpoint(True, True, map_location=device)
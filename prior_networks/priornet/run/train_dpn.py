@@ -2,6 +2,7 @@ import context
 import argparse
 import os
 import sys
+from functools import partial
 import pathlib
 from pathlib import Path
 import math
@@ -15,6 +16,7 @@ from prior_networks.priornet.training import TrainerWithOOD
 from prior_networks.util_pytorch import TargetTransform, choose_optimizer
 from torch import optim
 from prior_networks.datasets.image.standardised_datasets import construct_transforms
+from prior_networks.datasets.image.tensor_transforms import construct_tensor_transforms
 from prior_networks.models.model_factory import ModelFactory
 
 parser = argparse.ArgumentParser(description='Train a Dirichlet Prior Network model using a '
@@ -64,6 +66,22 @@ parser.add_argument('--jitter', type=float, default=0.0,
 parser.add_argument('--normalize',
                     action='store_false',
                     help='Whether to standardize input (x-mu)/std')
+parser.add_argument('--tensor_transforms',
+                    action='store_true',
+                    help='Whether to transform uint8 tensors instead of PIL images. Faster for '
+                         'datasets held in memory, e.g. CIFAR10.')
+parser.add_argument('--batch_augment',
+                    action='store_true',
+                    help='Whether to augment whole uint8 batches in the collate function of the '
+                         'training data. Implies --tensor_transforms.')
+parser.add_argument('--ood_ratio', type=int, default=1,
+                    help='Number of OOD training samples per in-domain sample.')
+parser.add_argument('--epoch_length', type=int, default=None,
+                    help='Number of in-domain training samples per epoch. An epoch is one pass '
+                         'over the in-domain data if not set, whatever the size of the OOD data.')
+parser.add_argument('--seed', type=int, default=None,
+                    help='Seed of the shuffles of the in-domain and OOD training data. Derived '
+                         'from the torch seed if not set, and restored with --resume.')
 parser.add_argument('--resume',
                     action='store_true',
                     help='Whether to resume training from checkpoint.')
@@ -104,9 +122,18 @@ def main():
         mean = (0.5, 0.5, 0.5)
         std = (0.5, 0.5, 0.5)
 
+    if args.tensor_transforms or args.batch_augment:
+        transforms_fn = construct_tensor_transforms
+    else:
+        transforms_fn = construct_transforms
+    if args.batch_augment:
+        train_transforms_fn = partial(construct_tensor_transforms, batched=True)
+    else:
+        train_transforms_fn = transforms_fn
+
     # Load the in-domain training and validation data
     train_dataset = DATASET_DICT[args.id_dataset](root=args.data_path,
-                                                  transform=construct_transforms(
+                                                  transform=train_transforms_fn(
                                                       n_in=ckpt['n_in'],
                                                       mode='train',
                                                       mean=mean,
@@ -119,7 +146,7 @@ def main():
                                                   split='train')
 
     val_dataset = DATASET_DICT[args.id_dataset](root=args.data_path,
-                                                transform=construct_transforms(
+                                                transform=transforms_fn(
                                                     n_in=ckpt['n_in'],
                                                     mean=mean,
                                                     std=std,
@@ -132,7 +159,7 @@ def main():
 
     # Load the out-of-domain training dataset
     ood_dataset = DATASET_DICT[args.ood_dataset](root=args.data_path,
-                                                 transform=construct_transforms(
+                                                 transform=train_transforms_fn(
                                                      n_in=ckpt['n_in'],
                                                      mean=mean,
                                                      std=std,
@@ -141,7 +168,7 @@ def main():
                                                  download=True,
                                                  split='train')
     ood_val_dataset = DATASET_DICT[args.ood_dataset](root=args.data_path,
-                                                     transform=construct_transforms(
+                                                     transform=transforms_fn(
                                                          n_in=ckpt['n_in'],
                                                          mean=mean,
                                                          std=std,
@@ -150,30 +177,13 @@ def main():
                                                      download=True,
                                                      split='val')
 
-    # Combine ID and OOD training datasets into a single dataset for
-    # training (necessary for DataParallel training)
-    assert len(val_dataset) == len(ood_val_dataset)
-
-    # Even out dataset lengths.
-    id_ratio = 1.0
-    if len(train_dataset) < len(ood_dataset):
-        id_ratio = np.ceil(float(len(ood_dataset)) / float(len(train_dataset)))
-        assert id_ratio.is_integer()
-        dataset_list = [train_dataset, ] * (int(id_ratio))
-        train_dataset = data.ConcatDataset(dataset_list)
-
-    if len(train_dataset) > len(ood_dataset):
-        ratio = np.ceil(float(len(train_dataset)) / float(len(ood_dataset)))
-        assert ratio.is_integer()
-        dataset_list = [ood_dataset, ] * int(ratio)
-        ood_dataset = data.ConcatDataset(dataset_list)
+    collate_fn = train_dataset.transform.collate if args.batch_augment else None
+    ood_collate_fn = ood_dataset.transform.collate if args.batch_augment else None
 
-        if len(ood_dataset) > len(train_dataset):
-            ood_dataset = data.Subset(ood_dataset, np.arange(0, len(train_dataset)))
-
-    assert len(train_dataset) == len(ood_dataset)
+    assert len(val_dataset) == len(ood_val_dataset)
     print(f"Validation dataset length: {len(val_dataset)}")
     print(f"Train dataset length: {len(train_dataset)}")
+    print(f"OOD train dataset length: {len(ood_dataset)}")
 
     # Set up training and test criteria
     id_criterion = DirichletKLLoss(target_concentration=args.target_concentration,
@@ -192,7 +202,6 @@ def main():
                                                    args.weight_decay)
 
     # Setup model trainer and train model
-    lrc = [int(lrc / id_ratio) for lrc in args.lrc]
     trainer = TrainerWithOOD(model=model,
                              criterion=criterion,
                              id_criterion=id_criterion,
@@ -207,16 +216,21 @@ def main():
                              checkpoint_path=checkpoint_path,
                              scheduler=optim.lr_scheduler.MultiStepLR,
                              optimizer_params=optimizer_params,
-                             scheduler_params={'milestones': lrc, 'gamma': args.lr_decay},
+                             scheduler_params={'milestones': args.lrc, 'gamma': args.lr_decay},
                              batch_size=args.batch_size,
-                             clip_norm=args.clip_norm)
+                             clip_norm=args.clip_norm,
+                             collate_fn=collate_fn,
+                             ood_collate_fn=ood_collate_fn,
+                             epoch_length=args.epoch_length,
+                             ood_ratio=args.ood_ratio,
+                             seed=args.seed)
     if args.resume:
         try:
             trainer.load_checkpoint(True, True, map_location=device)
         except:
             print('No checkpoint found, training from empty model.')
             pass
-    trainer.train(int(args.n_epochs / id_ratio), resume=args.resume)
+    trainer.train(args.n_epochs, resume=args.resume)
 
     # Save final model
     if len(args.gpu) > 1 and torch.cuda.device_count() > 1:
@@ -1,4 +1,5 @@
 from typing import Dict, Any
+import math
 import sys
 import torch
 import numpy as np
@@ -9,8 +10,9 @@ from torch.nn.utils import clip_grad_norm_
 from prior_networks.training import Trainer, calc_accuracy_torch
 from torch.distributions.categorical import Categorical
 from torch.distributions.normal import Normal
-from prior_networks.priornet.dpn import dirichlet_prior_network_uncertainty
-from sklearn.metrics import roc_auc_score
+from prior_networks.priornet.dpn import PriorNet
+from prior_networks.assessment.streaming import StreamingAUROC
+from prior_networks.datasets.sampling import BalancedPairSampler, PairedDataset, PairCollate
 
 
 class TrainerWithOOD(Trainer):
@@ -34,7 +36,13 @@ class TrainerWithOOD(Trainer):
                  clip_norm: float = 10.0,
                  pin_memory=False,
                  checkpoint_path='./',
-                 checkpoint_steps=0):
+                 checkpoint_steps=0,
+                 n_auroc_bins=10000,
+                 collate_fn=None,
+                 ood_collate_fn=None,
+                 epoch_length=None,
+                 ood_ratio=1,
+                 seed=None):
         super().__init__(model=model,
                          criterion=criterion,
                          train_dataset=train_dataset,
@@ -51,35 +59,78 @@ class TrainerWithOOD(Trainer):
                          pin_memory=pin_memory,
                          clip_norm=clip_norm,
                          checkpoint_path=checkpoint_path,
-                         checkpoint_steps=checkpoint_steps)
+                         checkpoint_steps=checkpoint_steps,
+                         collate_fn=collate_fn)
 
-        assert len(train_dataset) == len(ood_dataset)
         assert len(test_dataset) == len(test_ood_dataset)
         self.id_criterion = id_criterion
         self.ood_criterion = ood_criterion
+        self.n_auroc_bins = n_auroc_bins
+        self.ood_ratio = ood_ratio
+
+        # Every epoch has epoch_length in-domain samples, by default one pass over the in-domain
+        # data, paired with ood_ratio OOD samples each whatever the size of the OOD data.
+        # The seed of the shuffles is saved in checkpoints, so resumed epochs are unchanged
+        self.pair_sampler = BalancedPairSampler(len(train_dataset), len(ood_dataset),
+                                                epoch_length=epoch_length, ood_ratio=ood_ratio,
+                                                seed=torch.initial_seed() if seed is None else seed)
+        # A single pool of workers loads ID and OOD items of every batch
+        self.trainloader = DataLoader(PairedDataset(train_dataset, ood_dataset),
+                                      batch_sampler=self.pair_sampler.batch_sampler(batch_size),
+                                      num_workers=self.num_workers, pin_memory=self.pin_memory,
+                                      collate_fn=PairCollate(collate_fn, ood_collate_fn))
+        self.testloader = DataLoader(PairedDataset(test_dataset, test_ood_dataset),
+                                     batch_size=batch_size, shuffle=False,
+                                     num_workers=self.num_workers, pin_memory=self.pin_memory,
+                                     collate_fn=PairCollate())
+        self._cat_inputs = None
+
+    def _checkpoint_state(self):
+        state = super()._checkpoint_state()
+        state['sampler_seed'] = self.pair_sampler.seed
+        return state
+
+    def load_checkpoint(self, load_opt_state=False, load_scheduler_state=False, map_location=None):
+        checkpoint = super().load_checkpoint(load_opt_state=load_opt_state,
+                                             load_scheduler_state=load_scheduler_state,
+                                             map_location=map_location)
+        if 'sampler_seed' in checkpoint:
+            self.pair_sampler.set_seed(checkpoint['sampler_seed'])
+        return checkpoint
+
+    def _interleave(self, inputs, ood_inputs):
+        """
+        Copies every ID input followed by its OOD inputs into a buffer reused by every step, so
+        that DataParallel splits both evenly across devices.
 
-        self.oodloader = DataLoader(ood_dataset, batch_size=batch_size,
-                                    shuffle=True, num_workers=1, pin_memory=self.pin_memory)
-        self.test_oodloader = DataLoader(test_ood_dataset, batch_size=batch_size,
-                                         shuffle=False, num_workers=1, pin_memory=self.pin_memory)
+        :return: inputs with shape [n_id * (1 + ood_ratio), ...]
+        """
+        n_id, shape = inputs.size()[0], inputs.size()[1:]
+        device = inputs.device if self.device is None else self.device
+        if self._cat_inputs is None or self._cat_inputs.size()[0] < n_id \
+                or self._cat_inputs.size()[2:] != shape:
+            self._cat_inputs = torch.empty(torch.Size([n_id, 1 + self.ood_ratio]) + shape,
+                                           dtype=inputs.dtype, device=device)
+        cat_inputs = self._cat_inputs[:n_id]
+        cat_inputs[:, 0].copy_(inputs, non_blocking=self.pin_memory)
+        cat_inputs[:, 1:].copy_(ood_inputs.view(torch.Size([n_id, self.ood_ratio]) + shape),
+                                non_blocking=self.pin_memory)
+        return cat_inputs.view(torch.Size([n_id * (1 + self.ood_ratio)]) + shape)
 
     def _train_single_epoch(self):
         # Set model in train mode
         self.model.train()
+        self.pair_sampler.set_epoch(self.steps // len(self.trainloader))
 
         accuracies = 0.0
         id_loss, ood_loss = 0.0, 0.0
         id_alpha_0, ood_alpha_0 = 0.0, 0.0
-        for i, (data, ood_data) in enumerate(
-                zip(self.trainloader, self.oodloader), 0):
-            # Get inputs
-            inputs, labels = data
-            ood_inputs, _ = ood_data
+        for i, (inputs, labels, ood_inputs) in enumerate(self.trainloader, 0):
+            n_id = inputs.size()[0]
+            cat_inputs = self._interleave(inputs, ood_inputs)
             if self.device is not None:
                 # Move data to adequate device
-                inputs, labels, ood_inputs = map(lambda x: x.to(self.device,
-                                                                non_blocking=self.pin_memory),
-                                                 (inputs, labels, ood_inputs))
+                labels = labels.to(self.device, non_blocking=self.pin_memory)
 
             # zero the parameter gradients
             self.optimizer.zero_grad()
@@ -88,10 +139,9 @@ class TrainerWithOOD(Trainer):
             # outputs = self.model(inputs)
             # id_outputs, ood_outputs = torch.chunk(outputs, 2, dim=0)
 
-            cat_inputs = torch.cat([inputs, ood_inputs], dim=1).view(
-                torch.Size([2 * inputs.size()[0]]) + inputs.size()[1:])
-            logits = self.model(cat_inputs).view([inputs.size()[0], -1])
-            id_outputs, ood_outputs = torch.chunk(logits, 2, dim=1)
+            logits = self.model(cat_inputs).view([n_id, 1 + self.ood_ratio, -1])
+            id_outputs = logits[:, 0]
+            ood_outputs = logits[:, 1:].reshape([n_id * self.ood_ratio, -1])
 
             # Calculate train loss
             loss = self.criterion((id_outputs, ood_outputs), (labels, None))
@@ -152,16 +202,13 @@ class TrainerWithOOD(Trainer):
         """
         id_loss, ood_loss, accuracy = 0.0, 0.0, 0.0
 
-        domain_labels = []
-        id_logits, ood_logits = [], []
+        auroc = StreamingAUROC(n_bins=self.n_auroc_bins, min_score=-30.0, max_score=0.0,
+                               device=self.device)
         # Set model in eval mode
         self.model.eval()
         id_alpha_0, ood_alpha_0 = 0.0, 0.0
         with torch.no_grad():
-            for i, (data, ood_data) in enumerate(zip(self.testloader, self.test_oodloader), 0):
-                # Get inputs
-                id_inputs, labels = data
-                ood_inputs, _ = ood_data
+            for i, (id_inputs, labels, ood_inputs) in enumerate(self.testloader, 0):
                 if self.device is not None:
                     id_inputs, labels, ood_inputs = map(lambda x: x.to(self.device, non_blocking=self.pin_memory),
                                                         (id_inputs, labels, ood_inputs))
@@ -179,35 +226,30 @@ class TrainerWithOOD(Trainer):
                 id_alpha_0 += torch.mean(torch.sum(torch.exp(id_outputs), dim=1)).item()
                 ood_alpha_0 += torch.mean(torch.sum(torch.exp(ood_outputs), dim=1)).item()
 
-                # Append logits for future OOD detection at test time calculation...
-                id_logits.append(id_outputs.cpu().numpy())
-                ood_logits.append(ood_outputs.cpu().numpy())
+                # Accumulate OOD detection performance using mutual information. It is binned
+                # on a log scale, normalised by its upper bound log(n_classes), as in-domain
+                # values are typically orders of magnitude smaller than OOD ones.
+                logits = torch.cat([id_outputs, ood_outputs], dim=0)
+                domain_labels = torch.cat([torch.zeros(id_outputs.size()[0], dtype=torch.int64),
+                                           torch.ones(ood_outputs.size()[0], dtype=torch.int64)])
+                mutual_info = PriorNet.mutual_information_from_logits(logits) / math.log(logits.size()[1])
+                auroc.update(torch.log(torch.clamp(mutual_info, min=math.exp(-30.0))), domain_labels)
 
         # Noramlize everything by number of batches
         id_alpha_0 = id_alpha_0 / len(self.testloader)
-        ood_alpha_0 = ood_alpha_0 / len(self.test_oodloader)
+        ood_alpha_0 = ood_alpha_0 / len(self.testloader)
         id_loss = id_loss / len(self.testloader)
         ood_loss = ood_loss / len(self.testloader)
         accuracy = accuracy / len(self.testloader)
 
-        # Calculate Uncertainties
-        id_logits = np.concatenate(id_logits, axis=0)
-        ood_logits = np.concatenate(ood_logits, axis=0)
-        logits = np.concatenate([id_logits, ood_logits], axis=0)
-        uncertainties = dirichlet_prior_network_uncertainty(logits)['mutual_information']
-
-        in_domain = np.zeros(shape=[id_logits.shape[0]], dtype=np.int32)
-        ood_domain = np.ones(shape=[ood_logits.shape[0]], dtype=np.int32)
-        domain_labels = np.concatenate([in_domain, ood_domain], axis=0)
-
-        auc = roc_auc_score(domain_labels, uncertainties)
+        auc, auc_error = auroc.compute()
 
         print(f"Test ID Loss: {np.round(id_loss, 1)}; "
               f"Test OOD Loss: {np.round(ood_loss, 1)}; "
               f"Test Error: {np.round(100.0 * (1.0 - accuracy), 1)}%; "
               f"Test ID precision: {np.round(id_alpha_0, 1)}; "
               f"Test OOD precision: {np.round(ood_alpha_0, 1)}; "
-              f"Test AUROC: {np.round(100.0 * auc, 1)}; "
+              f"Test AUROC: {np.round(100.0 * auc, 1)} (max error {np.round(100.0 * auc_error, 2)}); "
               f"Time Per Epoch: {np.round(time / 60.0, 1)} min")
 
         with open('./LOG.txt', 'a') as f:
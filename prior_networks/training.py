@@ -26,7 +26,8 @@ class Trainer:
                  num_workers=4,
                  pin_memory=False,
                  checkpoint_path='./',
-                 checkpoint_steps=0):
+                 checkpoint_steps=0,
+                 collate_fn=None):
         assert isinstance(model, nn.Module)
         assert isinstance(train_dataset, Dataset)
         assert isinstance(test_dataset, Dataset)
@@ -60,7 +61,8 @@ class Trainer:
                                       batch_size=batch_size,
                                       shuffle=True,
                                       num_workers=self.num_workers,
-                                      pin_memory=self.pin_memory)
+                                      pin_memory=self.pin_memory,
+                                      collate_fn=collate_fn)
         self.testloader = DataLoader(test_dataset,
                                      batch_size=batch_size,
                                      shuffle=False,
@@ -80,14 +82,7 @@ class Trainer:
             checkpoint_name = 'checkpoint.tar'
 
         print(f"Saving checkpoint to {self.checkpoint_path}...")
-        torch.save({
-            'steps': self.steps,
-            'model_state_dict': self.model.state_dict(),
-            'optimizer_state_dict': self.optimizer.state_dict(),
-            'lr_scheduler_state_dict': self.scheduler.state_dict(),
-            'train_loss': self.train_loss,
-            'test_loss': self.test_loss
-        }, os.path.join(self.checkpoint_path, checkpoint_name))
+        torch.save(self._checkpoint_state(), os.path.join(self.checkpoint_path, checkpoint_name))
         try:
             import nirvana_dl.snapshot as snap
             snap.dump_snapshot()
@@ -96,6 +91,16 @@ class Trainer:
             print('Checkpoint NOT save to snapshots!')
             pass
 
+    def _checkpoint_state(self):
+        return {
+            'steps': self.steps,
+            'model_state_dict': self.model.state_dict(),
+            'optimizer_state_dict': self.optimizer.state_dict(),
+            'lr_scheduler_state_dict': self.scheduler.state_dict(),
+            'train_loss': self.train_loss,
+            'test_loss': self.test_loss
+        }
+
     def load_checkpoint(self, load_opt_state=False, load_scheduler_state=False, map_location=None):
         checkpoint_path = os.path.join(self.checkpoint_path, 'checkpoint.tar')
         checkpoint = torch.load(checkpoint_path, map_location=map_location)
@@ -110,6 +115,7 @@ class Trainer:
             self.scheduler.load_state_dict(checkpoint['lr_scheduler_state_dict'])
 
         print(f"Model restored from checkpoint {checkpoint_path}")
+        return checkpoint
 
     def train(self, n_epochs=None, n_iter=None, resume=False):
         # Calc num of epochs
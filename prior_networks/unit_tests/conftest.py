@@ -0,0 +1,21 @@
+import pytest
+
+""" Benchmarks print timings and are only run with --benchmarks """
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmarks', action='store_true',
+                     help='Also run the tests marked as benchmarks, which print timings.')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: prints timings, skipped unless --benchmarks')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmarks'):
+        return
+    skip = pytest.mark.skip(reason='benchmark, run with --benchmarks')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
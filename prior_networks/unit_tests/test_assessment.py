@@ -0,0 +1,492 @@
+import context
+import json
+import os
+import time
+import pytest
+
+import numpy as np
+import torch
+from sklearn.metrics import roc_auc_score, roc_curve, precision_recall_curve, auc
+
+from prior_networks.assessment.ood_detection import ood_detection_metrics, eval_ood_detect, \
+    sorted_detection_metrics, delong_test, adversarial_detection_metrics, mod_roc_curve, \
+    predictions_flipped
+from prior_networks.assessment.plotting import DeferredPlotter, skip_plot
+from prior_networks.assessment.streaming import StreamingAUROC, ScoreSketch
+from prior_networks.assessment.visualize_uncertainty import plot_sketch_histogram
+from prior_networks.assessment.rejection import rejection_curves, sorted_rejection_ratios, \
+    eval_rejection_ratio_class
+from prior_networks.assessment.misc_detection import eval_misc_detect
+from prior_networks.assessment.report import eval_in_domain
+from prior_networks.assessment.grouped import grouped_auroc, grouped_ood_auroc, \
+    grouped_classification_metrics, eval_grouped_ood_detect
+from prior_networks.assessment.bootstrap import bootstrap_sorted, bootstrap_detection, \
+    bootstrap_rejection_ratio
+from prior_networks.assessment.calibration import calibration_metrics, classification_calibration
+
+
+@pytest.fixture
+def ood_scores():
+    rng = np.random.RandomState(0)
+    domain_labels = np.r_[np.zeros(3000, dtype=np.int32), np.ones(2000, dtype=np.int32)]
+    # Rounded scores have many ties, uniform scores carry no information
+    scores = np.stack([rng.randn(5000) + domain_labels,
+                       np.round(rng.randn(5000) + domain_labels, 1),
+                       rng.rand(5000)], axis=0)
+    return domain_labels, scores
+
+
+def test_ood_detection_metrics_match_sklearn(ood_scores):
+    domain_labels, scores = ood_scores
+    metrics, curves = ood_detection_metrics(domain_labels, scores, return_curves=True)
+
+    for i in range(scores.shape[0]):
+        fpr, tpr, _ = roc_curve(domain_labels, scores[i])
+        precision, recall, _ = precision_recall_curve(domain_labels, scores[i])
+        in_precision, in_recall, _ = precision_recall_curve(1 - domain_labels, -scores[i])
+
+        assert metrics['AUROC'][i] == pytest.approx(roc_auc_score(domain_labels, scores[i]))
+        assert metrics['AUPR-Out'][i] == pytest.approx(auc(recall, precision))
+        assert metrics['AUPR-In'][i] == pytest.approx(auc(in_recall, in_precision))
+        assert metrics['FPR@95TPR'][i] == fpr[np.argmax(tpr >= 0.95)]
+        assert metrics['detection_error'][i] == pytest.approx(np.min(0.5 * (1.0 - tpr) + 0.5 * fpr))
+        np.testing.assert_array_equal(curves[i]['fpr'], fpr)
+        np.testing.assert_array_equal(curves[i]['tpr'], tpr)
+        np.testing.assert_allclose(curves[i]['precision'], precision)
+        np.testing.assert_array_equal(curves[i]['recall'], recall)
+
+    single = ood_detection_metrics(domain_labels, scores[0])
+    assert single['AUROC'] == metrics['AUROC'][0]
+
+
+@pytest.mark.benchmark
+def test_ood_detection_metrics_benchmark():
+    rng = np.random.RandomState(0)
+    domain_labels = rng.randint(0, 2, size=200000)
+    scores = rng.randn(5, 200000) + domain_labels
+
+    start = time.time()
+    metrics = ood_detection_metrics(domain_labels, scores)
+    engine_time = time.time() - start
+
+    start = time.time()
+    for i in range(scores.shape[0]):
+        roc_curve(domain_labels, scores[i])
+        roc_auc_score(domain_labels, scores[i])
+        precision, recall, _ = precision_recall_curve(domain_labels, scores[i])
+        auc(recall, precision)
+    sklearn_time = time.time() - start
+
+    print(f"OOD metrics, 5 measures x 200000 examples: engine {engine_time:.3f}s, "
+          f"sklearn {sklearn_time:.3f}s")
+    assert metrics['AUROC'].shape == (5,)
+
+
+def quadratic_rejection_curves(labels, preds, measure, rev):
+    """The original O(N^2) rejection curves, with base_error made a scalar for newer numpy"""
+    inds = np.argsort(measure)[::-1] if rev else np.argsort(measure)
+    total_data = float(preds.shape[0])
+    errors, percentages = [], []
+    for i in range(preds.shape[0]):
+        errors.append(np.sum(
+            np.asarray(labels[inds[:i]] != preds[inds[:i]], dtype=np.float32)) * 100.0 / total_data)
+        percentages.append(float(i + 1) / total_data * 100.0)
+    errors, percentages = np.asarray(errors)[:, np.newaxis], np.asarray(percentages)
+
+    base_error = errors[-1, 0]
+    n_items = errors.shape[0]
+    auc_uns = 1.0 - auc(percentages / 100.0, errors[::-1] / 100.0)
+    random_rejection = np.asarray(
+        [base_error * (1.0 - float(i) / float(n_items)) for i in range(n_items)], dtype=np.float32)
+    auc_rnd = 1.0 - auc(percentages / 100.0, random_rejection / 100.0)
+    orc_rejection = np.asarray(
+        [base_error * (1.0 - float(i) / float(base_error / 100.0 * n_items)) for i in
+         range(int(base_error / 100.0 * n_items))], dtype=np.float32)
+    orc = np.zeros_like(errors)
+    orc[0:orc_rejection.shape[0], 0] = orc_rejection
+    auc_orc = 1.0 - auc(percentages / 100.0, orc / 100.0)
+    rejection_ratio = (auc_uns - auc_rnd) / (auc_orc - auc_rnd) * 100.0
+    return rejection_ratio, percentages, np.squeeze(errors), np.squeeze(random_rejection), np.squeeze(orc)
+
+
+def make_classification(n_examples, seed=0):
+    rng = np.random.RandomState(seed)
+    labels = rng.randint(0, 10, size=n_examples)
+    confidence = rng.rand(n_examples)
+    preds = np.where(rng.rand(n_examples) < confidence, labels, (labels + 1) % 10)
+    return labels, preds, confidence
+
+
+@pytest.mark.parametrize('rev', [True, False])
+def test_rejection_curves_match_quadratic(rev):
+    labels, preds, confidence = make_classification(2000)
+    measure = confidence if rev else 1.0 - confidence
+
+    expected = quadratic_rejection_curves(labels, preds, measure, rev)
+    curves = rejection_curves(labels, preds, measure, rev)
+    for value, expected_value in zip(curves, expected):
+        np.testing.assert_allclose(value, expected_value, rtol=1e-6)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('n_examples', [10000, 100000, 1000000])
+def test_rejection_curves_benchmark(n_examples):
+    labels, preds, confidence = make_classification(n_examples)
+
+    start = time.time()
+    rejection_ratio = rejection_curves(labels, preds, confidence, rev=True)[0]
+    print(f"Rejection curves, {n_examples} examples: {time.time() - start:.3f}s")
+    assert rejection_ratio > 0.0
+
+
+def loop_calibration(labels, probs, bins):
+    """Per-bin loops over masks, used as a reference"""
+    preds, confidences = np.argmax(probs, axis=1), np.max(probs, axis=1)
+    correct = np.asarray(preds == labels, dtype=np.float64)
+    n_examples = labels.shape[0]
+    bin_idx = np.minimum(np.floor(confidences * bins), bins - 1)
+
+    ece, mce = 0.0, 0.0
+    for i in range(bins):
+        mask = bin_idx == i
+        if np.any(mask):
+            gap = np.abs(np.mean(correct[mask]) - np.mean(confidences[mask]))
+            ece += gap * np.sum(mask) / n_examples
+            mce = max(mce, gap)
+
+    adaptive_ece = 0.0
+    for inds in np.array_split(np.argsort(confidences), bins):
+        adaptive_ece += np.abs(np.sum(correct[inds]) - np.sum(confidences[inds])) / n_examples
+
+    classwise_ece = 0.0
+    for k in range(probs.shape[1]):
+        class_bins = np.minimum(np.floor(probs[:, k] * bins), bins - 1)
+        for i in range(bins):
+            mask = class_bins == i
+            classwise_ece += np.abs(np.sum(labels[mask] == k) - np.sum(probs[mask, k])) / n_examples
+    return ece, mce, adaptive_ece, classwise_ece / probs.shape[1]
+
+
+def test_calibration_metrics_match_loops():
+    rng = np.random.RandomState(0)
+    labels = rng.randint(0, 5, size=1000)
+    probs = rng.dirichlet(np.ones(5), size=[3, 1000])
+
+    metrics = calibration_metrics(labels, probs, bins=10)
+    for m in range(probs.shape[0]):
+        expected = loop_calibration(labels, probs[m], bins=10)
+        for key, value in zip(['ECE', 'MCE', 'adaptive_ECE', 'classwise_ECE'], expected):
+            assert metrics[key][m] == pytest.approx(value)
+
+    single = calibration_metrics(labels, probs[0], bins=10)
+    assert single['ECE'] == metrics['ECE'][0]
+    assert np.sum(single['counts']) == 1000
+
+
+def test_deferred_plotter(tmp_path, ood_scores):
+    domain_labels, scores = ood_scores
+    in_uncertainties = {'entropy': scores[0, :3000]}
+    out_uncertainties = {'entropy': scores[0, 3000:]}
+
+    eval_ood_detect(domain_labels, in_uncertainties, out_uncertainties, save_path=str(tmp_path),
+                    plotter=skip_plot)
+    assert not any(name.endswith('.png') for name in os.listdir(tmp_path))
+    assert os.path.isfile(os.path.join(tmp_path, 'results.txt'))
+
+    plotter = DeferredPlotter(n_workers=1)
+    eval_ood_detect(domain_labels, in_uncertainties, out_uncertainties, save_path=str(tmp_path),
+                    plotter=plotter)
+    assert len(plotter.jobs) == 2
+    assert not any(name.endswith('.png') for name in os.listdir(tmp_path))
+    plotter.render()
+    assert os.path.isfile(os.path.join(tmp_path, 'ROC_entropy.png'))
+    assert os.path.isfile(os.path.join(tmp_path, 'PR_entropy.png'))
+
+
+def test_streaming_auroc_matches_exact(ood_scores):
+    domain_labels, scores = ood_scores
+    # Scale into [0, 1]; the rounded measure only has tied values within bins
+    scores = (scores - np.min(scores, axis=1, keepdims=True)) / np.ptp(scores, axis=1, keepdims=True)
+    exact = ood_detection_metrics(domain_labels, scores)['AUROC']
+
+    for i in range(scores.shape[0]):
+        estimators = [StreamingAUROC(n_bins=1000) for _ in range(2)]
+        for j, start in enumerate(range(0, 5000, 128)):
+            estimators[j % 2].update(torch.tensor(scores[i, start:start + 128]),
+                                     torch.tensor(domain_labels[start:start + 128]))
+        auroc, max_error = estimators[0].merge(estimators[1]).compute()
+
+        assert abs(auroc - exact[i]) <= max_error + 1e-12
+        assert max_error < 1e-3 or i == 1
+
+
+def test_sorted_rejection_ratios_match_curves():
+    labels, preds, confidence = make_classification(2000)
+    wrong = np.asarray(labels != preds, dtype=np.float64)
+    order = np.argsort(confidence)[::-1]
+    expected = rejection_curves(labels, preds, confidence, rev=True)[0]
+    rows = np.stack([wrong[order], wrong[order[::-1]], np.zeros(2000)])
+    with np.errstate(all='raise'):
+        ratios = sorted_rejection_ratios(rows)
+    np.testing.assert_allclose(ratios[0], expected, rtol=1e-6)
+    np.testing.assert_allclose(ratios[1], -expected, rtol=1e-2)
+    # Without errors, the oracle is random and the ratio is undefined
+    assert np.isnan(ratios[2])
+
+
+def test_bootstrap_replicates_match_resorting(ood_scores):
+    domain_labels, scores = ood_scores
+    order = np.argsort(-scores[1], kind='stable')
+
+    def statistic(sorted_inds):
+        return sorted_detection_metrics(domain_labels[sorted_inds], scores[1][sorted_inds])[0]
+
+    replicates = bootstrap_sorted(order, statistic, n_bootstrap=20, batch_size=20, seed=3)
+    # Draw the same resamples and sort each of them
+    for i, replicate_seed in enumerate(np.random.SeedSequence(3).spawn(20)):
+        inds = np.random.default_rng(replicate_seed).integers(0, 5000, 5000)
+        expected = ood_detection_metrics(domain_labels[inds], scores[1][inds])
+        for key, value in expected.items():
+            np.testing.assert_allclose(replicates[key][i], value, rtol=1e-12)
+
+
+def test_bootstrap_independent_of_batching(ood_scores):
+    domain_labels, scores = ood_scores
+    order = np.argsort(-scores[0], kind='stable')
+
+    def statistic(sorted_inds):
+        return sorted_detection_metrics(domain_labels[sorted_inds], scores[0][sorted_inds])[0]
+
+    expected = bootstrap_sorted(order, statistic, n_bootstrap=30, batch_size=30, n_workers=1)
+    for batch_size, n_workers, memory_budget in [(7, 1, None), (1, 3, None), (None, 4, 2 ** 20),
+                                                 (None, None, 2 ** 30)]:
+        kwargs = {} if memory_budget is None else {'memory_budget': memory_budget}
+        replicates = bootstrap_sorted(order, statistic, n_bootstrap=30, batch_size=batch_size,
+                                      n_workers=n_workers, **kwargs)
+        for key in expected.keys():
+            np.testing.assert_array_equal(replicates[key], expected[key])
+
+
+def test_bootstrap_intervals(ood_scores):
+    domain_labels, scores = ood_scores
+    metrics = ood_detection_metrics(domain_labels, scores[0])
+    intervals = bootstrap_detection(domain_labels, scores[0], n_bootstrap=200, n_workers=1)
+    assert intervals == bootstrap_detection(domain_labels, scores[0], n_bootstrap=200,
+                                            n_workers=4)
+    for key, (lower, upper) in intervals.items():
+        assert lower <= metrics[key] <= upper
+
+    labels, preds, confidence = make_classification(2000)
+    lower, upper = bootstrap_rejection_ratio(labels, preds, confidence, rev=True, n_bootstrap=200)
+    assert lower <= rejection_curves(labels, preds, confidence, rev=True)[0] <= upper
+
+
+@pytest.mark.benchmark
+def test_bootstrap_benchmark():
+    labels, preds, confidence = make_classification(10000)
+    domain_labels = np.asarray(labels == preds, dtype=np.int64)
+
+    start = time.time()
+    bootstrap_detection(domain_labels, confidence, n_bootstrap=1000)
+    print(f"Bootstrap detection metrics, 10000 examples, 1000 replicates: "
+          f"{time.time() - start:.3f}s")
+    start = time.time()
+    bootstrap_rejection_ratio(labels, preds, confidence, rev=True, n_bootstrap=1000)
+    print(f"Bootstrap rejection ratio, 10000 examples, 1000 replicates: "
+          f"{time.time() - start:.3f}s")
+
+
+def quadratic_delong(domain_labels, scores):
+    """DeLong covariance from all pairwise comparisons, used as a reference"""
+    pos, neg = scores[:, domain_labels == 1], scores[:, domain_labels == 0]
+    psi = (pos[:, :, np.newaxis] > neg[:, np.newaxis, :]) \
+        + 0.5 * (pos[:, :, np.newaxis] == neg[:, np.newaxis, :])
+    pos_components, neg_components = np.mean(psi, axis=2), np.mean(psi, axis=1)
+    covariance = np.cov(pos_components) / pos.shape[1] + np.cov(neg_components) / neg.shape[1]
+    return np.mean(psi, axis=(1, 2)), covariance
+
+
+def test_delong_test_matches_quadratic(ood_scores):
+    domain_labels, scores = ood_scores
+    inds = np.r_[0:600, 3000:3400]
+    aurocs, covariance, p_values = delong_test(domain_labels[inds], scores[:, inds])
+    expected_aurocs, expected_covariance = quadratic_delong(domain_labels[inds], scores[:, inds])
+
+    np.testing.assert_allclose(aurocs, expected_aurocs, rtol=1e-12)
+    np.testing.assert_allclose(aurocs, [roc_auc_score(domain_labels[inds], row)
+                                        for row in scores[:, inds]])
+    np.testing.assert_allclose(covariance, expected_covariance, rtol=1e-10, atol=1e-15)
+    np.testing.assert_allclose(np.diag(p_values), 1.0)
+    # The informative measures beat the uniform one
+    assert p_values[0, 2] < 1e-6 and p_values[1, 2] < 1e-6
+    np.testing.assert_allclose(p_values, p_values.T)
+
+
+@pytest.mark.benchmark
+def test_delong_test_benchmark():
+    rng = np.random.RandomState(0)
+    domain_labels = np.r_[np.zeros(100000), np.ones(100000)]
+    scores = rng.randn(5, 200000) + domain_labels * np.linspace(0.0, 1.0, 5)[:, np.newaxis]
+
+    start = time.time()
+    delong_test(domain_labels, scores)
+    print(f"DeLong test, 5 measures, 200000 examples: {time.time() - start:.3f}s")
+
+
+def test_score_sketch_matches_exact(ood_scores, tmp_path):
+    domain_labels, scores = ood_scores
+    measures = ['mutual_information', 'rounded', 'confidence']
+    exact = ood_detection_metrics(domain_labels, scores * np.array([[1.0], [1.0], [-1.0]]))
+
+    sketches = [ScoreSketch(measures) for _ in range(2)]
+    for j, start in enumerate(range(0, 5000, 128)):
+        sketches[j % 2].update({key: scores[i, start:start + 128]
+                                for i, key in enumerate(measures)},
+                               domain_labels[start:start + 128])
+    sketch = sketches[0].merge(sketches[1])
+    aurocs, fprs = sketch.auroc(), sketch.fpr_at_95_tpr()
+
+    for i, key in enumerate(measures):
+        auroc, max_error = aurocs[key]
+        assert abs(auroc - exact['AUROC'][i]) <= max_error + 1e-12
+        fpr, max_error = fprs[key]
+        assert abs(fpr - exact['FPR@95TPR'][i]) <= max_error + 1e-12
+        edges, counts, ood_counts = sketch.histogram(key, bins=25)
+        assert np.sum(counts) == 3000 and np.sum(ood_counts) == 2000
+        # Rounded scores pile up on sketch bins which may straddle the histogram edges
+        if key != 'rounded':
+            assert max_error < 5e-3
+            expected = np.histogram(scores[i, domain_labels == 0], bins=edges)[0]
+            assert np.max(np.abs(counts - expected)) <= 10
+
+    plot_sketch_histogram(sketch, 'confidence', save_path=str(tmp_path))
+    assert os.path.isfile(os.path.join(tmp_path, 'Histogram_confidence.png'))
+
+
+def test_eval_in_domain_matches_separate_evaluation(tmp_path):
+    labels, preds, confidence = make_classification(2000)
+    rng = np.random.RandomState(1)
+    probs = rng.dirichlet(np.ones(10), size=2000) * (1.0 - confidence[:, np.newaxis])
+    probs[np.arange(2000), preds] += confidence
+    uncertainties = {'confidence': np.max(probs, axis=1),
+                     'entropy_of_expected': -np.sum(probs * np.log(probs), axis=1)}
+    separate, single = tmp_path / 'separate', tmp_path / 'single'
+    os.makedirs(separate), os.makedirs(single)
+
+    eval_misc_detect(labels, probs, uncertainties, save_path=str(separate), plotter=skip_plot)
+    classification_calibration(labels, probs, save_path=str(separate), plotter=skip_plot)
+    eval_rejection_ratio_class(labels, probs, uncertainties, save_path=str(separate),
+                               plotter=skip_plot)
+    report = eval_in_domain(labels, probs, uncertainties, save_path=str(single),
+                            plotter=skip_plot)
+
+    with open(separate / 'results.txt') as f:
+        expected = f.readlines()
+    with open(single / 'results.txt') as f:
+        lines = f.readlines()
+    assert lines[2:] == expected
+    with open(single / 'results.json') as f:
+        assert json.load(f) == report
+    np.testing.assert_allclose(np.loadtxt(single / 'confidence_fpr.txt'),
+                               np.loadtxt(separate / 'confidence_fpr.txt'))
+
+
+def test_grouped_metrics_match_per_group(ood_scores):
+    domain_labels, scores = ood_scores
+    groups = np.random.RandomState(2).randint(0, 7, size=5000)
+    for row in scores:
+        aurocs = grouped_auroc(domain_labels, row, groups)
+        ood_aurocs = grouped_ood_auroc(domain_labels, row, groups)
+        for g in range(7):
+            in_group = groups == g
+            assert np.isclose(aurocs[g], roc_auc_score(domain_labels[in_group], row[in_group]))
+            selected = np.logical_or(domain_labels == 0, in_group)
+            assert np.isclose(ood_aurocs[g], roc_auc_score(domain_labels[selected], row[selected]))
+
+    labels, preds, confidence = make_classification(3000)
+    probs = np.full([3000, 10], 0.0)
+    probs[np.arange(3000), preds] = confidence
+    probs += (1.0 - confidence[:, np.newaxis]) / 10.0
+    metrics = grouped_classification_metrics(labels, probs, {'confidence': confidence})
+    for c in range(10):
+        in_class = labels == c
+        assert metrics['count'][c] == np.sum(in_class)
+        assert np.isclose(metrics['error'][c], np.mean(preds[in_class] != c))
+        assert np.isclose(metrics['ECE'][c], loop_calibration(labels[in_class], probs[in_class],
+                                                              bins=10)[0])
+        assert np.isclose(metrics['misclassification_AUROC']['confidence'][c],
+                          roc_auc_score(preds[in_class] != c, -confidence[in_class]))
+
+
+def test_eval_grouped_ood_detect_negative_labels(ood_scores, tmp_path):
+    domain_labels, scores = ood_scores
+    n_in = int(np.sum(domain_labels == 0))
+    in_scores, out_scores = scores[0][:n_in], scores[0][n_in:]
+    # Unlabelled OOD data have label -1
+    ood_labels = np.random.RandomState(5).choice([-1, 2, 7], size=out_scores.shape[0])
+    results = eval_grouped_ood_detect(np.r_[np.zeros(n_in), np.ones(out_scores.shape[0])],
+                                      {'EPKL': in_scores}, {'EPKL': out_scores},
+                                      ood_labels, save_path=str(tmp_path))
+
+    assert results['group'] == [-1, 2, 7]
+    with open(os.path.join(tmp_path, 'results_per_class.json')) as f:
+        assert json.load(f) == results
+    for i, value in enumerate(results['group']):
+        selected = ood_labels == value
+        assert results['count'][i] == np.sum(selected)
+        expected = roc_auc_score(np.r_[np.zeros(n_in), np.ones(np.sum(selected))],
+                                 np.r_[in_scores, out_scores[selected]])
+        assert np.isclose(results['AUROC']['EPKL'][i], expected)
+
+
+@pytest.mark.benchmark
+def test_grouped_metrics_benchmark():
+    rng = np.random.RandomState(0)
+    labels = rng.randint(0, 100, size=1000000)
+    scores = rng.rand(1000000)
+    wrong = rng.rand(1000000) < scores
+
+    start = time.time()
+    grouped_auroc(wrong, scores, labels)
+    print(f"Grouped AUROC, 100 groups, 1000000 examples: {time.time() - start:.3f}s")
+
+
+def test_adversarial_detection_metrics(ood_scores):
+    domain_labels, scores = ood_scores
+    class_flipped = np.random.RandomState(3).rand(5000) < 0.7
+    successful = np.logical_and(domain_labels == 1, class_flipped)
+    keep = np.logical_or(domain_labels == 0, successful)
+    metrics, curves = adversarial_detection_metrics(domain_labels, scores, class_flipped,
+                                                    return_curves=True)
+
+    # Failed attacks are detected at every threshold
+    failed = 1.0 - np.sum(successful) / 2000.0
+    np.testing.assert_allclose(metrics['success_rate'], 1.0 - failed)
+    for i, row in enumerate(scores):
+        expected = failed + (1.0 - failed) * roc_auc_score(domain_labels[keep], row[keep])
+        assert np.isclose(metrics['AUROC'][i], expected)
+        assert np.isclose(auc(curves[i]['fpr'], curves[i]['tpr']), expected)
+        np.testing.assert_allclose(curves[i]['tpr'][[0, -1]], [failed, 1.0])
+
+    # All attacks successful: the usual AUROC
+    auroc, fpr, tpr = mod_roc_curve(domain_labels, -scores[0], np.ones(5000), pos_label=0)
+    assert np.isclose(auroc, roc_auc_score(domain_labels, scores[0]))
+
+
+def test_predictions_flipped_uses_natural_predictions():
+    labels = np.array([0, 1, 2, 0])
+    natural_probs = np.array([[0.8, 0.1, 0.1],
+                              [0.6, 0.3, 0.1],
+                              [0.1, 0.2, 0.7],
+                              [0.2, 0.7, 0.1]])
+    adversarial_probs = np.array([[0.1, 0.8, 0.1],
+                                  [0.7, 0.2, 0.1],
+                                  [0.1, 0.1, 0.8],
+                                  [0.1, 0.1, 0.8]])
+
+    # The second input is misclassified before the attack, which leaves its prediction unchanged
+    flipped = predictions_flipped(natural_probs, adversarial_probs)
+    np.testing.assert_array_equal(flipped, [True, False, False, True])
+    assert not np.array_equal(flipped, labels != np.argmax(adversarial_probs, axis=1))
+    np.testing.assert_array_equal(predictions_flipped(np.log(natural_probs), adversarial_probs),
+                                  flipped)
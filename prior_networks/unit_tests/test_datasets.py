@@ -0,0 +1,247 @@
+import context
+import os
+import pickle
+import shutil
+import struct
+import time
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torch.utils.data import TensorDataset
+
+from prior_networks.datasets.image import MNIST, TinyImageNetConverse, TinyImageNetConverseS1, \
+    construct_transforms
+from prior_networks.datasets.image.tensor_transforms import construct_tensor_transforms, \
+    BatchAugmentation
+from prior_networks.datasets.image import standardised_datasets
+from prior_networks.datasets.image.packed import pack_images, PackedImages
+from prior_networks.datasets.image.eval_cache import load_eval_dataset, CachedEvalDataset, \
+    build_eval_cache
+
+WNIDS = [f'n{i:08d}' for i in range(4)]
+
+
+@pytest.fixture
+def tim_ood_root(tmp_path):
+    """A TinyImageNet-OOD style directory of random 64x64 JPEGs"""
+    rng = np.random.RandomState(0)
+    root = tmp_path / 'tiny-imagenet-ood'
+    for split in ['train', 'val']:
+        for wnid in WNIDS:
+            os.makedirs(root / split / wnid / 'images')
+            for i in range(5):
+                image = rng.randint(0, 256, size=[64, 64, 3]).astype(np.uint8)
+                Image.fromarray(image).save(root / split / wnid / 'images' / f'{wnid}_{i}.JPEG')
+    with open(root / 'wnids.txt', 'w') as f:
+        f.writelines(wnid + '\n' for wnid in WNIDS)
+    with open(root / 'wnids_0.txt', 'w') as f:
+        f.writelines(wnid + '\n' for wnid in WNIDS[:2])
+    return tmp_path
+
+
+@pytest.fixture
+def mnist_root(tmp_path):
+    """Raw MNIST files of random images"""
+    rng = np.random.RandomState(0)
+    raw = tmp_path / 'MNIST' / 'raw'
+    os.makedirs(raw)
+    for prefix, n_images in [('train', 30), ('t10k', 10)]:
+        with open(raw / f'{prefix}-images-idx3-ubyte', 'wb') as f:
+            f.write(struct.pack('>IIII', 2051, n_images, 28, 28))
+            f.write(rng.randint(0, 256, size=[n_images, 28, 28]).astype(np.uint8).tobytes())
+        with open(raw / f'{prefix}-labels-idx1-ubyte', 'wb') as f:
+            f.write(struct.pack('>II', 2049, n_images))
+            f.write(rng.randint(0, 10, size=[n_images]).astype(np.uint8).tobytes())
+    return tmp_path
+
+
+def replace_image(path):
+    """Replaces the image at path with a black one and moves the mtime of its directory on"""
+    Image.fromarray(np.zeros([64, 64, 3], dtype=np.uint8)).save(path + '.new', format='JPEG')
+    os.replace(path + '.new', path)
+    stat = os.stat(os.path.dirname(path))
+    os.utime(os.path.dirname(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_packed_images_match_files(tim_ood_root, monkeypatch):
+    transform = construct_transforms(n_in=32, mode='eval')
+    files = TinyImageNetConverse(str(tim_ood_root), transform, None, split='train')
+    assert files.packed is None
+
+    pack_images(files.root, 'train', files.samples, files.watched, n_workers=2)
+    for dataset_class in [TinyImageNetConverse, TinyImageNetConverseS1]:
+        packed = dataset_class(str(tim_ood_root), transform, None, split='train')
+        assert packed.packed is not None
+        unpacked = dataset_class(str(tim_ood_root), transform, None, split='train',
+                                 loader=lambda path: Image.open(path).convert('RGB'))
+        assert unpacked.packed is None
+        for i in range(len(packed)):
+            assert torch.equal(packed[i][0], unpacked[i][0]) and packed[i][1] == unpacked[i][1]
+
+    # Stores are validated by the watched directories, without a stat of every image
+    stat, stats = os.stat, []
+    monkeypatch.setattr(os, 'stat', lambda path, *args, **kwargs: stats.append(path)
+                        or stat(path, *args, **kwargs))
+    assert PackedImages.load(files.root, 'train', files.samples, files.watched) is not None
+    assert not set(map(str, stats)) & set(path for path, _ in files.samples)
+    monkeypatch.undo()
+
+    # Workers receive the path of the store, not the mapped images
+    assert pickle.loads(pickle.dumps(packed.packed))._images is None
+    # Splits which were not packed are read from files
+    assert TinyImageNetConverse(str(tim_ood_root), transform, None, split='val').packed is None
+
+    # A store is not used once any of its images is replaced, which changes its directory
+    replace_image(files.samples[3][0])
+    assert TinyImageNetConverse(str(tim_ood_root), transform, None, split='train').packed is None
+    assert not any(name.endswith('.tmp') for name in os.listdir(os.path.join(files.root, 'packed')))
+
+
+@pytest.mark.benchmark
+def test_packed_images_benchmark(tim_ood_root):
+    files = TinyImageNetConverse(str(tim_ood_root), None, None, split='train')
+    pack_images(files.root, 'train', files.samples, files.watched, n_workers=1)
+    packed = PackedImages.load(files.root, 'train', files.samples, files.watched)
+
+    for name, read in [('files', lambda i: files.loader(files.samples[i][0])),
+                       ('packed', lambda i: packed[i])]:
+        start = time.time()
+        for _ in range(50):
+            for i in range(len(files)):
+                read(i)
+        print(f"Reading 64x64 images from {name}: "
+              f"{(time.time() - start) / (50 * len(files)) * 1e6:.1f}us per image")
+
+
+def test_eval_cache_matches_transforms(tim_ood_root, tmp_path):
+    mean, std = TinyImageNetConverse.mean, TinyImageNetConverse.std
+    transformed = load_eval_dataset('TIM-OOD', data_path=str(tim_ood_root), n_in=32, mean=mean,
+                                    std=std, split='val')
+    cache_dir = str(tmp_path / 'cache')
+    cached = load_eval_dataset('TIM-OOD', data_path=str(tim_ood_root), n_in=32, mean=mean,
+                               std=std, split='val', cache_dir=cache_dir, num_workers=0)
+    assert isinstance(cached, CachedEvalDataset) and len(cached) == len(transformed)
+    for i in range(len(cached)):
+        assert torch.equal(cached[i][0], transformed[i][0])
+        assert cached[i][1] == transformed[i][1]
+
+    # A second run reads the cache, whatever the normalisation
+    assert len(os.listdir(cache_dir)) == 2
+    cached = load_eval_dataset('TIM-OOD', data_path=str(tim_ood_root), n_in=32,
+                               mean=(0.0, 0.0, 0.0), std=(1.0, 1.0, 1.0), split='val',
+                               cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    assert torch.all(cached[0][0] >= 0.0) and torch.all(cached[0][0] <= 1.0)
+
+    # Copies of the data in other directories have their own caches
+    shutil.copytree(tim_ood_root / 'tiny-imagenet-ood', tmp_path / 'copy' / 'tiny-imagenet-ood')
+    load_eval_dataset('TIM-OOD', data_path=str(tmp_path / 'copy'), n_in=32, mean=mean, std=std,
+                      split='val', cache_dir=cache_dir, num_workers=0)
+    assert len(os.listdir(cache_dir)) == 4
+
+    # Caches are rebuilt once an image is replaced
+    replace_image(transformed.samples[0][0])
+    cached = load_eval_dataset('TIM-OOD', data_path=str(tim_ood_root), n_in=32, mean=mean,
+                               std=std, split='val', cache_dir=cache_dir, num_workers=0)
+    assert len(os.listdir(cache_dir)) == 6
+    transformed = load_eval_dataset('TIM-OOD', data_path=str(tim_ood_root), n_in=32, mean=mean,
+                                    std=std, split='val')
+    assert torch.equal(cached[0][0], transformed[0][0])
+
+    with pytest.raises(ValueError, match='empty dataset'):
+        build_eval_cache(TensorDataset(torch.zeros(0, 3, 8, 8), torch.zeros(0)),
+                         os.path.join(cache_dir, 'empty.images.npy'),
+                         os.path.join(cache_dir, 'empty.targets.npy'), num_workers=0)
+
+
+@pytest.mark.parametrize('mode, augment', [('eval', False), ('train', True), ('ood', True)])
+def test_tensor_transforms_match_pil(mnist_root, mode, augment):
+    kwargs = dict(n_in=28, mode=mode, mean=(0.5,), std=(0.25,), augment=augment)
+    pil = MNIST(str(mnist_root), construct_transforms(**kwargs), None, False, split='train')
+    tensor = MNIST(str(mnist_root), construct_tensor_transforms(**kwargs), None, False,
+                   split='train')
+    assert pil.tensor_images is None and tensor.tensor_images.shape == (30, 1, 28, 28)
+    for i in range(len(pil)):
+        # The random transforms draw the same random numbers from either input
+        torch.manual_seed(i)
+        pil_image, pil_target = pil[i]
+        torch.manual_seed(i)
+        tensor_image, tensor_target = tensor[i]
+        assert torch.allclose(pil_image, tensor_image) and pil_target == tensor_target
+
+
+def test_batch_augmentation_crops_and_flips():
+    torch.manual_seed(0)
+    images = torch.randint(0, 256, [16, 3, 8, 8], dtype=torch.uint8)
+    batch = [(image, i) for i, image in enumerate(images)]
+    augmented, targets = BatchAugmentation(8, 'ood', augment=True)(batch)
+    assert augmented.shape == (16, 3, 8, 8) and torch.equal(targets, torch.arange(16))
+
+    # Every image is a crop of the reflection padded image, flipped or not
+    padded = torch.nn.functional.pad(images.float(), [4, 4, 4, 4], mode='reflect') / 255
+    for image, original in zip(augmented, padded):
+        crops = [crop for top in range(9) for left in range(9)
+                 for crop in [original[:, top:top + 8, left:left + 8]]]
+        crops = [flipped for crop in crops
+                 for flipped in [crop, crop.flip(1), crop.flip(2), crop.flip(1).flip(2)]]
+        assert any(torch.equal(image, crop) for crop in crops)
+
+    # Without augmentation, batches match the per-item transforms
+    transforms = construct_tensor_transforms(8, 'train', mean=(0.5, 0.4, 0.3), std=(0.2, 0.3, 0.4))
+    batched = construct_tensor_transforms(8, 'train', mean=(0.5, 0.4, 0.3), std=(0.2, 0.3, 0.4),
+                                          batched=True)
+    collated, _ = batched.collate([(batched(image), 0) for image in images])
+    assert torch.allclose(collated, torch.stack([transforms(image) for image in images]))
+
+
+def test_batch_augmentation_non_square_images():
+    torch.manual_seed(0)
+    transforms = construct_tensor_transforms(8, 'train', augment=True, rotation=True, jitter=0.2,
+                                             batched=True)
+    images = [torch.randint(0, 256, [3, 12, 20], dtype=torch.uint8),
+              torch.randint(0, 256, [3, 16, 10], dtype=torch.uint8)]
+    augmented, _ = transforms.collate([(transforms(image), 0) for image in images])
+    assert augmented.shape == (2, 3, 8, 8)
+
+    with pytest.raises(AssertionError, match='same shape'):
+        BatchAugmentation(8, 'train', augment=True)([(image, 0) for image in images])
+
+
+def test_batch_augmentation_jitter_and_rotation():
+    torch.manual_seed(0)
+    images = torch.randint(0, 256, [64, 3, 32, 32], dtype=torch.uint8)
+    augmentation = BatchAugmentation(32, 'train', augment=True, rotation=True, jitter=0.4)
+    augmented, _ = augmentation([(image, 0) for image in images])
+    assert augmented.shape == (64, 3, 32, 32)
+    assert torch.all(augmented >= 0.0) and torch.all(augmented <= 1.0)
+
+    # Without jitter parameters, hue is unchanged by the conversion to and from HSV
+    augmentation.jitter = 1e-9
+    jittered = augmentation._colour_jitter(images.float() / 255)
+    assert torch.allclose(jittered, images.float() / 255, atol=1e-5)
+
+
+def test_manifest_matches_listing(tim_ood_root, monkeypatch):
+    dataset = TinyImageNetConverse(str(tim_ood_root), None, None, split='train')
+    listed = standardised_datasets.make_dataset_TIM(os.path.join(dataset.root, 'train'),
+                                                    dataset.class_to_idx, dataset.extensions)
+    assert dataset.samples == listed
+
+    # Later constructions read the manifest of their classes instead of listing directories
+    make_dataset = standardised_datasets.make_dataset_TIM
+    monkeypatch.setattr(standardised_datasets, 'make_dataset_TIM', None)
+    assert TinyImageNetConverse(str(tim_ood_root), None, None, split='train').samples == listed
+    with pytest.raises(TypeError):
+        TinyImageNetConverseS1(str(tim_ood_root), None, None, split='train')
+    monkeypatch.setattr(standardised_datasets, 'make_dataset_TIM', make_dataset)
+    subset = TinyImageNetConverseS1(str(tim_ood_root), None, None, split='train').samples
+    assert len(subset) == 10
+
+    # Adding an image to a class directory invalidates the manifest
+    image = np.zeros([64, 64, 3], dtype=np.uint8)
+    new_path = os.path.join(dataset.root, 'train', WNIDS[3], 'images', f'{WNIDS[3]}_new.JPEG')
+    Image.fromarray(image).save(new_path)
+    samples = TinyImageNetConverse(str(tim_ood_root), None, None, split='train').samples
+    assert len(samples) == 21 and (new_path, 3) in samples
@@ -0,0 +1,30 @@
+import context
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'sklearn', 'scipy', 'torchvision']
+
+IMPORT_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {unit_tests!r})
+{imports}
+print(','.join(module for module in {heavy!r} if module in sys.modules))
+"""
+
+
+@pytest.mark.parametrize('imports', [
+    'import prior_networks.assessment.ood_detection, prior_networks.assessment.misc_detection, '
+    'prior_networks.assessment.calibration, prior_networks.assessment.rejection',
+    'from prior_networks.util_pytorch import DATASET_DICT',
+    'from prior_networks.models.model_factory import ModelFactory'])
+def test_imports_skip_heavy_modules(imports):
+    script = IMPORT_SCRIPT.format(root=ROOT, unit_tests=os.path.dirname(__file__),
+                                  imports=imports, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', script], check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout.split('\n')
+    assert output[0] == ''
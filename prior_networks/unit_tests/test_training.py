@@ -12,6 +12,7 @@ from prior_networks.training import Trainer
 from prior_networks.priornet.training import TrainerWithOOD
 from prior_networks.priornet.dpn_losses import PriorNetMixedLoss, \
     DirichletKLLoss
+from prior_networks.datasets.sampling import BalancedPairSampler
 
 
 class ToyNet(nn.Module):
@@ -32,9 +33,9 @@ def new_model():
     return net
 
 
-def make_dataset():
-    input_data = np.random.randn(100, 3)
-    targets = np.random.randint(0, 20, [100])
+def make_dataset(n_examples=100):
+    input_data = np.random.randn(n_examples, 3)
+    targets = np.random.randint(0, 20, [n_examples])
     input_data, targets = map(lambda data: torch.Tensor(data),
                               (input_data, targets))
     targets = targets.long()
@@ -89,3 +90,83 @@ def test_trainer_with_ood(new_trainer_with_ood):
     trainer: Trainer = new_trainer_with_ood
     trainer.train(n_epochs=2)
     trainer.test()
+
+
+def test_balanced_pair_sampler():
+    sampler = BalancedPairSampler(n_id=30, n_ood=70, epoch_length=40, ood_ratio=2)
+    epochs = [sampler.indices(epoch) for epoch in range(7)]
+    assert all(id_indices.shape == (40,) and ood_indices.shape == (80,)
+               for id_indices, ood_indices in epochs)
+
+    # Every dataset is read in whole shuffles, each a different permutation
+    id_stream = np.concatenate([id_indices for id_indices, _ in epochs])
+    ood_stream = np.concatenate([ood_indices for _, ood_indices in epochs])
+    for stream, n_items in [(id_stream, 30), (ood_stream, 70)]:
+        shuffles = stream[:n_items * (stream.shape[0] // n_items)].reshape(-1, n_items)
+        assert all(np.array_equal(np.sort(shuffle), np.arange(n_items)) for shuffle in shuffles)
+        assert not np.array_equal(shuffles[0], shuffles[1])
+
+    # Epochs are reproducible, and batches read the epoch set on the pair sampler
+    sampler.set_epoch(3)
+    batches = list(sampler.batch_sampler(16))
+    assert len(batches) == len(sampler.batch_sampler(16)) == 3 and len(batches[-1]) == 8
+    id_indices, ood_indices = BalancedPairSampler(30, 70, 40, 2).indices(3)
+    assert [pair for batch in batches for pair in batch] == \
+        list(zip(id_indices.tolist(), map(tuple, ood_indices.reshape(-1, 2).tolist())))
+
+
+def test_trainer_with_ood_unequal_datasets(new_model):
+    id_criterion = DirichletKLLoss(target_concentration=1e2)
+    ood_criterion = DirichletKLLoss(target_concentration=0.0)
+    criterion = PriorNetMixedLoss([id_criterion, ood_criterion], [1., 1.])
+    trainer = TrainerWithOOD(new_model, criterion, id_criterion, ood_criterion,
+                             train_dataset=make_dataset(100),
+                             ood_dataset=make_dataset(35),
+                             test_dataset=make_dataset(20),
+                             test_ood_dataset=make_dataset(20),
+                             optimizer=optim.SGD,
+                             scheduler=optim.lr_scheduler.MultiStepLR,
+                             optimizer_params={'lr': 1e-3},
+                             scheduler_params={'milestones': [1]},
+                             batch_size=10, num_workers=0, ood_ratio=2)
+    # An epoch is one pass over the in-domain data, and the LR milestone is in epochs
+    assert len(trainer.trainloader) == 10
+    inputs, labels, ood_inputs = next(iter(trainer.trainloader))
+    assert inputs.shape == (10, 3) and labels.shape == (10,) and ood_inputs.shape == (20, 3)
+    cat_inputs = trainer._interleave(inputs, ood_inputs)
+    assert torch.equal(cat_inputs[0::3], inputs)
+    assert torch.equal(cat_inputs[1::3], ood_inputs[0::2])
+    assert torch.equal(cat_inputs[2::3], ood_inputs[1::2])
+    trainer.train(n_epochs=2)
+    assert trainer.steps == 20
+    assert trainer.optimizer.param_groups[0]['lr'] == pytest.approx(1e-4)
+
+
+def test_trainer_with_ood_sampler_seed_in_checkpoint(new_model, tmp_path):
+    def make_trainer(seed):
+        criterion = DirichletKLLoss(target_concentration=1e2)
+        return TrainerWithOOD(new_model, criterion, criterion, criterion,
+                              train_dataset=make_dataset(30),
+                              ood_dataset=make_dataset(70),
+                              test_dataset=make_dataset(10),
+                              test_ood_dataset=make_dataset(10),
+                              optimizer=optim.SGD,
+                              scheduler=optim.lr_scheduler.MultiStepLR,
+                              optimizer_params={'lr': 1e-3},
+                              scheduler_params={'milestones': [1]},
+                              batch_size=10, num_workers=0, checkpoint_path=str(tmp_path),
+                              seed=seed)
+
+    # The seed of the shuffles follows the torch seed unless given
+    torch.manual_seed(5)
+    trainer = make_trainer(seed=None)
+    assert trainer.pair_sampler.seed == 5
+    assert make_trainer(seed=7).pair_sampler.seed == 7
+
+    # A resumed trainer continues the same shuffles whatever its own seed
+    trainer._save_checkpoint()
+    resumed = make_trainer(seed=7)
+    resumed.load_checkpoint()
+    assert resumed.pair_sampler.seed == 5
+    for expected, indices in zip(trainer.pair_sampler.indices(2), resumed.pair_sampler.indices(2)):
+        np.testing.assert_array_equal(indices, expected)
@@ -0,0 +1,256 @@
+import context
+import time
+import pytest
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import TensorDataset
+
+from prior_networks.ensembles.uncertainties import ensemble_uncertainties, \
+    ensemble_uncertainties_torch
+from prior_networks.ensembles.dirichlet import fit_dirichlet
+from prior_networks.ensembles.mc_dropout import MCDropoutSampler
+from prior_networks.evaluation import eval_ensemble_on_dataset
+from prior_networks.priornet.dpn import PriorNet, dirichlet_prior_network_uncertainty, \
+    topk_dirichlet_prior_network_uncertainty
+from prior_networks.priornet.nwpn import NormalInverseWishartPriorNet, niwpn_uncertainty, \
+    niwpn_uncertainty_torch
+
+
+@pytest.fixture
+def ensemble_logits():
+    torch.manual_seed(0)
+    return 3.0 * torch.randn(64, 5, 10, dtype=torch.float64)
+
+
+def test_ensemble_uncertainties_torch_matches_numpy(ensemble_logits):
+    probs = F.softmax(ensemble_logits, dim=2).numpy()
+    expected = ensemble_uncertainties(probs, epsilon=1e-10)
+    uncertainties = ensemble_uncertainties_torch(ensemble_logits)
+
+    assert set(uncertainties.keys()) == set(expected.keys())
+    # The numpy implementation smooths log-probabilities with epsilon, the torch one is exact
+    for key in expected.keys():
+        np.testing.assert_allclose(uncertainties[key].numpy(), expected[key],
+                                   rtol=1e-4, atol=1e-6)
+
+
+def test_eval_ensemble_on_dataset_matches_full_evaluation():
+    torch.manual_seed(0)
+    models = [nn.Linear(3, 4) for _ in range(3)]
+    inputs = torch.randn(50, 3)
+    dataset = TensorDataset(inputs, torch.randint(0, 4, [50]))
+
+    probs, labels, uncertainties = eval_ensemble_on_dataset(models, dataset, batch_size=8,
+                                                            num_workers=0)
+
+    with torch.no_grad():
+        logits = torch.stack([model(inputs) for model in models], dim=1)
+    expected = ensemble_uncertainties_torch(logits)
+
+    assert probs.size() == torch.Size([50, 4])
+    assert torch.equal(labels, dataset.tensors[1])
+    for key in expected.keys():
+        assert torch.allclose(uncertainties[key], expected[key], atol=1e-6)
+
+
+def test_fit_dirichlet_recovers_concentrations():
+    rng = np.random.RandomState(0)
+    true_alphas = np.array([[1.0, 2.0, 3.0, 4.0],
+                            [20.0, 5.0, 1.0, 0.5],
+                            [0.3, 0.3, 0.3, 0.3]])
+    probs = np.stack([rng.dirichlet(alphas, size=5000) for alphas in true_alphas], axis=0)
+
+    alphas = fit_dirichlet(probs, n_iter=5)
+    np.testing.assert_allclose(alphas, true_alphas, rtol=0.1)
+
+
+def test_fit_dirichlet_identical_members():
+    probs = np.tile(np.array([[[0.7, 0.2, 0.1]]]), (2, 5, 1))
+    alphas = fit_dirichlet(probs, max_precision=1e4)
+
+    assert np.all(np.isfinite(alphas))
+    np.testing.assert_allclose(np.sum(alphas, axis=1), 1e4)
+    np.testing.assert_allclose(alphas / np.sum(alphas, axis=1, keepdims=True), probs[:, 0], rtol=1e-6)
+
+
+class DropoutNet(nn.Module):
+    def __init__(self, dropout_rate=0.3):
+        super().__init__()
+        self.features = nn.Sequential(nn.Conv2d(3, 32, kernel_size=3, padding=1),
+                                      nn.BatchNorm2d(32), nn.ReLU(),
+                                      nn.Dropout(p=dropout_rate),
+                                      nn.Conv2d(32, 32, kernel_size=3, padding=1),
+                                      nn.BatchNorm2d(32), nn.ReLU(),
+                                      nn.AdaptiveAvgPool2d(1))
+        self.classifier = nn.Sequential(nn.Dropout(p=dropout_rate), nn.Linear(32, 10))
+
+    def forward(self, x):
+        return self.classifier(torch.flatten(self.features(x), 1))
+
+
+def test_mc_dropout_sampler_keeps_batchnorm_in_eval():
+    torch.manual_seed(0)
+    model = DropoutNet()
+    model.train()
+    running_mean = model.features[1].running_mean.clone()
+    x = torch.randn(4, 3, 8, 8)
+
+    with torch.no_grad():
+        logits = MCDropoutSampler(model, n_samples=6, max_batch_size=10)(x)
+
+    assert logits.size() == torch.Size([4, 6, 10])
+    assert torch.equal(model.features[1].running_mean, running_mean)
+    assert model.training and model.features[3].training
+    # Passes differ from each other, but not from a deterministic model without dropout
+    assert not torch.allclose(logits[:, 0], logits[:, 1])
+
+    model = DropoutNet(dropout_rate=0.0)
+    model.eval()
+    with torch.no_grad():
+        logits = MCDropoutSampler(model, n_samples=3)(x)
+        assert torch.allclose(logits, model(x).unsqueeze(1).expand(-1, 3, -1), atol=1e-6)
+        probs, uncertainties = MCDropoutSampler(model, n_samples=3).uncertainties(x)
+        assert torch.allclose(probs, F.softmax(model(x), dim=1), atol=1e-6)
+        assert all(value.size() == torch.Size([4]) for value in uncertainties.values())
+
+
+@pytest.mark.benchmark
+def test_mc_dropout_sampler_benchmark():
+    torch.manual_seed(0)
+    model = DropoutNet()
+    x = torch.randn(64, 3, 32, 32)
+    n_samples = 20
+    sampler = MCDropoutSampler(model, n_samples=n_samples)
+
+    with torch.no_grad():
+        sampler(x)
+        start = time.time()
+        probs, uncertainties = sampler.uncertainties(x)
+        tiled_time = time.time() - start
+
+        model.eval()
+        model.classifier[0].train()
+        model.features[3].train()
+        start = time.time()
+        logits = torch.stack([model(x) for _ in range(n_samples)], dim=1)
+        ensemble_uncertainties_torch(logits)
+        loop_time = time.time() - start
+
+    print(f"MC dropout, {n_samples} samples of {x.size()[0]} images: "
+          f"tiled {x.size()[0] * n_samples / tiled_time:.0f} img/s, "
+          f"loop {x.size()[0] * n_samples / loop_time:.0f} img/s")
+    assert probs.size() == torch.Size([64, 10])
+    assert all(value.size() == torch.Size([64]) for value in uncertainties.values())
+
+
+@pytest.fixture
+def peaked_logits():
+    rng = np.random.RandomState(0)
+    logits = rng.randn(200, 500) - 3.0
+    logits[:, :5] += 10.0 * rng.rand(200, 5)
+    return logits
+
+
+def test_topk_dirichlet_uncertainty_within_bounds(peaked_logits):
+    expected = dirichlet_prior_network_uncertainty(peaked_logits)
+    uncertainties, error_bounds = topk_dirichlet_prior_network_uncertainty(peaked_logits, top_k=10)
+
+    for key in expected.keys():
+        assert uncertainties[key].shape == expected[key].shape
+        assert np.all(np.abs(uncertainties[key] - expected[key]) <= error_bounds[key] + 1e-8)
+
+
+def test_topk_dirichlet_uncertainty_exact_fallback(peaked_logits):
+    expected = dirichlet_prior_network_uncertainty(peaked_logits)
+    uncertainties = dirichlet_prior_network_uncertainty(peaked_logits, top_k=500)
+    for key in expected.keys():
+        np.testing.assert_array_equal(uncertainties[key], expected[key])
+
+
+def test_topk_uncertainty_metrics_torch_matches_numpy(peaked_logits):
+    expected, expected_bounds = topk_dirichlet_prior_network_uncertainty(peaked_logits, top_k=10)
+    uncertainties, error_bounds = PriorNet.topk_uncertainty_metrics(torch.tensor(peaked_logits),
+                                                                    top_k=10)
+    for key in expected.keys():
+        np.testing.assert_allclose(uncertainties[key].numpy(), expected[key], rtol=1e-6, atol=1e-6)
+        np.testing.assert_allclose(error_bounds[key].numpy(), expected_bounds[key], rtol=1e-6, atol=1e-6)
+
+
+def test_topk_uncertainty_confident_logits():
+    # The tail concentration is below the float32 resolution of alpha0
+    torch.manual_seed(0)
+    logits = torch.randn(4, 1000) - 8.0
+    logits[:, :3] += 25.0
+    expected = dirichlet_prior_network_uncertainty(logits.numpy())
+
+    numpy_results = topk_dirichlet_prior_network_uncertainty(logits.numpy(), top_k=10)
+    torch_results = [{key: value.numpy() for key, value in results.items()}
+                     for results in PriorNet.topk_uncertainty_metrics(logits, top_k=10)]
+    for uncertainties, error_bounds in [numpy_results, torch_results]:
+        for key in expected.keys():
+            assert np.all(np.isfinite(uncertainties[key])), key
+            assert np.all(np.abs(uncertainties[key] - expected[key])
+                          <= error_bounds[key] + 1e-4 * np.abs(expected[key]) + 1e-6), key
+
+
+def make_niw_params(n_examples, n_out):
+    torch.manual_seed(0)
+    pmean = torch.randn(n_examples, n_out, dtype=torch.float64)
+    pscatter = torch.exp(torch.randn(n_examples, n_out, dtype=torch.float64))
+    pmean_belief = torch.exp(torch.randn(n_examples, 1, dtype=torch.float64))
+    pscatter_belief = torch.exp(torch.randn(n_examples, 1, dtype=torch.float64)) + n_out + 2.0
+    return pmean, pscatter, pmean_belief, pscatter_belief
+
+
+def test_niwpn_uncertainty_torch_matches_numpy():
+    params = make_niw_params(32, 6)
+    expected = niwpn_uncertainty(*[param.numpy() for param in params])
+    uncertainties = niwpn_uncertainty_torch(*params)
+
+    assert set(uncertainties.keys()) == set(expected.keys())
+    for key in expected.keys():
+        np.testing.assert_allclose(uncertainties[key].numpy(), np.squeeze(expected[key], axis=1),
+                                   rtol=1e-10)
+
+
+def test_niwpn_methods():
+    model = NormalInverseWishartPriorNet(n_in=8, n_out=4)
+    x = torch.randn(16, 8)
+    with torch.no_grad():
+        uncertainties = model.uncertainty_metrics(x)
+        assert torch.allclose(model.mutual_information(x), uncertainties['mutual_information'])
+        assert torch.allclose(model.diffenrential_entropy(x), uncertainties['differential_entropy'])
+        assert torch.allclose(model.epkl(x), uncertainties['EPKL'])
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('n_out', [128, 1024])
+def test_niwpn_uncertainty_benchmark(n_out):
+    params = make_niw_params(2048, n_out)
+    np_params = [param.numpy() for param in params]
+
+    start = time.time()
+    expected = niwpn_uncertainty(*np_params)
+    np_time = time.time() - start
+
+    start = time.time()
+    uncertainties = niwpn_uncertainty_torch(*params)
+    torch_time = time.time() - start
+
+    print(f"NIW uncertainties, n_out={n_out}: numpy {np_time:.4f}s, torch {torch_time:.4f}s")
+    for key in expected.keys():
+        np.testing.assert_allclose(uncertainties[key].numpy(), np.squeeze(expected[key], axis=1),
+                                   rtol=1e-8)
+
+
+def test_dirichlet_uncertainty_measure_subset(peaked_logits):
+    expected = dirichlet_prior_network_uncertainty(peaked_logits)
+    uncertainties = dirichlet_prior_network_uncertainty(peaked_logits,
+                                                        measures=['mutual_information', 'EPKL'])
+
+    assert list(uncertainties.keys()) == ['mutual_information', 'EPKL']
+    for key in uncertainties.keys():
+        np.testing.assert_array_equal(uncertainties[key], expected[key])
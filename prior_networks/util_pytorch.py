@@ -1,5 +1,7 @@
+import importlib
 import os
 import re
+from collections.abc import Mapping
 from pathlib import Path
 from typing import Union
 # import context.py
@@ -9,25 +11,47 @@ import random
 
 from torch import optim
 
-from prior_networks.datasets import image
+
+class LazyDict(Mapping):
+    """Read-only dict of attributes of a module, which is only imported when a value is accessed.
+    Keys can be listed (e.g. as argparse choices) without the import."""
+
+    def __init__(self, module_name: str, attributes: dict):
+        """
+        :param module_name: name of the module holding the values
+        :param attributes: dict mapping keys to attribute names in the module
+        """
+        self.module_name = module_name
+        self.attributes = attributes
+
+    def __getitem__(self, key):
+        return getattr(importlib.import_module(self.module_name), self.attributes[key])
+
+    def __iter__(self):
+        return iter(self.attributes)
+
+    def __len__(self):
+        return len(self.attributes)
+
 
 # TODO Add LeNet for MNIST and MNIST-like stuff
 
-DATASET_DICT = {'MNIST': image.MNIST,
-                'KMNIST': image.KMNIST,
-                'FMNIST': image.FashionMNIST,
-                'EMNIST': image.EMNIST,
-                'SVHN': image.SVHN,
-                'CIFAR10': image.CIFAR10,
-                'CIFAR100': image.CIFAR100,
-                'LSUN': image.LSUN,
-                'TIM': image.TinyImageNet,
-                'TIM-OOD': image.TinyImageNetConverse,
-                'TIM-OOD-S1': image.TinyImageNetConverseS1,
-                'TIM-OOD-S2': image.TinyImageNetConverseS2,
-                'TIM-OOD-S3': image.TinyImageNetConverseS3,
-                'TIM-OOD-S4': image.TinyImageNetConverseS4,
-                'ImageNet': image.ImageNet}
+DATASET_DICT = LazyDict('prior_networks.datasets.image',
+                        {'MNIST': 'MNIST',
+                         'KMNIST': 'KMNIST',
+                         'FMNIST': 'FashionMNIST',
+                         'EMNIST': 'EMNIST',
+                         'SVHN': 'SVHN',
+                         'CIFAR10': 'CIFAR10',
+                         'CIFAR100': 'CIFAR100',
+                         'LSUN': 'LSUN',
+                         'TIM': 'TinyImageNet',
+                         'TIM-OOD': 'TinyImageNetConverse',
+                         'TIM-OOD-S1': 'TinyImageNetConverseS1',
+                         'TIM-OOD-S2': 'TinyImageNetConverseS2',
+                         'TIM-OOD-S3': 'TinyImageNetConverseS3',
+                         'TIM-OOD-S4': 'TinyImageNetConverseS4',
+                         'ImageNet': 'ImageNet'})
 
 
 def categorical_entropy(probs, axis=1, keepdims=False):